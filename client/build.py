@@ -64,6 +64,7 @@ args = [
     '--hidden-import=sqlite3',
     '--hidden-import=shared',
     '--hidden-import=shared.security',
+    '--hidden-import=shared.heatmap_codec',
 
     # --- 用户便利性：单文件模式 ---
     # 这会在 dist 目录下直接生成一个 .exe 文件
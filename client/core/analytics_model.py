@@ -0,0 +1,147 @@
+import datetime
+
+import numpy as np
+
+
+class DayCounts:
+    """
+    按日期序数存放的每日字数 (一段连续的日期，NumPy 数组)
+
+    热力图按年翻页：服务器每次返回一段 [from, to] 的逐日数组，merge() 并入后查询直接按下标取值。
+    相邻两页的区间相接或重叠，并入后仍是连续的一段；万一中间有空档，空档按 0 填充但不算已加载。
+    并入时重算一次前缀和，之后区间合计 O(1)，按周/月分桶、滑动平均、连续天数都是一次向量化运算，
+    在界面线程里算也不会卡。未加载的日期一律按 0 计。
+    """
+
+    def __init__(self):
+        self.first = None  # counts[0] 对应的日期序数
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.prefix = np.zeros(1, dtype=np.int64)  # prefix[i] = counts[:i] 的合计
+        self.loaded = []  # 已加载的 [起始序数, 结束序数] 区间
+
+    def loaded_range(self):
+        """已加载的最早、最晚日期；没有数据时为 None"""
+        if not self.loaded: return None
+        return datetime.date.fromordinal(self.loaded[0][0]), datetime.date.fromordinal(self.loaded[-1][1])
+
+    def covers(self, start, end):
+        lo, hi = start.toordinal(), end.toordinal()
+        return any(a <= lo and hi <= b for a, b in self.loaded)
+
+    def merge(self, start, counts):
+        """并入从 start 开始的逐日字数 (覆盖已有的同一天)"""
+        if not len(counts): return
+        counts = np.asarray(counts, dtype=np.int64)
+        lo = start.toordinal()
+        hi = lo + len(counts) - 1
+        if self.first is None:
+            self.first, self.counts = lo, counts.copy()
+        else:
+            first = min(self.first, lo)
+            last = max(self.first + len(self.counts) - 1, hi)
+            merged = np.zeros(last - first + 1, dtype=np.int64)
+            merged[self.first - first:self.first - first + len(self.counts)] = self.counts
+            merged[lo - first:hi - first + 1] = counts
+            self.first, self.counts = first, merged
+        self.prefix = np.concatenate(([0], np.cumsum(self.counts)))
+        self._mark_loaded(lo, hi)
+
+    def _mark_loaded(self, lo, hi):
+        spans = sorted(self.loaded + [[lo, hi]])
+        merged = [spans[0]]
+        for a, b in spans[1:]:
+            if a <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], b)
+            else:
+                merged.append([a, b])
+        self.loaded = merged
+
+    def _index(self, ordinals):
+        """日期序数 -> 前缀和下标 (截断到已有范围)"""
+        base = self.first if self.first is not None else 0
+        return np.clip(np.asarray(ordinals) - base, 0, len(self.counts))
+
+    def get(self, ordinal):
+        if self.first is None: return 0
+        i = ordinal - self.first
+        return int(self.counts[i]) if 0 <= i < len(self.counts) else 0
+
+    def window(self, start, days):
+        """从 start 起 days 天的字数数组"""
+        out = np.zeros(days, dtype=np.int64)
+        if self.first is None: return out
+        lo = start.toordinal() - self.first
+        a, b = max(lo, 0), min(lo + days, len(self.counts))
+        if a < b:
+            out[a - lo:b - lo] = self.counts[a:b]
+        return out
+
+    def range_sum(self, start, end):
+        """[start, end] 的字数合计，O(1)"""
+        a, b = self._index([start.toordinal(), end.toordinal() + 1])
+        return int(self.prefix[b] - self.prefix[a])
+
+    def buckets(self, start, end, granularity):
+        """
+        [start, end] 按 week (周一起) / month 分桶：(桶起始日列表, 合计数组)
+        首尾的桶只计范围内的天
+        """
+        if granularity == "week":
+            first = start - datetime.timedelta(days=start.weekday())
+            starts = [first + datetime.timedelta(days=7 * i) for i in range((end - first).days // 7 + 1)]
+        else:
+            months = (end.year - start.year) * 12 + end.month - start.month + 1
+            starts = [datetime.date(start.year + (start.month - 1 + i) // 12, (start.month - 1 + i) % 12 + 1, 1)
+                      for i in range(months)]
+        edges = [max(s, start).toordinal() for s in starts] + [end.toordinal() + 1]
+        sums = np.diff(self.prefix[self._index(edges)])
+        return starts, sums
+
+    def rolling_average(self, end, window, days):
+        """截止 end 的最近 days 天里，每天往前 window 天 (含当天) 的日均字数"""
+        last = np.arange(end.toordinal() - days + 1, end.toordinal() + 1)
+        totals = self.prefix[self._index(last + 1)] - self.prefix[self._index(last + 1 - window)]
+        return totals / window
+
+    def streaks(self, today):
+        """
+        (最长连续天数, 当前连续天数)：写了字 (>0) 的日子连在一起算一段
+        今天还没写时，截止到昨天的连续仍算当前连续
+        """
+        if self.first is None: return 0, 0
+        active = np.concatenate(([False], self.counts > 0, [False]))
+        edges = np.flatnonzero(np.diff(active.astype(np.int8)))
+        starts, ends = edges[::2], edges[1::2]  # 每段 [start, end) 的下标
+        if not len(starts): return 0, 0
+        longest = int((ends - starts).max())
+        t = today.toordinal() - self.first
+        current = 0
+        for tail in (t + 1, t):  # 以今天或昨天结尾的那一段
+            hit = np.flatnonzero(ends == tail)
+            if len(hit):
+                current = int(ends[hit[0]] - starts[hit[0]])
+                break
+        return longest, current
+
+    def best_day(self):
+        """(日期, 字数)；没有数据时为 (None, 0)"""
+        if not len(self.counts) or self.counts.max() <= 0: return None, 0
+        i = int(self.counts.argmax())
+        return datetime.date.fromordinal(self.first + i), int(self.counts[i])
+
+    def summary(self, today):
+        """
+        仪表盘用的统计 (基于已加载的日期)
+        最长连续与最佳单日只看已加载的年份：往前翻页后可能变大，跨过加载边界的连续也会被截断
+        """
+        longest, current = self.streaks(today)
+        best, best_words = self.best_day()
+        return {
+            "current_streak": current,
+            "longest_streak": longest,
+            "avg_7": float(self.rolling_average(today, 7, 1)[0]),
+            "avg_30": float(self.rolling_average(today, 30, 1)[0]),
+            "best_day": best,
+            "best_words": best_words,
+            "last_30_total": self.range_sum(today - datetime.timedelta(days=29), today),
+        }
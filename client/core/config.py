@@ -9,6 +9,10 @@ DEFAULT_CONFIG = {
     "font_family": "Microsoft YaHei",
     "theme_accent": "#9DC88D",
     "theme_history": ["#9DC88D", "#70A1D7", "#F47C7C"],
+    # 字数统计口径：chars / cjk / latin / no_punct / word (见 core/word_counter.py)
+    "count_mode": "word",
+    # 统计面板两次刷新的最小间隔 (秒)
+    "stats_min_interval": 1.0,
     "pomo_state": {
         "seconds": 1500,
         "mode": "timer",
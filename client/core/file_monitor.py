@@ -2,6 +2,7 @@ import os
 import time
 import queue
 from PyQt6.QtCore import QThread, pyqtSignal
+from .word_counter import WordCounter, DEFAULT_MODE, CHUNK_SIZE
 
 
 class FileMonitor(QThread):
@@ -10,9 +11,10 @@ class FileMonitor(QThread):
     """
     stats_updated = pyqtSignal(int, int, int)
 
-    def __init__(self):
+    def __init__(self, count_mode=DEFAULT_MODE, min_emit_interval=1.0, wph_step=10):
         super().__init__()
         self.running = True
+        self.count_mode = count_mode
         self.task_queue = queue.Queue()
 
         # 监控源列表
@@ -28,6 +30,13 @@ class FileMonitor(QThread):
         self.last_autosave_time = time.time()
         self.autosave_interval = 60
 
+        # UI 刷新节流：数据不变时不发信号，且两次发送至少间隔 min_emit_interval 秒
+        # 时速按 wph_step 取整，避免空闲时随时间衰减导致每秒都在变
+        self.min_emit_interval = min_emit_interval
+        self.wph_step = max(1, int(wph_step))
+        self.last_emitted_stats = None
+        self.last_emit_time = 0
+
     def add_source(self, path_or_url, is_web=False):
         self.task_queue.put({
             'type': 'add',
@@ -197,19 +206,25 @@ class FileMonitor(QThread):
             return 0
         try:
             ext = os.path.splitext(path)[1].lower()
-            content = ""
+            counter = WordCounter(self.count_mode)
             if ext == '.docx':
                 doc = docx.Document(path)
-                parts = [p.text for p in doc.paragraphs]
+                # 段落/单元格之间以换行分隔，避免首尾单词被拼成一个
+                for p in doc.paragraphs:
+                    counter.feed(p.text)
+                    counter.feed('\n')
                 for t in doc.tables:
                     for r in t.rows:
                         for c in r.cells:
-                            parts.append(c.text)
-                content = "".join(parts)
+                            counter.feed(c.text)
+                            counter.feed('\n')
             elif ext == '.txt':
                 with open(path, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read()
-            return len(content.replace('\n', '').replace(' ', '').replace('\t', '').replace('\r', ''))
+                    while True:
+                        chunk = f.read(CHUNK_SIZE)
+                        if not chunk: break
+                        counter.feed(chunk)
+            return counter.total
         except:
             return 0
 
@@ -229,6 +244,23 @@ class FileMonitor(QThread):
         except:
             pass
 
+    def _words_per_hour(self, increment, elapsed):
+        """时速 (字/小时)，按 wph_step 取整"""
+        wph = int((increment / elapsed) * 3600) if elapsed > 1 else 0
+        return int(round(wph / self.wph_step)) * self.wph_step
+
+    def _emit_if_changed(self, total, increment, wph):
+        stats = (total, increment, wph)
+        if stats == self.last_emitted_stats:
+            return
+        now = time.time()
+        if now - self.last_emit_time < self.min_emit_interval:
+            # 未到刷新间隔，留到下一轮再发
+            return
+        self.last_emitted_stats = stats
+        self.last_emit_time = now
+        self.stats_updated.emit(total, increment, wph)
+
     def run(self):
         print("[Monitor] 线程启动 (Remove Support)")
 
@@ -280,10 +312,8 @@ class FileMonitor(QThread):
 
             total_increment = total_current_sum - self.total_initial_sum
 
-            elapsed = time.time() - self.start_time
-            wph = int((total_increment / elapsed) * 3600) if elapsed > 1 else 0
-
-            self.stats_updated.emit(total_current_sum, total_increment, wph)
+            wph = self._words_per_hour(total_increment, time.time() - self.start_time)
+            self._emit_if_changed(total_current_sum, total_increment, wph)
 
             if time.time() - self.last_autosave_time > self.autosave_interval:
                 self._trigger_autosave()
@@ -4,12 +4,32 @@ import json
 import sys
 import os
 import time
-from PyQt6.QtCore import QThread, pyqtSignal  # ✅ 改用 QThread
+import random
+import itertools
+import threading
+from concurrent.futures import Future
+from PyQt6.QtCore import QThread, QTimer, Qt, pyqtSignal  # ✅ 改用 QThread
 
 # 路径修正
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from shared.security import SecurityManager
+from .sync_queue import SyncQueue
+
+# 单帧最多携带的增量条数，离线积压的增量分批上传
+SYNC_BATCH_SIZE = 500
+
+# 只读请求：参数完全相同且仍在途中时合并为一次发送
+READ_REQUEST_TYPES = {
+    "get_analytics", "get_analytics_series", "get_productive_hours", "get_details", "get_friends",
+    "get_friend_requests", "get_public_groups", "get_group_detail", "get_group_messages", "search_user", "lobby_subscribe"
+}
+# 带版本号的只读请求：附上已持有结果的 version，服务器未变化时只回 not_modified
+VERSIONED_REQUEST_TYPES = {
+    "get_analytics", "get_analytics_series", "get_productive_hours", "get_details", "get_friends", "get_friend_requests",
+    "get_public_groups", "lobby_subscribe"
+}
+DEFAULT_REQUEST_TIMEOUT = 10.0
 
 
 class NetworkManager(QThread):  # ✅ 继承 QThread 以支持信号
@@ -18,8 +38,11 @@ class NetworkManager(QThread):  # ✅ 继承 QThread 以支持信号
     """
     # 定义一个信号：当收到 JSON 消息时触发，传出字典数据
     message_received = pyqtSignal(dict)
+    # 内部信号：把带 req_id 的回复转回主线程执行回调
+    reply_received = pyqtSignal(object, object)
 
-    def __init__(self, host='154.83.93.189', port=23456):
+    def __init__(self, host='154.83.93.189', port=23456, queue_path=None,
+                 backoff_base=1.0, backoff_max=60.0):
         super().__init__()
         self.host = host
         self.port = port
@@ -28,6 +51,39 @@ class NetworkManager(QThread):  # ✅ 继承 QThread 以支持信号
         self.running = False
         self.connected = False
 
+        # 断线重连：指数退避 + 随机抖动，避免服务器重启后所有客户端同时涌入
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stop_event = threading.Event()
+        self.send_lock = threading.Lock()
+        # 取队列与发送必须原子完成，保证 seq 按顺序到达服务器
+        self.flush_lock = threading.Lock()
+
+        # 记住最近一次登录请求，重连后自动重新登录
+        self.login_payload = None
+        self.username = None
+        self.logged_in = False
+        self.relogin_pending = False
+
+        # 未被服务器确认的字数增量 (落盘)
+        self.sync_queue = SyncQueue(queue_path)
+
+        # 请求/回复关联：req_id -> 在途请求；同参数只读请求 -> req_id
+        self.req_ids = itertools.count(1)
+        self.pending_requests = {}
+        self.inflight_reads = {}
+        self.pending_lock = threading.Lock()
+        # 各类请求的耗时统计：type -> [次数, 总耗时, 最大耗时]
+        self.latency_stats = {}
+        # 带版本号的最近结果：请求参数 -> 响应
+        self.versioned_responses = {}
+
+        self.reply_received.connect(self._deliver_reply, Qt.ConnectionType.QueuedConnection)
+        self.timeout_timer = QTimer()
+        self.timeout_timer.setInterval(500)
+        self.timeout_timer.timeout.connect(self._expire_requests)
+        self.timeout_timer.start()
+
     def connect_and_handshake(self):
         """建立 TCP 连接并执行安全握手"""
         try:
@@ -63,18 +119,158 @@ class NetworkManager(QThread):  # ✅ 继承 QThread 以支持信号
             return False
 
     def send_request(self, data_dict):
-        """发送加密后的 JSON 请求"""
+        """发送加密后的 JSON 请求，成功写入套接字返回 True"""
+        if data_dict.get('type') == 'login':
+            if self.login_payload and self.login_payload.get('username') != data_dict.get('username'):
+                self.versioned_responses.clear()
+            self.login_payload = dict(data_dict)
+
         if not self.connected or not self.aes_key:
-            return
+            return False
 
+        sock = self.socket
         try:
             json_str = json.dumps(data_dict)
             encrypted_data = SecurityManager.encrypt_aes(self.aes_key, json_str)
             header = struct.pack('>I', len(encrypted_data))
-            self.socket.sendall(header + encrypted_data)
+            with self.send_lock:
+                sock.sendall(header + encrypted_data)
+            return True
         except Exception as e:
             print(f"[Net] Send Error: {e}")
-            self.close()
+            # 只断开当前连接，接收线程会负责重连
+            self._drop_connection(sock)
+            return False
+
+    def request(self, data_dict, callback=None, timeout=DEFAULT_REQUEST_TIMEOUT, on_error=None):
+        """
+        发送带 req_id 的请求，返回 concurrent.futures.Future。
+        callback(response) 在主线程执行；超时、断线或发送失败时改为调用 on_error(reason)。
+        请求直接写入连接、不等待前一个回复 (流水线)；只读请求参数相同且仍在途中时不重复发送。
+        """
+        rtype = data_dict.get('type')
+        key = json.dumps(data_dict, sort_keys=True) if rtype in READ_REQUEST_TYPES else None
+
+        with self.pending_lock:
+            if key is not None and key in self.inflight_reads:
+                entry = self.pending_requests[self.inflight_reads[key]]
+                if callback: entry["callbacks"].append(callback)
+                if on_error: entry["error_callbacks"].append(on_error)
+                return entry["future"]
+
+            req_id = next(self.req_ids)
+            entry = {
+                "type": rtype,
+                "key": key,
+                "future": Future(),
+                "callbacks": [callback] if callback else [],
+                "error_callbacks": [on_error] if on_error else [],
+                "sent_at": time.perf_counter(),
+                "deadline": time.monotonic() + timeout
+            }
+            self.pending_requests[req_id] = entry
+            if key is not None:
+                self.inflight_reads[key] = req_id
+
+        payload = dict(data_dict)
+        payload["req_id"] = req_id
+        cached = self.versioned_responses.get(key) if rtype in VERSIONED_REQUEST_TYPES else None
+        if cached:
+            payload["version"] = cached["version"]
+        if not self.send_request(payload):
+            self._fail_request(req_id, "send_failed")
+        return entry["future"]
+
+    def _pop_request(self, req_id):
+        with self.pending_lock:
+            entry = self.pending_requests.pop(req_id, None)
+            if entry and entry["key"] is not None:
+                self.inflight_reads.pop(entry["key"], None)
+            return entry
+
+    def _fail_request(self, req_id, reason):
+        entry = self._pop_request(req_id)
+        if not entry: return
+        entry["future"].set_exception(ConnectionError(reason) if reason != "timeout" else TimeoutError(reason))
+        self.reply_received.emit(entry, {"error": reason})
+
+    def _fail_all_requests(self, reason):
+        with self.pending_lock:
+            req_ids = list(self.pending_requests)
+        for req_id in req_ids:
+            self._fail_request(req_id, reason)
+
+    def _expire_requests(self):
+        now = time.monotonic()
+        with self.pending_lock:
+            expired = [rid for rid, e in self.pending_requests.items() if e["deadline"] <= now]
+        for req_id in expired:
+            print(f"[Net] Request {req_id} timed out")
+            self._fail_request(req_id, "timeout")
+
+    def _resolve_request(self, response):
+        """带 req_id 的回复交给对应的在途请求，返回是否已处理"""
+        req_id = response.get('req_id')
+        if req_id is None: return False
+        entry = self._pop_request(req_id)
+        if not entry: return False
+
+        elapsed = time.perf_counter() - entry["sent_at"]
+        stat = self.latency_stats.setdefault(entry["type"], [0, 0.0, 0.0])
+        stat[0] += 1
+        stat[1] += elapsed
+        stat[2] = max(stat[2], elapsed)
+
+        if entry["type"] in VERSIONED_REQUEST_TYPES:
+            if response.get("status") == "not_modified":
+                # 结果未变：用本地保存的上一份结果回调
+                cached = self.versioned_responses.get(entry["key"])
+                if cached and cached.get("version") == response.get("version"):
+                    response = dict(cached, req_id=req_id)
+            elif "version" in response:
+                self.versioned_responses[entry["key"]] = response
+
+        entry["future"].set_result(response)
+        self.reply_received.emit(entry, response)
+        return True
+
+    def _deliver_reply(self, entry, response):
+        if "error" in response:
+            for cb in entry["error_callbacks"]:
+                cb(response["error"])
+            return
+        for cb in entry["callbacks"]:
+            cb(response)
+
+    def latency_summary(self):
+        """各类请求的耗时统计 (毫秒)"""
+        return {
+            rtype: {"count": n, "avg_ms": total / n * 1000, "max_ms": worst * 1000}
+            for rtype, (n, total, worst) in self.latency_stats.items() if n
+        }
+
+    def queue_sync(self, increment, duration, timestamp, local_date):
+        """字数增量先落盘入队，再尝试发送；断线期间的增量在重新登录后补发"""
+        self.sync_queue.push(self.username, increment, duration, timestamp, local_date)
+        self.flush_sync_queue()
+
+    def flush_sync_queue(self):
+        if not self.connected or not self.logged_in:
+            return
+        with self.flush_lock:
+            self._send_sync_deltas()
+
+    def _send_sync_deltas(self, resend=False):
+        """取出待发送的增量分批发出，调用方持有 flush_lock"""
+        deltas = self.sync_queue.take(self.username, resend=resend)
+        for i in range(0, len(deltas), SYNC_BATCH_SIZE):
+            request = {
+                "type": "sync_data",
+                "device_id": self.sync_queue.device_id,
+                "deltas": deltas[i:i + SYNC_BATCH_SIZE]
+            }
+            if not self.send_request(request):
+                break
 
     def _recv_exact(self, num_bytes):
         data = b''
@@ -87,8 +283,82 @@ class NetworkManager(QThread):  # ✅ 继承 QThread 以支持信号
                 return None
         return data
 
+    def _drop_connection(self, sock=None):
+        """断开当前连接但不停止线程"""
+        if sock is not None and sock is not self.socket:
+            return
+        self.connected = False
+        self.logged_in = False
+        if self.socket:
+            try:
+                self.socket.close()
+            except:
+                pass
+        # 服务器不会在新连接上回复旧请求
+        self._fail_all_requests("disconnected")
+
+    def _backoff_delay(self, attempt):
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(delay / 2, delay)
+
+    def _reconnect(self):
+        """按指数退避重连，连上后用记住的凭据重新登录；线程被关闭时返回 False"""
+        attempt = 0
+        while self.running:
+            delay = self._backoff_delay(attempt)
+            print(f"[Net] Reconnecting in {delay:.1f}s (attempt {attempt + 1})...")
+            if self.stop_event.wait(delay):
+                return False
+            if self.connect_and_handshake():
+                if self.login_payload:
+                    self.relogin_pending = True
+                    self.send_request(self.login_payload)
+                return True
+            attempt = min(attempt + 1, 16)
+        return False
+
+    def _handle_response(self, response):
+        """网络层自己处理的消息：登录状态、同步确认；其余交给 UI"""
+        rtype = response.get('type')
+
+        if rtype == 'sync_ack':
+            self.sync_queue.ack(self.username, response.get('seq'))
+            return
+
+        if rtype == 'login_response':
+            relogin = self.relogin_pending
+            self.relogin_pending = False
+            if response.get('status') == 'success':
+                self.username = response.get('username')
+                # 补发断线期间积压的增量 (已发出未确认的也重发)，发完才置 logged_in：
+                # 否则界面线程可能抢先发出更大的 seq，服务器按高水位去重会把较小的未确认 seq 当成重复丢掉
+                with self.flush_lock:
+                    self._send_sync_deltas(resend=True)
+                    self.logged_in = True
+            if relogin:
+                # 自动重新登录对 UI 透明
+                print(f"[Net] Re-login: {response.get('status')}")
+                return
+
+        if self._resolve_request(response):
+            return
+        self.message_received.emit(response)
+
     def run(self):
-        """接收线程的主循环"""
+        """接收线程的主循环：连接断开后自动重连"""
+        # 允许在未连上时启动线程，直接进入重连流程
+        self.running = not self.stop_event.is_set()
+        while self.running:
+            if not self.connected and not self._reconnect():
+                break
+            self._receive_loop()
+            self._drop_connection()
+            if self.running:
+                print("[Net] Connection lost.")
+
+        print("[Net] Network thread stopped.")
+
+    def _receive_loop(self):
         while self.running and self.connected:
             try:
                 # 1. 读包头
@@ -106,17 +376,18 @@ class NetworkManager(QThread):  # ✅ 继承 QThread 以支持信号
 
                 # 4. ✅ 触发信号，通知 UI 线程
                 print(f"[Client Recv] {response}")
-                self.message_received.emit(response)
+                self._handle_response(response)
 
             except Exception as e:
                 print(f"[Net] Receive Loop Error: {e}")
                 break
 
-        self.close()
-
     def close(self):
         self.running = False
         self.connected = False
+        self.logged_in = False
+        self.stop_event.set()
+        self.timeout_timer.stop()
         if self.socket:
             try:
                 self.socket.close()
@@ -0,0 +1,135 @@
+import json
+import os
+import threading
+import uuid
+
+
+class SyncQueue:
+    """
+    待确认的字数同步队列 (落盘保存)
+
+    - 每条增量分配一个本设备内递增的 seq，服务器按 (设备, seq) 高水位去重；
+    - 收到服务器 sync_ack 后才从队列删除；
+    - 断线、闪退后未确认的增量仍在磁盘上，重新登录后重放；
+    - 发送前把尚未发出过的、同一天的连续增量合并为一条，减少请求数。
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = []
+        self.next_seq = 1
+        # 设备号与 seq 计数器保存在同一个文件里：丢了队列文件就换一个设备号重新计数
+        self.device_id = None
+        self.load()
+        if not self.device_id:
+            self.device_id = uuid.uuid4().hex
+            self._save()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            self.device_id = saved.get("device_id")
+            self.next_seq = saved.get("next_seq", 1)
+            self.entries = saved.get("entries", [])
+            # 无法确定上次退出前是否已发出，一律按"已发出未确认"处理，不再参与合并
+            for e in self.entries:
+                e["sent"] = True
+            if self.entries:
+                print(f"[SyncQueue] Loaded {len(self.entries)} unacknowledged deltas")
+        except Exception as e:
+            print(f"[SyncQueue] Load error: {e}")
+
+    def _save(self):
+        if not self.path:
+            return
+        data = {
+            "device_id": self.device_id,
+            "next_seq": self.next_seq,
+            "entries": [{k: v for k, v in e.items() if k != "sent"} for e in self.entries]
+        }
+        try:
+            # 先写临时文件再替换，写到一半崩溃也不会损坏原队列
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"[SyncQueue] Save error: {e}")
+
+    def push(self, user, increment, duration, timestamp, local_date):
+        with self.lock:
+            entry = {
+                "seq": self.next_seq,
+                "user": user,
+                "increment": increment,
+                "duration": duration,
+                "timestamp": timestamp,
+                "local_date": local_date,
+                "sent": False
+            }
+            self.next_seq += 1
+            self.entries.append(entry)
+            self._save()
+            return entry["seq"]
+
+    def take(self, user, resend=False):
+        """
+        取出该用户待发送的增量并标记为已发出。
+        未发出过的同日连续增量合并为一条 (取最后一条的 seq)；
+        已发出未确认的增量可能已经入库，只能原样重发 (resend=True，用于重新登录后)。
+        """
+        with self.lock:
+            sent, merged = [], []
+            dropped = False
+            for e in self.entries:
+                if e["user"] != user:
+                    continue
+                if e["sent"]:
+                    if resend: sent.append(e)
+                    continue
+                last = merged[-1] if merged else None
+                if last is not None and last["local_date"] == e["local_date"]:
+                    last["increment"] += e["increment"]
+                    last["duration"] += e["duration"]
+                    last["timestamp"] = e["timestamp"]
+                    last["seq"] = e["seq"]
+                    e["merged_into"] = True
+                    dropped = True
+                else:
+                    merged.append(e)
+
+            if dropped:
+                self.entries = [e for e in self.entries if not e.get("merged_into")]
+                self._save()
+
+            for e in merged:
+                e["sent"] = True
+            return [self._to_delta(e) for e in sent + merged]
+
+    def ack(self, user, seq):
+        """确认值是服务器上本设备的高水位，seq 不大于它的增量都已入库"""
+        if seq is None:
+            return
+        with self.lock:
+            before = len(self.entries)
+            self.entries = [e for e in self.entries if e["user"] != user or e["seq"] > seq]
+            if len(self.entries) != before:
+                self._save()
+
+    def pending_count(self, user=None):
+        with self.lock:
+            return sum(1 for e in self.entries if user is None or e["user"] == user)
+
+    @staticmethod
+    def _to_delta(entry):
+        return {
+            "seq": entry["seq"],
+            "increment": entry["increment"],
+            "duration": entry["duration"],
+            "timestamp": entry["timestamp"],
+            "local_date": entry["local_date"]
+        }
@@ -78,7 +78,8 @@ class InkApplication:
 
         self.load_app_config()
 
-        self.network = NetworkManager(port=23456)
+        # 未确认的字数增量落盘在 exe 旁边，断网/闪退后下次登录补发
+        self.network = NetworkManager(port=23456, queue_path=os.path.join(base_path, "sync_queue.json"))
         self.network.message_received.connect(self.on_server_message)
 
         # 初始化窗口
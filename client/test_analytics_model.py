@@ -0,0 +1,144 @@
+# client/test_analytics_model.py
+# 客户端统计模型：区间合计、按周/月分桶、滑动平均、连续天数、最佳单日与逐日循环的结果一致，多年数据下仍是毫秒级；热力图翻页按当天日期重算最近一年
+import datetime
+import os
+import random
+import time
+import types
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtWidgets import QApplication
+
+from client.core.analytics_model import DayCounts
+from client.ui import analytics
+
+TODAY = datetime.date(2025, 6, 30)
+
+
+def build(years=3, seed=50):
+    rnd = random.Random(seed)
+    start = TODAY - datetime.timedelta(days=365 * years)
+    counts = []
+    writing = True
+    for _ in range((TODAY - start).days + 1):
+        if rnd.random() < 0.15: writing = not writing
+        counts.append(rnd.randint(1, 4000) if writing and rnd.random() < 0.9 else 0)
+    daily = {start + datetime.timedelta(days=i): n for i, n in enumerate(counts)}
+    return start, counts, daily
+
+
+def naive_streaks(daily, today):
+    longest = run = 0
+    for day in sorted(daily):
+        run = run + 1 if daily[day] > 0 else 0
+        longest = max(longest, run)
+    current, day = 0, today if daily.get(today, 0) > 0 else today - datetime.timedelta(days=1)
+    while daily.get(day, 0) > 0:
+        current += 1
+        day -= datetime.timedelta(days=1)
+    return longest, current
+
+
+def test_model_matches_naive_loops():
+    start, counts, daily = build()
+    days = DayCounts()
+    # 按年分页并入 (顺序打乱，页之间有重叠)
+    pages = []
+    end = TODAY
+    while end >= start:
+        page_start = max(end - datetime.timedelta(days=371), start)
+        pages.append((page_start, end))
+        end -= datetime.timedelta(days=365)
+    random.Random(1).shuffle(pages)
+    for a, b in pages:
+        days.merge(a, [daily[a + datetime.timedelta(days=i)] for i in range((b - a).days + 1)])
+    assert days.covers(start, TODAY) and len(days.loaded) == 1
+    assert days.loaded_range() == (start, TODAY)
+
+    def total(a, b):
+        return sum(n for d, n in daily.items() if a <= d <= b)
+
+    rnd = random.Random(2)
+    for _ in range(50):
+        a = start + datetime.timedelta(days=rnd.randint(-30, 1000))
+        b = a + datetime.timedelta(days=rnd.randint(0, 200))
+        assert days.range_sum(a, b) == total(a, b)
+
+    a, b = datetime.date(2023, 2, 15), datetime.date(2024, 5, 3)
+    starts, sums = days.buckets(a, b, "month")
+    assert starts[0] == datetime.date(2023, 2, 1) and len(starts) == 16
+    for i, s in enumerate(starts):
+        nxt = starts[i + 1] if i + 1 < len(starts) else b + datetime.timedelta(days=1)
+        assert sums[i] == total(max(s, a), nxt - datetime.timedelta(days=1))
+    starts, sums = days.buckets(a, b, "week")
+    assert all(s.weekday() == 0 for s in starts)
+    assert sums.sum() == total(a, b)
+
+    averages = days.rolling_average(TODAY, 7, 60)
+    for i, value in enumerate(averages):
+        day = TODAY - datetime.timedelta(days=59 - i)
+        assert abs(value - total(day - datetime.timedelta(days=6), day) / 7) < 1e-9
+
+    assert days.streaks(TODAY) == naive_streaks(daily, TODAY)
+    best = max(daily.values())
+    assert days.best_day() == (min(d for d, n in daily.items() if n == best), best)
+
+    # 今天还没写：当前连续算到昨天；昨天也没写则为 0
+    days.merge(TODAY - datetime.timedelta(days=2), [10, 10, 0])
+    assert days.streaks(TODAY)[1] >= 2
+    days.merge(TODAY - datetime.timedelta(days=1), [0, 0])
+    assert days.streaks(TODAY)[1] == 0
+
+    empty = DayCounts()
+    assert empty.streaks(TODAY) == (0, 0) and empty.best_day() == (None, 0) and empty.range_sum(a, b) == 0
+    assert empty.summary(TODAY)["avg_7"] == 0 and empty.loaded_range() is None
+
+
+def test_summary_is_fast_on_years_of_history():
+    start, counts, _ = build(years=20, seed=7)
+    days = DayCounts()
+    days.merge(start, counts)
+    started = time.perf_counter()
+    for _ in range(100):
+        days.summary(TODAY)
+        days.buckets(start, TODAY, "month")
+    elapsed = (time.perf_counter() - started) / 100
+    print(f"\n[Model] {len(counts)} days: summary + monthly buckets {elapsed * 1000:.2f} ms")
+    assert elapsed < 0.02
+
+
+def test_heatmap_pages_follow_today_across_midnight():
+    """热力图的最近一年按当天日期重算：页面开着跨过午夜后请求新的一天"""
+    app = QApplication.instance() or QApplication([])
+
+    class FakeDate(datetime.date):
+        current = TODAY
+
+        @classmethod
+        def today(cls):
+            return cls.current
+
+    class FakeNetwork:
+        def __init__(self):
+            self.requests = []
+
+        def request(self, payload, callback=None, **kwargs):
+            self.requests.append(payload)
+
+    original = analytics.datetime
+    analytics.datetime = types.SimpleNamespace(date=FakeDate, timedelta=datetime.timedelta)
+    try:
+        network = FakeNetwork()
+        page = analytics.AnalyticsPage(network)
+        page.show_heatmap()
+        assert network.requests[-1]["to"] == "2025-06-30"
+        page.page_heatmap(-1)
+        assert network.requests[-1]["to"] == "2024-06-30"
+
+        FakeDate.current = datetime.date(2025, 7, 1)
+        page.page_heatmap(1)
+        assert network.requests[-1]["to"] == "2025-07-01"
+        assert not page.btn_heat_next.isEnabled()
+    finally:
+        analytics.datetime = original
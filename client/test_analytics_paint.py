@@ -0,0 +1,77 @@
+# client/test_analytics_paint.py
+# 热力图/柱状图预渲染：重绘只贴缓存，画面与重新绘制一致；数据、主题、尺寸变化后才重新绘制 (离屏基准)
+import datetime
+import os
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtWidgets import QApplication
+
+from client.core.analytics_model import DayCounts
+from client.ui.analytics import HeatmapWidget, SimpleChartWidget
+
+app = QApplication.instance() or QApplication([])
+
+
+def repaint_cost(widget, repeat, cold):
+    """每次重绘的平均耗时；cold 时每次先丢掉缓存 (相当于没有缓存的旧实现)"""
+    target = widget.grab()  # 预热
+    started = time.perf_counter()
+    for _ in range(repeat):
+        if cold: widget.cache = None
+        widget.render(target)
+    return (time.perf_counter() - started) / repeat
+
+
+def make_widgets():
+    days = DayCounts()
+    end = datetime.date(2025, 6, 30)
+    start = HeatmapWidget.window_start(end)
+    days.merge(start, [(i * 37) % 4000 for i in range((end - start).days + 1)])
+    heatmap = HeatmapWidget()
+    heatmap.resize(800, 140)
+    heatmap.set_data(days, end)
+    chart = SimpleChartWidget()
+    chart.resize(800, 250)
+    chart.set_data([str(i) for i in range(30)], [(i * 131) % 2000 for i in range(30)], "Month")
+    return heatmap, chart
+
+
+def test_cached_painting_matches_and_is_cheaper():
+    for widget in make_widgets():
+        fresh = widget.grab().toImage()
+        assert widget.cache is not None
+        # 贴缓存的画面与重新绘制的一致
+        assert widget.grab().toImage() == fresh
+        widget.cache = None
+        assert widget.grab().toImage() == fresh
+
+        cold = repaint_cost(widget, 50, cold=True)
+        warm = repaint_cost(widget, 50, cold=False)
+        print(f"\n[Paint] {type(widget).__name__}: redraw {cold * 1000:.2f} ms, cached {warm * 1000:.3f} ms "
+              f"({cold / warm:.0f}x)")
+        assert warm * 3 < cold
+
+
+def test_cache_invalidated_on_data_theme_and_size():
+    heatmap, chart = make_widgets()
+    before = heatmap.grab().toImage()
+    heatmap.set_theme_mode(True)
+    assert heatmap.cache is None
+    dark = heatmap.grab().toImage()
+    assert dark != before
+
+    cached = heatmap.cache
+    heatmap.grab()
+    assert heatmap.cache is cached  # 没有变化时不重绘
+    heatmap.resize(900, 140)
+    heatmap.grab()
+    assert heatmap.cache is not cached and heatmap.cache.width() == round(900 * heatmap.devicePixelRatioF())
+
+    image = chart.grab().toImage()
+    chart.set_data(["a", "b"], [1, 2], "Week")
+    assert chart.grab().toImage() != image
+    chart.set_colors("#FF0000", "#000000", "#000000")
+    assert chart.cache is None
+
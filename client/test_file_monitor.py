@@ -0,0 +1,41 @@
+# client/test_file_monitor.py
+# 统计信号节流：数据不变 (时速按步长取整后也不变) 时不发信号，变化后只发一次，且受最小间隔限制
+from client.core.file_monitor import FileMonitor
+
+
+def collect(monitor):
+    emitted = []
+    monitor.stats_updated.connect(lambda *stats: emitted.append(stats))
+    return emitted
+
+
+def test_emits_only_when_stats_change():
+    monitor = FileMonitor(min_emit_interval=0, wph_step=10)
+    emitted = collect(monitor)
+
+    monitor._emit_if_changed(1000, 100, monitor._words_per_hour(100, 600))
+    assert emitted == [(1000, 100, 600)]
+
+    # 总数不变，空闲时时速缓慢衰减 (600 -> 599) 取整后不变：不发
+    for _ in range(3):
+        monitor._emit_if_changed(1000, 100, monitor._words_per_hour(100, 601))
+    assert len(emitted) == 1
+
+    # 总数变化：只发一次
+    for _ in range(3):
+        monitor._emit_if_changed(1050, 150, monitor._words_per_hour(150, 600))
+    assert emitted[1:] == [(1050, 150, 900)]
+
+
+def test_changes_inside_min_interval_wait_for_next_round():
+    monitor = FileMonitor(min_emit_interval=60)
+    emitted = collect(monitor)
+
+    monitor._emit_if_changed(10, 10, 0)
+    monitor._emit_if_changed(20, 20, 0)
+    assert emitted == [(10, 10, 0)]
+
+    # 间隔已过：下一轮发出最新的数据
+    monitor.last_emit_time -= 60
+    monitor._emit_if_changed(20, 20, 0)
+    assert emitted == [(10, 10, 0), (20, 20, 0)]
@@ -0,0 +1,82 @@
+# client/test_word_counter.py
+import time
+
+from client.core.word_counter import WordCounter, count_words, COUNT_MODES
+
+SAMPLE = "他推开窗，外面的雨下得正大。“你来了？”她问道。 The quick brown fox isn’t well-known - right? Café 2024"
+
+# 基准语料：中文为主、夹杂少量英文的手稿
+PARAGRAPH = ("　　他推开窗，外面的雨下得正大。“你来了？”她问道，声音很轻。"
+             "林晚把iPhone放在桌上，屏幕上是一封来自 Oxford 的邮件。她没有回答，只是看着窗外，像是在等什么人。\n")
+CORPUS = PARAGRAPH * 20000
+
+
+def naive_count(text):
+    """旧版 FileMonitor 的统计方式"""
+    return len(text.replace('\n', '').replace(' ', '').replace('\t', '').replace('\r', ''))
+
+
+def best_of(func, repeat=7):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def test_modes():
+    assert count_words(SAMPLE, "chars") == naive_count(SAMPLE)
+    assert count_words(SAMPLE, "cjk") == 18
+    # The / quick / brown / fox / isn't / well-known / right / Café / 2024
+    assert count_words(SAMPLE, "latin") == 9
+    # 18 个汉字 + 42 个字母数字
+    assert count_words(SAMPLE, "no_punct") == 60
+    # 18 个汉字 + 4 个全角标点 (，。？。) + 9 个单词；弯引号属于通用标点，不计数
+    assert count_words(SAMPLE, "word") == 31
+
+
+def test_non_latin_scripts_and_general_punctuation():
+    # 弯引号、破折号、省略号是分隔符，不算东亚字符
+    assert count_words("“Hello,” she said — twice…", "word") == 4
+    # 西里尔/希腊字母连成单词
+    assert count_words("привет мир", "word") == 2
+    assert count_words("Καλημέρα κόσμε, привет", "latin") == 3
+    # 假名、谚文逐字计数，日文标点不算文字
+    for mode in ("cjk", "no_punct", "word"):
+        assert count_words("こんにちは", mode) == 5, mode
+    assert count_words("カタカナ、ひらがな。", "cjk") == 8
+    assert count_words("カタカナ、ひらがな。", "word") == 10
+    assert count_words("안녕하세요 세계", "word") == 7
+    # 全角空格不计
+    assert count_words("　　你好", "word") == 2
+
+
+def test_streaming_matches_whole_text():
+    for mode in COUNT_MODES:
+        expected = count_words(SAMPLE, mode, chunk_size=len(SAMPLE))
+        for size in (1, 2, 3, 7):
+            assert count_words(SAMPLE, mode, chunk_size=size) == expected, (mode, size)
+
+    # 单词被切在块边界上
+    counter = WordCounter("latin")
+    for chunk in ["hel", "lo wor", "ld don", "'", "t"]:
+        counter.feed(chunk)
+    assert counter.total == 3
+
+
+def test_unknown_mode():
+    try:
+        WordCounter("pages")
+    except ValueError:
+        return
+    assert False, "unknown mode should raise"
+
+
+def test_throughput_beats_naive():
+    naive = best_of(lambda: naive_count(CORPUS))
+    for mode in ("cjk", "latin", "no_punct", "word"):
+        cost = best_of(lambda: count_words(CORPUS, mode))
+        print(f"[Bench] {mode}: {len(CORPUS) / cost / 1e6:.1f} M chars/s (naive {len(CORPUS) / naive / 1e6:.1f})")
+        # 实测约快 1.5-2.5 倍，留出余量避免计时抖动误报
+        assert cost < naive * 0.9, mode
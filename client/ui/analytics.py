@@ -2,38 +2,90 @@ from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QFrame,
                              QPushButton, QButtonGroup, QScrollArea, QTableWidget,
                              QTableWidgetItem, QHeaderView, QDialog, QFileDialog, QMessageBox)
 from PyQt6.QtCore import Qt, QDateTime, QDate, QTimer
-from PyQt6.QtGui import QPainter, QColor, QBrush, QPen, QFont
+from PyQt6.QtGui import QPainter, QColor, QBrush, QPen, QFont, QPixmap
 import datetime
 import csv
+import os
+import sys
+import numpy as np
+
+client_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if client_dir not in sys.path:
+    sys.path.insert(0, client_dir)
 from .localization import STRINGS
+from core.analytics_model import DayCounts
+from shared.heatmap_codec import HeatmapCodec
+
+
+class CachedPaintWidget(QWidget):
+    """
+    预渲染到 QPixmap 的自绘控件：draw() 只在数据、主题、尺寸或 DPI 变化后执行一次，
+    之后的重绘 (移动窗口、悬停、被遮挡后露出) 只是把缓存贴上去
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.cache = None
+        self.cache_key = None
+
+    def invalidate(self):
+        """数据或颜色变了：丢掉缓存并重绘"""
+        self.cache = None
+        self.update()
 
+    def draw(self, painter):
+        raise NotImplementedError
 
-class HeatmapWidget(QWidget):
-    """Github 风格的贡献热力图"""
+    def paintEvent(self, event):
+        if self.width() <= 0 or self.height() <= 0: return
+        ratio = self.devicePixelRatioF()
+        key = (self.width(), self.height(), ratio)
+        if self.cache is None or self.cache_key != key:
+            self.cache = QPixmap(round(self.width() * ratio), round(self.height() * ratio))
+            self.cache.setDevicePixelRatio(ratio)
+            self.cache.fill(Qt.GlobalColor.transparent)
+            painter = QPainter(self.cache)
+            painter.setFont(self.font())
+            self.draw(painter)
+            painter.end()
+            self.cache_key = key
+        QPainter(self).drawPixmap(0, 0, self.cache)
+
+
+class HeatmapWidget(CachedPaintWidget):
+    """Github 风格的贡献热力图 (53 周，截止到 end)"""
 
     def __init__(self):
         super().__init__()
         self.setFixedHeight(140)
-        self.data = {}
+        self.days = DayCounts()
+        self.end = datetime.date.today()
         self.text_color = QColor("#333")  # 默认文字颜色
         self.is_dark = False  # 明确的主题模式标志
 
-    def set_data(self, data):
-        self.data = data
-        self.update()
+    @staticmethod
+    def window_start(end):
+        """第一列的周日：end 一年前那天之前的周日"""
+        one_year_ago = end - datetime.timedelta(days=365)
+        return one_year_ago - datetime.timedelta(days=one_year_ago.weekday() + 1)
+
+    def set_data(self, days, end=None):
+        """days: DayCounts，按日期序数取值"""
+        self.days = days
+        self.end = end or datetime.date.today()
+        self.invalidate()
 
     def set_text_color(self, color):
         """设置文字颜色"""
         self.text_color = QColor(color)
-        self.update()
+        self.invalidate()
 
     def set_theme_mode(self, is_dark):
         """明确设置是否为深色模式"""
         self.is_dark = is_dark
-        self.update()
+        self.invalidate()
 
-    def paintEvent(self, event):
-        painter = QPainter(self)
+    def draw(self, painter):
         painter.setRenderHint(QPainter.RenderHint.Antialiasing)
 
         colors = [
@@ -48,33 +100,21 @@ class HeatmapWidget(QWidget):
         if self.is_dark:
             colors[0] = QColor("#3F3F46")  # 深灰色底
 
-        today = datetime.date.today()
-        one_year_ago = today - datetime.timedelta(days=365)
-
-        start_date = one_year_ago - datetime.timedelta(days=one_year_ago.weekday() + 1)
-        if start_date.weekday() != 6:
-            start_date = one_year_ago - datetime.timedelta(days=(one_year_ago.weekday() + 1) % 7)
+        start_date = self.window_start(self.end)
+        first = start_date.toordinal()
+        last = self.end.toordinal()
+        # 一次取出 53 周的字数并分档：0 / 1-499 / 500-1499 / 1500-2999 / 3000+
+        levels = np.searchsorted([1, 500, 1500, 3000], self.days.window(start_date, 53 * 7), side="right").tolist()
 
         cell_size = 12
         spacing = 3
 
         for col in range(53):
             for row in range(7):
-                current_date = start_date + datetime.timedelta(days=col * 7 + row)
-                if current_date > today: continue
-
-                date_str = str(current_date)
-                count = self.data.get(date_str, 0)
-
-                color_idx = 0
-                if count >= 3000:
-                    color_idx = 4
-                elif count >= 1500:
-                    color_idx = 3
-                elif count >= 500:
-                    color_idx = 2
-                elif count >= 1:
-                    color_idx = 1
+                ordinal = first + col * 7 + row
+                if ordinal > last: continue
+
+                color_idx = levels[col * 7 + row]
 
                 painter.setBrush(QBrush(colors[color_idx]))
                 painter.setPen(Qt.PenStyle.NoPen)
@@ -84,12 +124,14 @@ class HeatmapWidget(QWidget):
 
                 painter.drawRoundedRect(x, y, cell_size, cell_size, 2, 2)
 
-                if row == 0 and current_date.day <= 7:
-                    painter.setPen(QPen(self.text_color))  # 使用适配颜色
-                    painter.drawText(x, 15, current_date.strftime("%b"))
+                if row == 0:
+                    current_date = datetime.date.fromordinal(ordinal)
+                    if current_date.day <= 7:
+                        painter.setPen(QPen(self.text_color))  # 使用适配颜色
+                        painter.drawText(x, 15, current_date.strftime("%b"))
 
 
-class SimpleChartWidget(QWidget):
+class SimpleChartWidget(CachedPaintWidget):
     """自定义绘制的柱状图"""
 
     def __init__(self):
@@ -105,15 +147,14 @@ class SimpleChartWidget(QWidget):
         self.accent_color = QColor(accent)
         self.text_color = QColor(text)
         self.line_color = QColor(line)
-        self.update()
+        self.invalidate()
 
     def set_data(self, labels, values, mode):
         self.mode = mode
         self.data = {"labels": labels, "values": values}
-        self.update()
+        self.invalidate()
 
-    def paintEvent(self, event):
-        painter = QPainter(self)
+    def draw(self, painter):
         painter.setRenderHint(QPainter.RenderHint.Antialiasing)
 
         w = self.width()
@@ -156,7 +197,10 @@ class AnalyticsPage(QWidget):
     def __init__(self, network_manager):
         super().__init__()
         self.network = network_manager
-        self.full_heatmap_data = {}
+        self.day_counts = DayCounts()
+        # 热力图往前翻了几页 (每页一年)；0 为最近一年，页尾每次按当天日期重算，跨过午夜后也会请求新的一天
+        self.heatmap_pages_back = 0
+        self.chart_mode = "Week"
         self.setup_ui()
 
     def setup_ui(self):
@@ -198,14 +242,48 @@ class AnalyticsPage(QWidget):
         layout.addWidget(self.chart)
 
         layout.addSpacing(20)
+        contrib_bar = QHBoxLayout()
         self.lbl_contrib = QLabel(STRINGS["graph_title"])
         self.lbl_contrib.setStyleSheet("font-size: 16px; font-weight: bold; color: #555;")
-        layout.addWidget(self.lbl_contrib)
+        contrib_bar.addWidget(self.lbl_contrib)
+        contrib_bar.addStretch()
+        # 热力图按年翻页，更早的年份翻到时才向服务器请求
+        self.btn_heat_prev = QPushButton("◀")
+        self.btn_heat_prev.setToolTip("上一年 (Previous year)")
+        self.lbl_heat_range = QLabel("")
+        self.btn_heat_next = QPushButton("▶")
+        self.btn_heat_next.setToolTip("下一年 (Next year)")
+        for btn, step in ((self.btn_heat_prev, -1), (self.btn_heat_next, 1)):
+            btn.setFixedSize(30, 30)
+            btn.setCursor(Qt.CursorShape.PointingHandCursor)
+            btn.clicked.connect(lambda _, s=step: self.page_heatmap(s))
+        contrib_bar.addWidget(self.btn_heat_prev)
+        contrib_bar.addWidget(self.lbl_heat_range)
+        contrib_bar.addWidget(self.btn_heat_next)
+        layout.addLayout(contrib_bar)
 
         self.heatmap = HeatmapWidget()
         layout.addWidget(self.heatmap)
 
+        # 统计卡片：由本地 DayCounts 计算 (连续天数、滑动平均、最佳单日)
+        stats_layout = QHBoxLayout()
+        self.stat_labels = {}
+        for key in ("current_streak", "longest_streak", "avg_7", "avg_30", "best_day"):
+            card = QVBoxLayout()
+            value = QLabel("-")
+            value.setAlignment(Qt.AlignmentFlag.AlignCenter)
+            caption = QLabel(STRINGS[f"stat_{key}"])
+            caption.setAlignment(Qt.AlignmentFlag.AlignCenter)
+            card.addWidget(value)
+            card.addWidget(caption)
+            stats_layout.addLayout(card)
+            self.stat_labels[key] = (value, caption)
+        layout.addLayout(stats_layout)
+
         btn_layout = QHBoxLayout()
+        self.lbl_best_hour = QLabel("")
+        self.lbl_best_hour.setStyleSheet("font-size: 14px; color: #555;")
+        btn_layout.addWidget(self.lbl_best_hour)
         btn_layout.addStretch()
         self.btn_details = QPushButton(STRINGS["btn_view_details"])
         self.btn_details.setCursor(Qt.CursorShape.PointingHandCursor)
@@ -219,6 +297,11 @@ class AnalyticsPage(QWidget):
         # 1. 标题和文字颜色
         self.lbl_title.setStyleSheet(f"font-size: 24px; font-weight: bold; color: {t['text_main']};")
         self.lbl_contrib.setStyleSheet(f"font-size: 16px; font-weight: bold; color: {t['text_sub']};")
+        self.lbl_heat_range.setStyleSheet(f"font-size: 14px; color: {t['text_sub']};")
+        for value, caption in self.stat_labels.values():
+            value.setStyleSheet(f"font-size: 20px; font-weight: bold; color: {t['accent']};")
+            caption.setStyleSheet(f"font-size: 12px; color: {t['text_sub']};")
+        self.lbl_best_hour.setStyleSheet(f"font-size: 14px; color: {t['text_sub']};")
 
         # 2. 按钮样式 (普通)
         btn_style = f"""
@@ -233,6 +316,8 @@ class AnalyticsPage(QWidget):
             QPushButton:checked {{ background-color: {t['accent']}; color: white; border: none; }}
         """
         self.btn_refresh.setStyleSheet(btn_style)
+        self.btn_heat_prev.setStyleSheet(btn_style)
+        self.btn_heat_next.setStyleSheet(btn_style)
         for btn in self.mode_btns.values():
             btn.setStyleSheet(btn_style)
 
@@ -251,56 +336,101 @@ class AnalyticsPage(QWidget):
     def load_data(self):
         if self.network:
             print("[Analytics] Manually refreshing data...")
-            self.network.send_request({"type": "get_analytics"})
+            # 刷新时丢掉已加载的年份，回到最近一年
+            self.day_counts = DayCounts()
+            self.heatmap_pages_back = 0
+            self.show_heatmap()
+            self.network.request({"type": "get_productive_hours"}, callback=self.handle_response)
+            self.update_chart_view(self.chart_mode)
             self.btn_refresh.setEnabled(False)
             QTimer.singleShot(1000, lambda: self.btn_refresh.setEnabled(True))
 
     def handle_response(self, data):
         if data.get("type") == "analytics_data":
-            self.full_heatmap_data = data.get("heatmap", {})
-            self.heatmap.set_data(self.full_heatmap_data)
-            mode = "Week"
-            if self.mode_btns["Month"].isChecked(): mode = "Month"
-            if self.mode_btns["Year"].isChecked(): mode = "Year"
-            self.update_chart_view(mode)
+            if data.get("status") != "success" or data.get("encoding") != HeatmapCodec.ENCODING: return
+            self.day_counts.merge(datetime.date.fromisoformat(data["from"]), HeatmapCodec.decode(data["counts"]))
+            self.show_heatmap()
+            self.update_stats()
+        elif data.get("type") == "analytics_series":
+            self.show_series(data)
+        elif data.get("type") == "productive_hours":
+            best = data.get("best_hour") if data.get("status") == "success" else None
+            self.lbl_best_hour.setText("" if best is None else
+                                       STRINGS["lbl_best_hour"].format(start=best, end=(best + 1) % 24))
         elif data.get("type") == "details_data":
             self.open_details_dialog(data.get("data", []))
 
-    def update_chart_view(self, mode):
+    def page_heatmap(self, step):
+        self.heatmap_pages_back = max(self.heatmap_pages_back - step, 0)
+        self.show_heatmap()
+
+    def show_heatmap(self):
+        """当前页已加载就直接画，否则只请求这一页 (相邻页的区间相接，并入后仍连续)"""
+        end = datetime.date.today() - datetime.timedelta(days=365 * self.heatmap_pages_back)
+        start = self.heatmap.window_start(end)
+        self.lbl_heat_range.setText(f"{start:%Y-%m} ~ {end:%Y-%m}")
+        self.btn_heat_next.setEnabled(self.heatmap_pages_back > 0)
+        self.heatmap.set_data(self.day_counts, end)
+        if not self.day_counts.covers(start, end) and self.network:
+            self.network.request({"type": "get_analytics", "encoding": HeatmapCodec.ENCODING,
+                                  "from": str(start), "to": str(end)}, callback=self.handle_response)
+
+    def update_stats(self):
+        stats = self.day_counts.summary(datetime.date.today())
+        days = STRINGS["stat_days"]
+        self.stat_labels["current_streak"][0].setText(days.format(n=stats["current_streak"]))
+        self.stat_labels["longest_streak"][0].setText(days.format(n=stats["longest_streak"]))
+        self.stat_labels["avg_7"][0].setText(f"{stats['avg_7']:.0f}")
+        self.stat_labels["avg_30"][0].setText(f"{stats['avg_30']:.0f}")
+        best = stats["best_day"]
+        self.stat_labels["best_day"][0].setText(f"{stats['best_words']} ({best:%m-%d})" if best else "-")
+        if best:
+            self.stat_labels["best_day"][0].setToolTip(str(best))
+        # 最长连续、最佳单日只覆盖已加载的年份，在说明里标出范围
+        loaded = self.day_counts.loaded_range()
+        tip = STRINGS["stat_loaded_range"].format(start=loaded[0], end=loaded[1]) if loaded else ""
+        for key in ("longest_streak", "best_day"):
+            self.stat_labels[key][1].setToolTip(tip)
+
+    @staticmethod
+    def series_params(mode):
+        """各视图对应的统计区间与粒度：周/月视图按天，年视图按月 (最近 12 个月)"""
         today = datetime.date.today()
-        labels = []
-        values = []
+        if mode == "Year":
+            first = today.replace(day=1)
+            year, month = divmod(first.year * 12 + first.month - 1 - 11, 12)
+            return {"from": str(first.replace(year=year, month=month + 1)), "to": str(today), "granularity": "month"}
+        days = 30 if mode == "Month" else 7
+        return {"from": str(today - datetime.timedelta(days=days - 1)), "to": str(today), "granularity": "day"}
 
-        if mode == "Week":
-            for i in range(6, -1, -1):
-                d = today - datetime.timedelta(days=i)
-                d_str = str(d)
+    def update_chart_view(self, mode):
+        """按桶汇总由服务器完成 (GROUP BY)，这里只请求当前视图的区间"""
+        self.chart_mode = mode
+        if self.network:
+            payload = dict(self.series_params(mode), type="get_analytics_series")
+            self.network.request(payload, callback=self.handle_response)
+
+    def show_series(self, data):
+        # 切换视图后才到的旧回复不再显示
+        params = self.series_params(self.chart_mode)
+        if data.get("status") != "success" or \
+                any(data.get(k) != v for k, v in params.items()):
+            return
+        labels = []
+        count = len(data["buckets"])
+        for i, bucket in enumerate(data["buckets"]):
+            d = datetime.date.fromisoformat(bucket)
+            if self.chart_mode == "Week":
                 labels.append(d.strftime("%a"))
-                values.append(self.full_heatmap_data.get(d_str, 0))
-
-        elif mode == "Month":
-            for i in range(29, -1, -1):
-                d = today - datetime.timedelta(days=i)
-                d_str = str(d)
-                labels.append(str(d.day) if i % 5 == 0 else "")
-                values.append(self.full_heatmap_data.get(d_str, 0))
-
-        elif mode == "Year":
-            for i in range(11, -1, -1):
-                month_start = (today.replace(day=1) - datetime.timedelta(days=i * 30)).replace(day=1)
-                month_key = month_start.strftime("%Y-%m")
-                labels.append(month_start.strftime("%b"))
-                total = 0
-                for date_str, count in self.full_heatmap_data.items():
-                    if date_str.startswith(month_key):
-                        total += count
-                values.append(total)
-
-        self.chart.set_data(labels, values, mode)
+            elif self.chart_mode == "Month":
+                labels.append(str(d.day) if (count - 1 - i) % 5 == 0 else "")
+            else:
+                labels.append(d.strftime("%b"))
+        self.chart.set_data(labels, data["values"], self.chart_mode)
 
     def show_details_dialog(self):
         if self.network:
-            self.network.send_request({"type": "get_details"})
+            self.network.request({"type": "get_details"}, callback=self.handle_response)
 
     def open_details_dialog(self, records):
         dlg = QDialog(self)
@@ -105,6 +105,14 @@ CN = {
     "btn_year": "年",
     "graph_title": "历程",
     "btn_view_details": "查看近期明细 (3天)",
+    "lbl_best_hour": "最高产时段 (近 90 天)：{start}:00 - {end}:00",
+    "stat_current_streak": "当前连续",
+    "stat_longest_streak": "最长连续 (已加载范围)",
+    "stat_avg_7": "近 7 天日均",
+    "stat_avg_30": "近 30 天日均",
+    "stat_best_day": "最佳单日 (已加载范围)",
+    "stat_days": "{n} 天",
+    "stat_loaded_range": "只统计已加载的 {start} ~ {end}，往前翻页会加载更早的年份",
     "dialog_details_title": "近期活动明细",
     "col_time": "时间",
     "col_added": "新增字数",
@@ -128,12 +136,19 @@ CN = {
     "msg_add_confirm_fmt": "添加 {} ({}) 为好友?",
     "msg_not_found_title": "未找到",
     "msg_user_not_found": "用户不存在。",
+    "msg_search_results_title": "搜索结果",
+    "lbl_dbl_click_add": "双击添加为好友:",
+    "btn_more_results": "更多结果",
     "msg_friend_list_updated": "好友列表已更新！",
     "menu_delete_friend": "删除好友",
     "msg_delete_friend_confirm": "确定要删除好友 {} 吗？",
     "msg_friend_deleted": "好友已删除",
     "btn_create_group": "➕ 创建房间",
     "btn_refresh_lobby": "🔄 刷新大厅",
+    "lobby_search_placeholder": "搜索房间名",
+    "chk_has_space": "有空位",
+    "chk_not_sprinting": "未在拼字",
+    "chk_no_password": "无密码",
     "lbl_room_name_fmt": "房间: {}",
     "btn_leave_room": "离开房间",
     "btn_float_chat": "悬浮聊天",
@@ -268,6 +283,14 @@ EN = {
     "btn_year": "Year",
     "graph_title": "Contributions",
     "btn_view_details": "View Details (3 Days)",
+    "lbl_best_hour": "Most productive hour (90 days): {start}:00 - {end}:00",
+    "stat_current_streak": "Current streak",
+    "stat_longest_streak": "Longest streak (loaded range)",
+    "stat_avg_7": "7-day average",
+    "stat_avg_30": "30-day average",
+    "stat_best_day": "Best day (loaded range)",
+    "stat_days": "{n} days",
+    "stat_loaded_range": "Counts only the loaded range {start} ~ {end}; paging back loads earlier years",
     "dialog_details_title": "Recent Activity",
     "col_time": "Time",
     "col_added": "Added",
@@ -290,12 +313,19 @@ EN = {
     "msg_add_confirm_fmt": "Add {} ({}) as friend?",
     "msg_not_found_title": "Not Found",
     "msg_user_not_found": "User not found.",
+    "msg_search_results_title": "Search Results",
+    "lbl_dbl_click_add": "Double click to add as friend:",
+    "btn_more_results": "More results",
     "msg_friend_list_updated": "Friend list updated!",
     "menu_delete_friend": "Delete Friend",
     "msg_delete_friend_confirm": "Delete friend {}?",
     "msg_friend_deleted": "Friend deleted.",
     "btn_create_group": "➕ New Room",
     "btn_refresh_lobby": "🔄 Refresh",
+    "lobby_search_placeholder": "Search rooms",
+    "chk_has_space": "Has space",
+    "chk_not_sprinting": "Not sprinting",
+    "chk_no_password": "No password",
     "lbl_room_name_fmt": "Room: {}",
     "btn_leave_room": "Leave",
     "btn_float_chat": "Float Chat",
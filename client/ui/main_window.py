@@ -72,7 +72,8 @@ class MainWindow(QWidget):
         self.config_path = os.path.join(base_path, "sources_config.json")
         print(f"[MainWindow] Sources config path: {self.config_path}")
 
-        self.monitor_thread = FileMonitor()
+        self.monitor_thread = FileMonitor(count_mode=Config.get("count_mode", "word"),
+                                          min_emit_interval=Config.get("stats_min_interval", 1.0))
         self.monitor_thread.stats_updated.connect(self.update_dashboard_stats)
 
         # --- 2. 恢复番茄钟状态 ---
@@ -363,10 +364,10 @@ class MainWindow(QWidget):
 
         self.btn_theme_toggle.setText(STRINGS["theme_light"] if self.is_night else STRINGS["theme_dark"])
 
-        self.card_main.findChild(QLabel, "CardTitle").setText(STRINGS["stat_today"])
-        self.card_main.findChild(QLabel, "CardSub").setText(STRINGS["stat_session"].format(self.session_increment))
-        self.card_sub.findChild(QLabel, "CardTitle").setText(STRINGS["stat_speed"])
-        self.card_sub.findChild(QLabel, "CardSub").setText(STRINGS["unit_wph"])
+        self.lbl_main_title.setText(STRINGS["stat_today"])
+        self.lbl_main_sub.setText(STRINGS["stat_session"].format(self.session_increment))
+        self.lbl_speed_title.setText(STRINGS["stat_speed"])
+        self.lbl_speed_sub.setText(STRINGS["unit_wph"])
 
         self.lbl_list_title.setText(STRINGS["sources_title"].format(self.list_sources.count()))
         self.btn_local.setText(STRINGS["btn_local"])
@@ -488,9 +489,9 @@ class MainWindow(QWidget):
         real_today_increment = increment - self.daily_increment_offset
         daily_total = self.today_base_count + real_today_increment
 
-        self.card_main.findChild(QLabel, "CardValue").setText(str(daily_total))
-        self.card_main.findChild(QLabel, "CardSub").setText(STRINGS["stat_session"].format(increment))
-        self.card_sub.findChild(QLabel, "CardValue").setText(str(wph))
+        self.lbl_main_count.setText(str(daily_total))
+        self.lbl_main_sub.setText(STRINGS["stat_session"].format(increment))
+        self.lbl_speed.setText(str(wph))
 
         if self.session_increment - self.last_synced_increment >= 10:
             self.sync_data_incrementally()
@@ -504,7 +505,7 @@ class MainWindow(QWidget):
             self.sync_data_incrementally()
             self.page_analytics.load_data()
         elif page_idx == 2 and self.page_social and self.user_id:
-            self.page_social.load_friends()
+            # 好友在线状态由服务器推送，切到社交页不再重新拉取好友列表
             if not self.page_social.current_group_id:
                 self.page_social.refresh_group_list()
 
@@ -513,19 +514,19 @@ class MainWindow(QWidget):
 
         delta = self.session_increment - self.last_synced_increment
         if delta > 0:
-            print(f"[Sync] Sending incremental sync: +{delta}")
-            self.network.send_request({
-                "type": "sync_data",
-                "increment": delta,
-                "duration": 0,
-                "timestamp": time.time(),
-                "local_date": self.current_report_date.toString(Qt.DateFormat.ISODate)
-            })
+            print(f"[Sync] Queueing incremental sync: +{delta}")
+            # 先入离线队列，断线时由网络层在重连后补发
+            self.network.queue_sync(
+                increment=delta,
+                duration=0,
+                timestamp=time.time(),
+                local_date=self.current_report_date.toString(Qt.DateFormat.ISODate)
+            )
             self.last_synced_increment = self.session_increment
 
     def dispatch_network_message(self, data):
         rtype = data.get("type", "")
-        if rtype in ["analytics_data", "details_data"]:
+        if rtype in ["analytics_data", "analytics_series", "productive_hours", "details_data"]:
             self.page_analytics.handle_response(data)
         elif self.page_social:
             self.page_social.handle_network_msg(data)
@@ -758,12 +759,13 @@ class MainWindow(QWidget):
         lbl_title.setObjectName("CardTitle")
         lbl_val = QLabel(value)
         lbl_val.setObjectName("CardValue")
-        if is_primary:
-            self.lbl_main_count = lbl_val
-        else:
-            self.lbl_speed = lbl_val
         lbl_sub = QLabel(sub)
         lbl_sub.setObjectName("CardSub")
+        # 缓存标签引用，刷新统计时不再 findChild
+        if is_primary:
+            self.lbl_main_title, self.lbl_main_count, self.lbl_main_sub = lbl_title, lbl_val, lbl_sub
+        else:
+            self.lbl_speed_title, self.lbl_speed, self.lbl_speed_sub = lbl_title, lbl_val, lbl_sub
         layout.addWidget(lbl_title)
         layout.addStretch()
         layout.addWidget(lbl_val)
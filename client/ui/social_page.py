@@ -10,6 +10,7 @@ import base64
 from datetime import datetime
 from .float_group_window import FloatGroupWindow
 from .localization import STRINGS
+from shared.room_rules import MAX_MEMBERS, name_matches
 
 
 class FriendCard(QFrame):
@@ -56,13 +57,18 @@ class FriendCard(QFrame):
         layout.addLayout(info_layout)
 
         # 状态
-        status_color = "#2ecc71" if self.data['status'] == 'Online' else "#95a5a6"
-        lbl_status = QLabel("●")
-        lbl_status.setStyleSheet(f"color: {status_color}; font-size: 12px; background: transparent;")
-        layout.addWidget(lbl_status)
+        self.lbl_status = QLabel("●")
+        layout.addWidget(self.lbl_status)
+        self.set_status(self.data['status'])
 
         self.apply_text_style()
 
+    def set_status(self, status):
+        """在线状态由服务器推送 (presence_update) 时直接更新，不必重新拉取好友列表"""
+        self.data['status'] = status
+        status_color = "#2ecc71" if status == 'Online' else "#95a5a6"
+        self.lbl_status.setStyleSheet(f"color: {status_color}; font-size: 12px; background: transparent;")
+
     def update_style(self):
         t = self.theme
         self.setStyleSheet(f"""
@@ -240,6 +246,30 @@ class SocialPage(QWidget):
         self.float_group_win = None
         self.pending_create_payload = None
 
+        # 聊天记录按消息 id 增量获取：新消息用 since_id，向上滚动到顶时用 before_id 加载更早的
+        self.chat_messages = []
+        self.chat_has_more = False
+        self.chat_loading_older = False
+
+        # 大厅：看得见时订阅房间卡片增量，离开时退订
+        self.lobby_cards = []
+        self.lobby_subscribed = False
+        # 分页：下一页游标；搜索框输入停顿后再请求
+        self.lobby_next_cursor = None
+        self.lobby_loading_more = False
+        self.lobby_search_timer = QTimer(self)
+        self.lobby_search_timer.setSingleShot(True)
+        self.lobby_search_timer.setInterval(300)
+        self.lobby_search_timer.timeout.connect(self.refresh_group_list)
+
+        # 好友卡片 (user_id -> FriendCard)，在线状态随 presence_update 更新
+        self.friend_cards = {}
+
+        # 用户搜索：结果按相关度排序，"更多结果" 按 offset 续取
+        self.user_search_query = ""
+        self.user_search_list = None
+        self.btn_user_search_more = None
+
         self.setup_ui()
 
         self.update_timer = QTimer(self)
@@ -300,6 +330,16 @@ class SocialPage(QWidget):
 
         self.btn_tab_groups.setChecked(True)
         self.main_stack.setCurrentIndex(0)
+        self.main_stack.currentChanged.connect(self.update_lobby_subscription)
+        self.group_stack.currentChanged.connect(self.update_lobby_subscription)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.update_lobby_subscription()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.update_lobby_subscription()
 
     def apply_theme(self, t):
         self.current_theme = t
@@ -340,6 +380,9 @@ class SocialPage(QWidget):
 
         self.btn_create_group.setStyleSheet(btn_ctrl_style)
         self.btn_refresh_lobby.setStyleSheet(btn_ctrl_style)
+        self.lobby_search_input.setStyleSheet(input_style)
+        for chk in self.lobby_filter_checks.values():
+            chk.setStyleSheet(f"color: {t['text_main']};")
 
         # 3. Room View
         self.room_card.setStyleSheet(f"QFrame {{ background: {t['card_bg']}; border-radius: 15px; }}")
@@ -419,7 +462,7 @@ class SocialPage(QWidget):
 
     def load_friends(self):
         if self.my_user_id > 0:
-            self.network.send_request({"type": "get_friends"})
+            self.network.request({"type": "get_friends"}, callback=self.handle_network_msg)
 
     def on_delete_friend_clicked(self, fid, fname):
         reply = QMessageBox.question(self, STRINGS["confirm_title"],
@@ -458,11 +501,29 @@ class SocialPage(QWidget):
         l_top.addStretch()
         lobby_layout.addLayout(l_top)
 
+        # Search & Filters
+        l_filter = QHBoxLayout()
+        self.lobby_search_input = QLineEdit()
+        self.lobby_search_input.setPlaceholderText(STRINGS["lobby_search_placeholder"])
+        self.lobby_search_input.setFixedHeight(35)
+        self.lobby_search_input.textChanged.connect(lambda _: self.lobby_search_timer.start())
+        l_filter.addWidget(self.lobby_search_input)
+
+        self.lobby_filter_checks = {}
+        for key in ("has_space", "not_sprinting", "no_password"):
+            chk = QCheckBox(STRINGS[f"chk_{key}"])
+            chk.toggled.connect(lambda _: self.refresh_group_list())
+            self.lobby_filter_checks[key] = chk
+            l_filter.addWidget(chk)
+        lobby_layout.addLayout(l_filter)
+
         # Lobby Grid
         scroll = QScrollArea()
         scroll.setWidgetResizable(True)
         scroll.setFrameShape(QFrame.Shape.NoFrame)
         scroll.setStyleSheet("background: transparent;")
+        scroll.verticalScrollBar().valueChanged.connect(self.on_lobby_scrolled)
+        self.lobby_scroll = scroll
 
         content = QWidget()
         self.lobby_layout = QGridLayout(content)
@@ -481,9 +542,99 @@ class SocialPage(QWidget):
 
         return widget
 
+    def is_lobby_visible(self):
+        return (self.my_user_id > 0 and self.isVisible()
+                and self.main_stack.currentIndex() == 0 and self.group_stack.currentIndex() == 0)
+
+    def update_lobby_subscription(self, *_):
+        visible = self.is_lobby_visible()
+        if visible and not self.lobby_subscribed:
+            self.refresh_group_list()
+        elif not visible and self.lobby_subscribed:
+            self.lobby_subscribed = False
+            self.network.send_request({"type": "lobby_unsubscribe"})
+
+    def lobby_params(self):
+        """当前的搜索词与筛选条件"""
+        params = {}
+        query = self.lobby_search_input.text().strip()
+        if query: params["query"] = query
+        filters = {k: True for k, chk in self.lobby_filter_checks.items() if chk.isChecked()}
+        if filters: params["filters"] = filters
+        return params
+
+    def card_matches(self, card):
+        """增量推送来的卡片是否符合当前的搜索与筛选"""
+        params = self.lobby_params()
+        filters = params.get("filters", {})
+        # 与服务器的大厅搜索同一套规则 (单字前缀、多字子串)
+        if not name_matches(card.get("name", ""), params.get("query")): return False
+        if filters.get("has_space") and card.get("member_count", 0) >= MAX_MEMBERS: return False
+        if filters.get("not_sprinting") and card.get("sprint_active"): return False
+        if filters.get("no_password") and card.get("has_password"): return False
+        return True
+
     def refresh_group_list(self):
-        if self.my_user_id > 0:
-            self.network.send_request({"type": "get_public_groups"})
+        """订阅大厅并取回第一页；定时重发一次，用于断线重连后恢复订阅与校正排序"""
+        if not self.is_lobby_visible(): return
+        self.lobby_subscribed = True
+        self.lobby_loading_more = False
+        payload = dict(self.lobby_params(), type="lobby_subscribe")
+        self.network.request(payload, callback=self.handle_network_msg)
+
+    def load_more_groups(self):
+        if not self.lobby_next_cursor or self.lobby_loading_more: return
+        self.lobby_loading_more = True
+        params = self.lobby_params()
+
+        def on_page(data):
+            # 请求在途时改了搜索/筛选条件，这一页作废
+            if params == self.lobby_params():
+                self.handle_network_msg(data)
+            else:
+                self.lobby_loading_more = False
+
+        payload = dict(params, type="get_public_groups", cursor=self.lobby_next_cursor)
+        self.network.request(payload, callback=on_page,
+                             on_error=lambda *_: setattr(self, "lobby_loading_more", False))
+
+    def on_lobby_scrolled(self, value):
+        bar = self.lobby_scroll.verticalScrollBar()
+        if value >= bar.maximum() - 50:
+            self.load_more_groups()
+
+    def render_lobby(self, start=0):
+        """重绘第 start 张之后的卡片 (加载更多时只追加新的一页)"""
+        if start == 0:
+            while self.lobby_layout.count():
+                item = self.lobby_layout.takeAt(0)
+                if item.widget(): item.widget().deleteLater()
+
+        cols = 2  # 2 columns grid
+        for i in range(start, len(self.lobby_cards)):
+            card = RoomCard(self.lobby_cards[i], self.current_theme)  # Pass theme
+            card.join_clicked.connect(self.on_join_room_clicked)
+            self.lobby_layout.addWidget(card, i // cols, i % cols)
+
+    def apply_lobby_delta(self, data):
+        group_id = data.get('group_id')
+        op = data.get('op')
+        if op == "added":
+            if not self.card_matches(data['card']): return
+            self.lobby_cards = [data['card']] + [c for c in self.lobby_cards if c['id'] != group_id]
+        elif op == "removed":
+            self.lobby_cards = [c for c in self.lobby_cards if c['id'] != group_id]
+        elif op == "updated":
+            fields = {k: v for k, v in data.items() if k not in ("type", "op", "group_id")}
+            for card in self.lobby_cards:
+                if card['id'] == group_id:
+                    card.update(fields)
+                    if not self.card_matches(card):
+                        self.lobby_cards.remove(card)
+                    break
+            else:
+                return
+        self.render_lobby()
 
     def on_join_room_clicked(self, group_id, has_password):
         if has_password:
@@ -560,6 +711,7 @@ class SocialPage(QWidget):
         chat_v.setContentsMargins(0, 0, 10, 0)
         self.chat_display = QTextEdit()
         self.chat_display.setReadOnly(True)
+        self.chat_display.verticalScrollBar().valueChanged.connect(self.on_chat_scrolled)
 
         self.chat_input = QLineEdit()
         self.chat_input.setPlaceholderText(STRINGS["chat_placeholder"])
@@ -641,10 +793,51 @@ class SocialPage(QWidget):
     def search_user_to_add(self):
         query = self.search_input.text().strip()
         if not query: return
-        self.network.send_request({"type": "search_user", "query": query})
+        self.user_search_query = query
+        self.network.request({"type": "search_user", "query": query}, callback=self.handle_network_msg)
+
+    def load_more_users(self):
+        if not self.user_search_list: return
+        self.btn_user_search_more.setEnabled(False)
+        self.network.request({"type": "search_user", "query": self.user_search_query,
+                              "offset": self.user_search_list.count()}, callback=self.handle_network_msg)
+
+    def add_search_results(self, data):
+        for u in data.get('data', []):
+            item = QListWidgetItem(f"{u['nickname'] or u['username']} ({u['username']})  #{u['id']}")
+            item.setData(Qt.ItemDataRole.UserRole, u)
+            self.user_search_list.addItem(item)
+        self.btn_user_search_more.setVisible(bool(data.get('has_more')))
+        self.btn_user_search_more.setEnabled(True)
+
+    def open_search_dialog(self, data):
+        dlg = QDialog(self)
+        dlg.setWindowTitle(STRINGS["msg_search_results_title"])
+        dlg.resize(400, 360)
+        vbox = QVBoxLayout(dlg)
+
+        self.user_search_list = QListWidget()
+        self.btn_user_search_more = QPushButton(STRINGS["btn_more_results"])
+        self.btn_user_search_more.clicked.connect(self.load_more_users)
+        vbox.addWidget(QLabel(STRINGS["lbl_dbl_click_add"]))
+        vbox.addWidget(self.user_search_list)
+        vbox.addWidget(self.btn_user_search_more)
+        self.add_search_results(data)
+
+        def on_item_dbl_click(item):
+            u = item.data(Qt.ItemDataRole.UserRole)
+            reply = QMessageBox.question(dlg, STRINGS["msg_found_user_title"],
+                                         STRINGS["msg_add_confirm_fmt"].format(u['nickname'], u['username']),
+                                         QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+            if reply == QMessageBox.StandardButton.Yes:
+                self.add_friend_request(u['id'])
+
+        self.user_search_list.itemDoubleClicked.connect(on_item_dbl_click)
+        dlg.exec()
+        self.user_search_list = self.btn_user_search_more = None
 
     def show_friend_requests(self):
-        self.network.send_request({"type": "get_friend_requests"})
+        self.network.request({"type": "get_friend_requests"}, callback=self.handle_network_msg)
         if self.btn_friend_requests:
             self.btn_friend_requests.setStyleSheet(
                 "background-color: white; border: 1px solid #ddd; border-radius: 5px; padding: 5px 15px;")
@@ -739,6 +932,9 @@ class SocialPage(QWidget):
             self.sprint_ctrl_frame.hide()
 
         self.chat_display.clear()
+        self.chat_messages = []
+        self.chat_has_more = False
+        self.chat_loading_older = False
         self.rank_list.clear()
         self.lbl_owner_avatar.clear()
         self.lbl_owner_avatar.setStyleSheet("background: #eee; border-radius: 20px;")
@@ -770,7 +966,89 @@ class SocialPage(QWidget):
 
     def refresh_current_group_data(self):
         if self.current_group_id:
-            self.network.send_request({"type": "get_group_detail", "group_id": self.current_group_id})
+            self.network.request({"type": "get_group_detail", "group_id": self.current_group_id, "include_chat": False},
+                                 callback=self.handle_network_msg)
+            self.fetch_new_messages()
+
+    def fetch_new_messages(self):
+        """只取本地最后一条之后的消息；本地为空时取最近一页"""
+        if not self.current_group_id: return
+        payload = {"type": "get_group_messages", "group_id": self.current_group_id}
+        if self.chat_messages:
+            payload["since_id"] = self.chat_messages[-1]["id"]
+        self.network.request(payload, callback=self.handle_network_msg)
+
+    def load_older_messages(self):
+        if not self.current_group_id or not self.chat_messages or self.chat_loading_older: return
+        self.chat_loading_older = True
+        self.network.request({"type": "get_group_messages", "group_id": self.current_group_id,
+                              "before_id": self.chat_messages[0]["id"]},
+                             callback=self.handle_network_msg,
+                             on_error=lambda *_: setattr(self, "chat_loading_older", False))
+
+    def on_chat_scrolled(self, value):
+        if value == self.chat_display.verticalScrollBar().minimum() and self.chat_has_more:
+            self.load_older_messages()
+
+    @staticmethod
+    def format_chat_line(msg):
+        try:
+            local_time = datetime.fromtimestamp(float(msg.get('time', 0))).strftime("%H:%M")
+        except:
+            local_time = "??:??"
+        sender = msg.get('sender', 'Unknown')
+        content = msg.get('content', '')
+        if sender == "SYSTEM":
+            return f"<p style='color: #888; text-align: center; font-size: 12px;'><i>[{local_time}] {content}</i></p>"
+        return f"<p><b>[{local_time}] {sender}:</b> {content}</p>"
+
+    def render_chat(self, keep_position=False):
+        bar = self.chat_display.verticalScrollBar()
+        from_bottom = bar.maximum() - bar.value()
+        html = "".join(self.format_chat_line(m) for m in self.chat_messages)
+        # 重绘时滚动条会经过顶部，屏蔽信号以免误触发加载更早的消息
+        bar.blockSignals(True)
+        try:
+            self.chat_display.setHtml(html)
+            if keep_position:
+                # 在顶部插入更早的消息后，保持当前看到的内容不跳动
+                bar.setValue(bar.maximum() - from_bottom)
+            else:
+                self.chat_display.moveCursor(self.chat_display.textCursor().MoveOperation.End)
+        finally:
+            bar.blockSignals(False)
+        if self.float_group_win: self.float_group_win.update_chat(html)
+        if bar.maximum() == 0 and self.chat_has_more:
+            # 内容不足一屏时无法滚动，直接继续加载
+            self.load_older_messages()
+
+    def append_chat_message(self, msg):
+        line = self.format_chat_line(msg)
+        self.chat_messages.append(msg)
+        self.chat_display.append(line)
+        if self.float_group_win: self.float_group_win.append_chat(line)
+
+    def merge_chat_messages(self, data):
+        messages = [m for m in data.get('messages', []) if 'id' in m]
+        if data.get('direction') == "older":
+            self.chat_loading_older = False
+            known = {m['id'] for m in self.chat_messages}
+            older = [m for m in messages if m['id'] not in known]
+            self.chat_has_more = data.get('has_more', False)
+            if not older: return
+            first_load = not self.chat_messages
+            self.chat_messages = sorted(older + self.chat_messages, key=lambda m: m['id'])
+            self.render_chat(keep_position=not first_load)
+            return
+
+        last_id = self.chat_messages[-1]['id'] if self.chat_messages else 0
+        for msg in messages:
+            if msg['id'] > last_id:
+                self.append_chat_message(msg)
+                last_id = msg['id']
+        if data.get('has_more'):
+            # 离开期间积压的新消息超过一页，继续取
+            self.fetch_new_messages()
 
     def send_chat_message(self, text=None):
         if not isinstance(text, str): text = None
@@ -804,13 +1082,11 @@ class SocialPage(QWidget):
         dtype = data.get("type")
 
         if dtype == "search_user_response":
-            if data['status'] == 'success':
-                u = data['data']
-                reply = QMessageBox.question(self, STRINGS["msg_found_user_title"],
-                                             STRINGS["msg_add_confirm_fmt"].format(u['nickname'], u['username']),
-                                             QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
-                if reply == QMessageBox.StandardButton.Yes:
-                    self.add_friend_request(u['id'])
+            if data.get('offset'):
+                # "更多结果" 的续页，追加到已打开的结果列表
+                if self.user_search_list is not None: self.add_search_results(data)
+            elif data['status'] == 'success':
+                self.open_search_dialog(data)
             else:
                 QMessageBox.warning(self, STRINGS["msg_not_found_title"], STRINGS["msg_user_not_found"])
 
@@ -827,10 +1103,18 @@ class SocialPage(QWidget):
                 item = self.friend_layout.takeAt(0)
                 if item.widget(): item.widget().deleteLater()
 
+            self.friend_cards = {}
             for f in data.get("data", []):
                 card = FriendCard(f, self.current_theme)  # Pass theme
                 card.delete_clicked.connect(self.on_delete_friend_clicked)
                 self.friend_layout.addWidget(card)
+                self.friend_cards[f['id']] = card
+
+        elif dtype == "presence_update":
+            for status, key in (("Online", "online"), ("Offline", "offline")):
+                for uid in data.get(key, []):
+                    if uid in self.friend_cards:
+                        self.friend_cards[uid].set_status(status)
 
         elif dtype == "refresh_friend_requests":
             if self.btn_friend_requests:
@@ -845,18 +1129,20 @@ class SocialPage(QWidget):
             self.refresh_group_list()
 
         elif dtype == "group_list_response":
-            # Clear grid
-            while self.lobby_layout.count():
-                item = self.lobby_layout.takeAt(0)
-                if item.widget(): item.widget().deleteLater()
+            cards = [dict(g) for g in data.get("data", [])]
+            self.lobby_next_cursor = data.get("next_cursor")
+            if data.get("append"):
+                self.lobby_loading_more = False
+                known = {c['id'] for c in self.lobby_cards}
+                start = len(self.lobby_cards)
+                self.lobby_cards.extend(c for c in cards if c['id'] not in known)
+                self.render_lobby(start)
+            else:
+                self.lobby_cards = cards
+                self.render_lobby()
 
-            # Add Cards
-            groups = data.get("data", [])
-            cols = 2  # 2 columns grid
-            for i, g in enumerate(groups):
-                card = RoomCard(g, self.current_theme)  # Pass theme
-                card.join_clicked.connect(self.on_join_room_clicked)
-                self.lobby_layout.addWidget(card, i // cols, i % cols)
+        elif dtype == "lobby_delta":
+            self.apply_lobby_delta(data)
 
         elif dtype in ["create_group_response", "join_group_response"]:
             if data['status'] == 'success':
@@ -948,24 +1234,6 @@ class SocialPage(QWidget):
                 self.lbl_sprint_status.setStyleSheet(
                     f"color: {self.current_theme['text_sub']}; font-size: 14px; background: transparent;")
 
-            html = ""
-            for msg in data['chat_history']:
-                try:
-                    ts = float(msg.get('time', 0))
-                    local_time = datetime.fromtimestamp(ts).strftime("%H:%M")
-                except:
-                    local_time = "??:??"
-                sender = msg.get('sender', 'Unknown')
-                content = msg.get('content', '')
-                if sender == "SYSTEM":
-                    html += f"<p style='color: #888; text-align: center; font-size: 12px;'><i>[{local_time}] {content}</i></p>"
-                else:
-                    html += f"<p><b>[{local_time}] {sender}:</b> {content}</p>"
-
-            self.chat_display.setHtml(html)
-            self.chat_display.moveCursor(self.chat_display.textCursor().MoveOperation.End)
-            if self.float_group_win: self.float_group_win.update_chat(html)
-
             self.rank_list.clear()
             rank_data_for_float = []
             for idx, r in enumerate(data['leaderboard']):
@@ -997,19 +1265,18 @@ class SocialPage(QWidget):
 
             if self.float_group_win: self.float_group_win.update_rank(rank_data_for_float)
 
+        elif dtype == "group_messages_response":
+            if self.current_group_id == data.get('group_id') and data.get('status') == 'success':
+                self.merge_chat_messages(data)
+
         elif dtype == "group_msg_push":
             if self.current_group_id == data['group_id']:
-                try:
-                    ts = float(data.get('time', 0))
-                    local_time = datetime.fromtimestamp(ts).strftime("%H:%M")
-                except:
-                    local_time = "??:??"
-                if data['sender'] == "SYSTEM":
-                    line = f"<p style='color: #888; text-align: center; font-size: 12px;'><i>[{local_time}] {data['content']}</i></p>"
-                else:
-                    line = f"<p><b>[{local_time}] {data['sender']}:</b> {data['content']}</p>"
-                self.chat_display.append(line)
-                if self.float_group_win: self.float_group_win.append_chat(line)
+                if 'id' not in data:
+                    line = self.format_chat_line(data)
+                    self.chat_display.append(line)
+                    if self.float_group_win: self.float_group_win.append_chat(line)
+                elif not self.chat_messages or data['id'] > self.chat_messages[-1]['id']:
+                    self.append_chat_message({k: data[k] for k in ("id", "sender", "content", "time") if k in data})
 
         elif dtype == "sprint_status_push":
             if self.current_group_id == data['group_id']:
@@ -0,0 +1,89 @@
+"""
+字数统计的时间桶
+
+桶以起始日标识：day 为当天，week 为周一，month/year 为当月/当年 1 日。
+汇总在数据库里按桶 GROUP BY 完成，这里只负责划分桶并补齐没有记录的桶。
+"""
+from datetime import date, timedelta
+
+import queries
+from database import DailyReport
+
+GRANULARITIES = ("day", "week", "month", "year")
+# 单次请求最多返回的桶数 (按天约 2.7 年)
+MAX_BUCKETS = 1000
+# 热力图单次请求最多的天数 (客户端按年翻页，一页约 53 周)
+HEATMAP_MAX_DAYS = 1100
+
+
+def bucket_start(day, granularity):
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    if granularity == "year":
+        return day.replace(month=1, day=1)
+    return day
+
+
+def next_bucket(start, granularity):
+    if granularity == "week":
+        return start + timedelta(days=7)
+    if granularity == "month":
+        return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    if granularity == "year":
+        return date(start.year + 1, 1, 1)
+    return start + timedelta(days=1)
+
+
+def bucket_count(start, end, granularity):
+    first, last = bucket_start(start, granularity), bucket_start(end, granularity)
+    if granularity == "week":
+        return (last - first).days // 7 + 1
+    if granularity == "month":
+        return (last.year - first.year) * 12 + last.month - first.month + 1
+    if granularity == "year":
+        return last.year - first.year + 1
+    return (last - first).days + 1
+
+
+def bucket_starts(start, end, granularity):
+    starts, current = [], bucket_start(start, granularity)
+    while current <= end:
+        starts.append(current)
+        current = next_bucket(current, granularity)
+    return starts
+
+
+def series(session, user_id, start, end, granularity, archived=None):
+    """
+    [start, end] 内每个桶的字数合计：(桶起始日列表, 合计列表)，两者等长，没有记录的桶为 0
+    首尾的桶可能只有一部分落在范围内，只计范围内的天
+    archived: 冷归档中 [start, end] 内的 (日期序数数组, 字数数组)，与库里的行相加
+    """
+    totals = {str(bucket)[:10]: int(total or 0)
+              for bucket, total in queries.report_totals(session, user_id, start, end, granularity)}
+    starts = bucket_starts(start, end, granularity)
+    keys = [str(s) for s in starts]
+    values = [totals.get(k, 0) for k in keys]
+    if archived is not None:
+        # 按桶边界二分切分，用前缀和一次算出每个桶的合计
+        days, words = archived
+        cut = [0] + days.searchsorted([s.toordinal() for s in starts[1:]]).tolist() + [len(days)]
+        prefix = [0] + words.cumsum(dtype="int64").tolist()
+        values = [v + prefix[cut[i + 1]] - prefix[cut[i]] for i, v in enumerate(values)]
+    return keys, values
+
+
+def daily_counts(session, user_id, start, end, archived=None):
+    """[start, end] 内逐日的字数列表 (下标 0 为 start)，没有记录的天为 0"""
+    counts = [0] * ((end - start).days + 1)
+    first = start.toordinal()
+    if archived is not None:
+        for day, words in zip(archived[0].tolist(), archived[1].tolist()):
+            counts[day - first] += words
+    rows = session.query(DailyReport.report_date, DailyReport.total_words).filter(
+        DailyReport.user_id == user_id, DailyReport.report_date >= start, DailyReport.report_date <= end)
+    for day, words in rows:
+        counts[day.toordinal() - first] += words or 0
+    return counts
@@ -0,0 +1,321 @@
+"""
+冷数据归档
+
+多年历史的用户，旧月份的 DailyReport 仍逐行留在库里，多年的热力图/汇总每次都要读一遍。
+归档任务把早于若干个月前的每日字数从 daily_reports 移到按用户存放的列式文件：
+- <根目录>/<user_id>/<代数>.npy，int32 的 2 x N 数组，第 0 行为日期序数 (date.toordinal)，第 1 行为字数，按日期升序；
+- 读取用 np.load(mmap_mode='r') 内存映射，按日期二分取区间，只碰到区间所在的页；
+- 统计接口把归档区间与库里的行相加。库里只要还有某天的行 (例如离线很久才同步的旧增量) 就照常计入，
+  下次归档时再并入文件；
+- 每次归档在写线程里写出新一代的临时文件 <代数>.npy.tmp，删掉库里的行并在 archive_generations 登记新代数，
+  事务提交后才改名发布，随后删掉旧文件 (Windows 上被映射的文件删不掉，下次再清理)。
+  提交失败时库里的行和登记都回滚，临时文件不会被发布，读取方不会重复计数；
+  提交后、发布前进程退出时，下次启动 (recover) 或下次归档看到登记的代数与临时文件一致就补发布，否则丢弃临时文件。
+- 删行提交到新一代发布之间，"先读库再读归档"会重复计数，"先读归档再读库"会漏数：统计接口经 consistent() 读，
+  同一用户的搬移 (写事务 + 发布 + 清理) 期间等待，读的过程中发生了搬移就重读；发布后 on_change 换版本号。
+- 各用户当前的代数缓存在内存里，由发布/恢复更新，读取时不再列目录。
+服务端启动后由后台线程 (start) 每天归档一轮，归档只在服务端进程里进行。
+根目录：INKSPRINT_ARCHIVE_DIR，未设置时 SQLite 库放在数据库文件旁的 <文件名>.archive，其它数据库放在 server/cold_archive。
+命令行：python cold_archive.py [--months 12] (仅在服务端停止时使用，运行中的服务端不会感知到命令行发布的新一代)
+NumPy 未安装时不归档，统计只读库。
+"""
+import argparse
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date
+
+from database import DailyReport, ArchiveGeneration
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 早于这么多个月 (按月初对齐) 的每日字数归档
+ARCHIVE_AFTER_MONTHS = 12
+# 同时保持映射的用户文件数
+ARCHIVE_CACHE_SIZE = 256
+# 服务端后台归档的间隔 (秒)
+ARCHIVE_INTERVAL = 24 * 3600
+
+
+def archive_root(db):
+    root = os.environ.get("INKSPRINT_ARCHIVE_DIR")
+    if root: return root
+    url = db.engine.url
+    if url.get_backend_name() == "sqlite" and url.database and url.database != ":memory:":
+        return f"{url.database}.archive"
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "cold_archive")
+
+
+def month_boundary(today, months):
+    """today 所在月往前 months 个月的月初"""
+    year, month = divmod(today.year * 12 + today.month - 1 - months, 12)
+    return date(year, month + 1, 1)
+
+
+def daily_totals(found):
+    """range() 的结果转为 {YYYY-MM-DD: 字数}"""
+    if found is None: return {}
+    return {str(date.fromordinal(d)): w for d, w in zip(found[0].tolist(), found[1].tolist())}
+
+
+class ColdArchive:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.maps = OrderedDict()  # 文件路径 -> 映射的数组 (LRU)
+        self.current = {}  # 用户目录 -> (代数, 文件路径)
+        self.moving = set()  # 正在搬移的用户
+        self.moves = {}  # 用户 -> 已完成的搬移次数
+        self.moved = threading.Condition()
+        self.stop_event = threading.Event()
+        self.worker = None
+        self.last_report = None
+
+    @staticmethod
+    def _scan(user_dir):
+        try:
+            names = os.listdir(user_dir)
+        except FileNotFoundError:
+            return 0, None
+        generations = [int(n[:-4]) for n in names if n.endswith(".npy") and n[:-4].isdigit()]
+        if not generations: return 0, None
+        latest = max(generations)
+        return latest, os.path.join(user_dir, f"{latest}.npy")
+
+    def latest(self, user_dir):
+        """返回已发布的 (代数, 文件路径)；没有归档时为 (0, None)。只在第一次读到该用户时列目录"""
+        with self.lock:
+            found = self.current.get(user_dir)
+        if found is None:
+            found = self._scan(user_dir)
+            with self.lock:
+                found = self.current.setdefault(user_dir, found)
+        return found
+
+    def columns(self, db, user_id):
+        """该用户归档的 (日期序数, 字数) 两列 (只读内存映射)，没有归档时返回 None"""
+        if np is None: return None
+        _, path = self.latest(os.path.join(archive_root(db), str(user_id)))
+        if path is None: return None
+        with self.lock:
+            table = self.maps.get(path)
+            if table is not None:
+                self.maps.move_to_end(path)
+                return table
+        table = np.load(path, mmap_mode="r")
+        with self.lock:
+            self.maps[path] = table
+            while len(self.maps) > ARCHIVE_CACHE_SIZE:
+                self.maps.popitem(last=False)
+        return table
+
+    @contextmanager
+    def moving_user(self, user_id):
+        """搬移该用户的行 (写事务 + 发布 + 清理) 期间，consistent() 的读取方等待或重读"""
+        with self.moved:
+            self.moving.add(user_id)
+        try:
+            yield
+        finally:
+            with self.moved:
+                self.moving.discard(user_id)
+                self.moves[user_id] = self.moves.get(user_id, 0) + 1
+                self.moved.notify_all()
+
+    def _changed(self, user_id, seen):
+        with self.moved:
+            return user_id in self.moving or self.moves.get(user_id, 0) != seen
+
+    def consistent(self, user_id, read):
+        """
+        执行 read() (读该用户的归档与库里的行)，保证两边看到的是同一次搬移之前或之后的状态：
+        搬移期间等待，读的过程中发生了搬移就重读
+        """
+        while True:
+            with self.moved:
+                while user_id in self.moving:
+                    self.moved.wait()
+                seen = self.moves.get(user_id, 0)
+            try:
+                result = read()
+            except FileNotFoundError:
+                # 读到的旧一代文件已被清理
+                if self._changed(user_id, seen): continue
+                raise
+            if not self._changed(user_id, seen):
+                return result
+
+    def range(self, db, user_id, start, end):
+        """[start, end] 内归档的 (日期序数数组, 字数数组)，没有归档时返回 None"""
+        table = self.columns(db, user_id)
+        if table is None: return None
+        days = table[0]
+        lo, hi = days.searchsorted(start.toordinal()), days.searchsorted(end.toordinal(), side="right")
+        if lo == hi: return None
+        return days[lo:hi], table[1][lo:hi]
+
+    def daily_totals(self, db, user_id, start, end):
+        """[start, end] 内归档的 {YYYY-MM-DD: 字数}"""
+        return daily_totals(self.range(db, user_id, start, end))
+
+    def _recover_dir(self, user_dir, committed):
+        """处理残留的临时文件：代数 committed 已在库里登记 (删行已提交) 且尚未发布的补发布，其余丢弃"""
+        generation, _ = self.latest(user_dir)
+        for name in os.listdir(user_dir):
+            if not name.endswith(".npy.tmp"): continue
+            path = os.path.join(user_dir, name)
+            stem = name[:-len(".npy.tmp")]
+            if stem.isdigit() and int(stem) == committed > generation:
+                self.publish(path[:-len(".tmp")])
+            else:
+                os.remove(path)
+
+    def recover(self, db):
+        """启动时处理上次归档中途退出留下的临时文件"""
+        root = archive_root(db)
+        if np is None or not os.path.isdir(root): return
+        session = db.get_read_session()
+        try:
+            committed = dict(session.query(ArchiveGeneration.user_id, ArchiveGeneration.generation))
+        finally:
+            session.close()
+        for name in os.listdir(root):
+            if name.isdigit():
+                self._recover_dir(os.path.join(root, name), committed.get(int(name), 0))
+
+    def archive_user(self, session, db, user_id, boundary):
+        """
+        在写线程内把该用户 boundary 之前的 DailyReport 并入下一代归档的临时文件，删掉这些行并登记代数
+        返回 (移走的行数, 新一代文件路径)；事务提交后由调用方 publish()，没有可归档的行时返回 (0, None)
+        """
+        user_dir = os.path.join(archive_root(db), str(user_id))
+        mark = session.query(ArchiveGeneration).filter_by(user_id=user_id).first()
+        if os.path.isdir(user_dir):
+            self._recover_dir(user_dir, mark.generation if mark else 0)
+        rows = session.query(DailyReport.report_date, DailyReport.total_words).filter(
+            DailyReport.user_id == user_id, DailyReport.report_date < boundary).all()
+        if not rows: return 0, None
+        os.makedirs(user_dir, exist_ok=True)
+        generation, path = self.latest(user_dir)
+
+        days = np.array([d.toordinal() for d, _ in rows], dtype=np.int64)
+        words = np.array([w or 0 for _, w in rows], dtype=np.int64)
+        if path is not None:
+            old = np.load(path)
+            days, words = np.concatenate([old[0], days]), np.concatenate([old[1], words])
+        # 同一天 (之前归档过又来了迟到的行) 合并
+        unique_days, inverse = np.unique(days, return_inverse=True)
+        merged = np.zeros(len(unique_days), dtype=np.int64)
+        np.add.at(merged, inverse, words)
+        table = np.ascontiguousarray(np.stack([unique_days, merged]).astype(np.int32))
+
+        target = os.path.join(user_dir, f"{generation + 1}.npy")
+        with open(target + ".tmp", "wb") as f:
+            np.save(f, table)
+            f.flush()
+            os.fsync(f.fileno())
+        session.query(DailyReport).filter(
+            DailyReport.user_id == user_id, DailyReport.report_date < boundary).delete(synchronize_session=False)
+        if mark is None:
+            session.add(ArchiveGeneration(user_id=user_id, generation=generation + 1))
+        else:
+            mark.generation = generation + 1
+        session.flush()
+        return len(rows), target
+
+    def publish(self, target):
+        """删行的事务已提交：发布新一代文件"""
+        os.replace(target + ".tmp", target)
+        user_dir, name = os.path.split(target)
+        with self.lock:
+            self.current[user_dir] = (int(name[:-4]), target)
+
+    def prune(self, db, user_id):
+        """删掉旧代文件 (仍被映射而删不掉的留到下次)"""
+        user_dir = os.path.join(archive_root(db), str(user_id))
+        generation, _ = self.latest(user_dir)
+        for name in os.listdir(user_dir):
+            if name.endswith(".npy") and name[:-4].isdigit() and int(name[:-4]) < generation:
+                path = os.path.join(user_dir, name)
+                with self.lock:
+                    self.maps.pop(path, None)
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def start(self, db, on_change=None, interval=ARCHIVE_INTERVAL):
+        """后台归档线程：启动后立即归档一轮，之后每 interval 秒一轮"""
+        def loop():
+            while not self.stop_event.is_set():
+                try:
+                    report = archive_cold_months(db, self, on_change=on_change, stop=self.stop_event)
+                    self.last_report = report
+                    if report["rows"]:
+                        print(format_report(report))
+                except Exception as e:
+                    print(f"[Archive] Failed: {e}")
+                if self.stop_event.wait(interval): break
+
+        self.stop_event.clear()
+        self.worker = threading.Thread(target=loop, name="ColdArchiver", daemon=True)
+        self.worker.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.worker:
+            self.worker.join()
+            self.worker = None
+
+
+def format_report(report):
+    return f"[Archive] Moved {report['rows']} rows of {report['users']} users, archive size {report['bytes']} bytes"
+
+
+def archive_cold_months(db, archive, months=ARCHIVE_AFTER_MONTHS, today=None, on_change=None, stop=None):
+    """
+    归档所有用户 months 个月前 (月初对齐) 的每日字数，每个用户一个写事务
+    on_change(user_id) 在该用户的新一代发布后调用 (换版本号)；stop 被设置时在用户之间停下
+    返回报告 {"users", "rows", "bytes"}：归档的用户数、从库里移走的行数、归档文件总字节数
+    """
+    if np is None:
+        raise RuntimeError("NumPy is required for the cold archive")
+    boundary = month_boundary(today or date.today(), months)
+    session = db.get_read_session()
+    try:
+        user_ids = [uid for uid, in session.query(DailyReport.user_id).filter(
+            DailyReport.report_date < boundary).distinct()]
+    finally:
+        session.close()
+
+    report = {"users": 0, "rows": 0, "bytes": 0}
+    for user_id in user_ids:
+        if stop is not None and stop.is_set(): break
+        with archive.moving_user(user_id):
+            # db.write 在批次提交后才返回，提交失败时抛出异常，临时文件不会被发布
+            moved, target = db.write(archive.archive_user, db, user_id, boundary)
+            if target: archive.publish(target)
+            archive.prune(db, user_id)
+        if moved:
+            report["users"] += 1
+            report["rows"] += moved
+            if on_change: on_change(user_id)
+    root = archive_root(db)
+    if os.path.isdir(root):
+        for user_dir in os.listdir(root):
+            _, path = archive.latest(os.path.join(root, user_dir))
+            if path: report["bytes"] += os.path.getsize(path)
+    return report
+
+
+if __name__ == '__main__':
+    from database import db_manager
+
+    parser = argparse.ArgumentParser(description="把旧月份的每日字数从 daily_reports 移到列式归档文件")
+    parser.add_argument("--months", type=int, default=ARCHIVE_AFTER_MONTHS, help="归档早于多少个月前的数据")
+    args = parser.parse_args()
+    db_manager.init_db()
+    print(format_report(archive_cold_months(db_manager, ColdArchive(), args.months)))
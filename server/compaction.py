@@ -0,0 +1,179 @@
+"""
+明细压缩
+
+DetailRecord 每 10 秒一条，只增不减。压缩任务把足够旧的明细按桶合并成一条：
+- 超过 minute_after_days 天的合并为每分钟一条，超过 hour_after_days 天的再合并为每小时一条；
+- 同一用户、同一来源 (source_type/source_path)、同一桶内的明细合并，字数与时长求和，
+  start_time 取最早、end_time 取最晚 (仍落在原来的小时/天内，hourly/daily 汇总不受影响)，总量不变；
+- 每个用户每一天是一个独立的小事务，经单写线程排队执行，与实时同步交替进行，不会长时间占住写锁；
+- 每个用户每一级的进度记在 compaction_marks，下次从上次的位置继续。
+  进度之前迟到的增量 (离线很久后才同步) 不再压缩，只是多占几行。
+命令行：python compaction.py [--minute-after 天数] [--hour-after 天数]
+"""
+import argparse
+import threading
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import text
+
+from database import DetailRecord, CompactionMark, User
+
+COMPACT_MINUTE_AFTER_DAYS = 7
+COMPACT_HOUR_AFTER_DAYS = 90
+# 后台任务的运行间隔 (秒)
+COMPACT_INTERVAL = 3600
+
+TIERS = {
+    "minute": lambda t: t.replace(second=0, microsecond=0),
+    "hour": lambda t: t.replace(minute=0, second=0, microsecond=0),
+}
+
+
+def compact_window(session, user_id, tier, start, end):
+    """
+    在写线程内合并 [start, end) 内该用户的明细，并把进度推进到 end
+    返回 (合并前行数, 合并后行数)
+    """
+    truncate = TIERS[tier]
+    rows = session.query(DetailRecord).filter(
+        DetailRecord.user_id == user_id, DetailRecord.end_time >= start, DetailRecord.end_time < end).all()
+    groups = {}
+    for row in rows:
+        groups.setdefault((truncate(row.end_time), row.source_type, row.source_path), []).append(row)
+
+    remaining = 0
+    for group in groups.values():
+        remaining += 1
+        if len(group) == 1: continue
+        keep = group[0]
+        keep.word_increment = sum(r.word_increment for r in group)
+        keep.duration_seconds = sum(r.duration_seconds or 0 for r in group)
+        keep.start_time = min((r.start_time for r in group if r.start_time), default=keep.start_time)
+        keep.end_time = max(r.end_time for r in group)
+        for r in group[1:]:
+            session.delete(r)
+
+    mark = session.query(CompactionMark).filter_by(user_id=user_id, tier=tier).first()
+    if mark is None:
+        session.add(CompactionMark(user_id=user_id, tier=tier, done_until=end))
+    else:
+        mark.done_until = end
+    return len(rows), remaining
+
+
+def storage_bytes(db):
+    """detail_records 及其索引实际占用的字节数 (SQLite 的 dbstat)；其它数据库或没有 dbstat 时返回 None"""
+    if db.dialect != "sqlite": return None
+    session = db.get_read_session()
+    try:
+        return int(session.execute(text(
+            "SELECT coalesce(sum(pgsize - unused), 0) FROM dbstat WHERE name IN "
+            "(SELECT name FROM sqlite_master WHERE tbl_name = 'detail_records')")).scalar())
+    except Exception:
+        return None
+    finally:
+        session.close()
+
+
+def run(db, minute_after_days=COMPACT_MINUTE_AFTER_DAYS, hour_after_days=COMPACT_HOUR_AFTER_DAYS,
+        now=None, stop=None, on_change=None):
+    """
+    压缩一轮，返回报告 {"rows_scanned", "rows_reclaimed", "bytes_reclaimed", "transactions"}
+    stop: threading.Event，置位后在当前事务结束时停下；on_change(user_id): 该用户的明细被合并后调用
+    """
+    now = now or datetime.now()
+    bytes_before = storage_bytes(db)
+    report = {"rows_scanned": 0, "rows_reclaimed": 0, "transactions": 0}
+
+    session = db.get_read_session()
+    try:
+        user_ids = [uid for uid, in session.query(User.id).order_by(User.id)]
+        marks = {(m.user_id, m.tier): m.done_until for m in session.query(CompactionMark)}
+    finally:
+        session.close()
+
+    changed = set()
+    for tier, days in (("minute", minute_after_days), ("hour", hour_after_days)):
+        cutoff = datetime.combine(now.date() - timedelta(days=days), time.min)
+        for user_id in user_ids:
+            cursor = marks.get((user_id, tier))
+            while not (stop and stop.is_set()):
+                # 跳过没有明细的日子，直接定位到下一条
+                session = db.get_read_session()
+                try:
+                    query = session.query(DetailRecord.end_time).filter(
+                        DetailRecord.user_id == user_id, DetailRecord.end_time < cutoff)
+                    if cursor:
+                        query = query.filter(DetailRecord.end_time >= cursor)
+                    first = query.order_by(DetailRecord.end_time).limit(1).scalar()
+                finally:
+                    session.close()
+                if first is None: break
+                start = datetime.combine(first.date(), time.min)
+                end = min(start + timedelta(days=1), cutoff)
+                before, after = db.write(compact_window, user_id, tier, start, end)
+                report["rows_scanned"] += before
+                report["rows_reclaimed"] += before - after
+                report["transactions"] += 1
+                if before != after:
+                    changed.add(user_id)
+                cursor = end
+    if on_change:
+        for user_id in sorted(changed):
+            on_change(user_id)
+
+    bytes_after = storage_bytes(db)
+    report["bytes_reclaimed"] = bytes_before - bytes_after if bytes_before is not None and bytes_after is not None \
+        else None
+    return report
+
+
+def format_report(report):
+    reclaimed = "n/a" if report["bytes_reclaimed"] is None else f"{report['bytes_reclaimed']} bytes"
+    return (f"[Compaction] Scanned {report['rows_scanned']} rows in {report['transactions']} transactions, "
+            f"reclaimed {report['rows_reclaimed']} rows / {reclaimed}")
+
+
+class Compactor:
+    """后台压缩线程：启动后立即压缩一轮，之后每 interval 秒一轮"""
+
+    def __init__(self, minute_after_days=COMPACT_MINUTE_AFTER_DAYS, hour_after_days=COMPACT_HOUR_AFTER_DAYS):
+        self.minute_after_days = minute_after_days
+        self.hour_after_days = hour_after_days
+        self.stop_event = threading.Event()
+        self.worker = None
+        self.last_report = None
+
+    def start(self, db, on_change=None, interval=COMPACT_INTERVAL):
+        def loop():
+            while not self.stop_event.is_set():
+                try:
+                    report = run(db, self.minute_after_days, self.hour_after_days,
+                                 stop=self.stop_event, on_change=on_change)
+                    self.last_report = report
+                    if report["rows_reclaimed"]:
+                        print(format_report(report))
+                except Exception as e:
+                    print(f"[Compaction] Failed: {e}")
+                if self.stop_event.wait(interval): break
+
+        self.stop_event.clear()
+        self.worker = threading.Thread(target=loop, name="DetailCompactor", daemon=True)
+        self.worker.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.worker:
+            self.worker.join()
+            self.worker = None
+
+
+if __name__ == '__main__':
+    from database import db_manager
+
+    parser = argparse.ArgumentParser(description="合并旧的 detail_records 并报告回收的行数与字节数")
+    parser.add_argument("--minute-after", type=int, default=COMPACT_MINUTE_AFTER_DAYS, help="超过该天数按分钟合并")
+    parser.add_argument("--hour-after", type=int, default=COMPACT_HOUR_AFTER_DAYS, help="超过该天数按小时合并")
+    args = parser.parse_args()
+    db_manager.init_db()
+    print(format_report(run(db_manager, args.minute_after, args.hour_after)))
@@ -0,0 +1,92 @@
+import queue
+import threading
+from concurrent.futures import Future
+
+
+class DatabaseWriter:
+    """
+    单写线程：持有唯一的写连接，所有修改排队串行执行
+
+    - submit(fn, *args) 把 fn(session, *args) 放入队列，返回 Future；write() 为阻塞版本；
+    - 写线程一次取出最多 batch_size 个任务，每个任务包在 SAVEPOINT 里，整批只提交一次 (一次 fsync)；
+    - 某个任务抛异常只回滚它自己的 SAVEPOINT，不影响同批其它任务；
+    - fn 内不要 commit，返回值应是普通数据 (session 在提交后关闭)。
+    """
+
+    def __init__(self, session_factory, batch_size=64):
+        self.Session = session_factory
+        self.batch_size = batch_size
+        self.tasks = queue.Queue()
+        self.thread = None
+        self.start_lock = threading.Lock()
+        # 统计：提交次数 / 完成的任务数
+        self.commits = 0
+        self.completed = 0
+
+    def start(self):
+        with self.start_lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self.thread.start()
+
+    def stop(self, timeout=5):
+        if self.thread and self.thread.is_alive():
+            self.tasks.put(None)
+            self.thread.join(timeout)
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.tasks.put((fn, args, future))
+        if self.thread is None:
+            self.start()
+        return future
+
+    def write(self, fn, *args, timeout=None):
+        return self.submit(fn, *args).result(timeout)
+
+    def _run(self):
+        while True:
+            task = self.tasks.get()
+            if task is None: return
+            batch = [task]
+            stopping = False
+            while len(batch) < self.batch_size:
+                try:
+                    task = self.tasks.get_nowait()
+                except queue.Empty:
+                    break
+                if task is None:
+                    stopping = True
+                    break
+                batch.append(task)
+            self._execute(batch)
+            if stopping: return
+
+    def _execute(self, batch):
+        session = self.Session()
+        done = []
+        try:
+            for fn, args, future in batch:
+                if not future.set_running_or_notify_cancel(): continue
+                savepoint = session.begin_nested()
+                try:
+                    result = fn(session, *args)
+                    savepoint.commit()
+                    done.append((future, result))
+                except Exception as e:
+                    savepoint.rollback()
+                    future.set_exception(e)
+            session.commit()
+            self.commits += 1
+        except Exception as e:
+            print(f"[DB Writer] Batch commit failed: {e}")
+            session.rollback()
+            for future, _ in done:
+                future.set_exception(e)
+            return
+        finally:
+            session.close()
+
+        self.completed += len(done)
+        for future, result in done:
+            future.set_result(result)
@@ -0,0 +1,64 @@
+import threading
+
+from database import Friendship
+
+
+class FriendGraph:
+    """
+    好友关系的内存邻接表 (user_id -> 好友 ID 集合)
+
+    - 启动时从 friendships 表整表载入，接受好友请求/删除好友写库成功后调用 add()/remove() 同步；
+    - "X 的好友" O(deg)，"X 与 Y 是否好友" O(1)，"X 的在线好友" O(deg)，都不查库；
+    - 邻接表属于某个数据库 (db_key 即 DatabaseManager.key)，切换数据库后首次使用时重建。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.db_key = None
+        self.adjacency = {}  # user_id -> set(friend_id)
+
+    def load(self, db):
+        session = db.get_read_session()
+        try:
+            pairs = session.query(Friendship.user_a_id, Friendship.user_b_id).all()
+        finally:
+            session.close()
+        adjacency = {}
+        for a, b in pairs:
+            adjacency.setdefault(a, set()).add(b)
+            adjacency.setdefault(b, set()).add(a)
+        with self.lock:
+            self.db_key, self.adjacency = db.key, adjacency
+
+    def ensure(self, db):
+        if self.db_key != db.key:
+            self.load(db)
+
+    def add(self, db, a, b):
+        """写库成功后同步；尚未为该数据库载入时忽略 (载入时会从库里读到)"""
+        if self.db_key != db.key: return
+        with self.lock:
+            self.adjacency.setdefault(a, set()).add(b)
+            self.adjacency.setdefault(b, set()).add(a)
+
+    def remove(self, db, a, b):
+        if self.db_key != db.key: return
+        with self.lock:
+            self.adjacency.get(a, set()).discard(b)
+            self.adjacency.get(b, set()).discard(a)
+
+    def friends(self, db, user_id):
+        self.ensure(db)
+        with self.lock:
+            return frozenset(self.adjacency.get(user_id, ()))
+
+    def are_friends(self, db, a, b):
+        self.ensure(db)
+        with self.lock:
+            return b in self.adjacency.get(a, ())
+
+    def online_friends(self, db, user_id, online):
+        """online: 在线用户 ID 的容器 (如 presence.online)"""
+        self.ensure(db)
+        with self.lock:
+            return [fid for fid in self.adjacency.get(user_id, ()) if fid in online]
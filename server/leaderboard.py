@@ -0,0 +1,176 @@
+import random
+
+
+class _Node:
+    __slots__ = ("key", "prio", "left", "right", "size")
+
+    def __init__(self, key):
+        self.key = key
+        self.prio = random.random()
+        self.left = None
+        self.right = None
+        self.size = 1
+
+
+def _size(node):
+    return node.size if node else 0
+
+
+def _update(node):
+    node.size = 1 + _size(node.left) + _size(node.right)
+
+
+def _split(node, key):
+    """按 key 拆成 (< key, >= key) 两棵树"""
+    if node is None:
+        return None, None
+    if node.key < key:
+        left, right = _split(node.right, key)
+        node.right = left
+        _update(node)
+        return node, right
+    left, right = _split(node.left, key)
+    node.left = right
+    _update(node)
+    return left, node
+
+
+def _merge(a, b):
+    """合并两棵树，要求 a 中所有 key 小于 b"""
+    if a is None: return b
+    if b is None: return a
+    if a.prio > b.prio:
+        a.right = _merge(a.right, b)
+        _update(a)
+        return a
+    b.left = _merge(a, b.left)
+    _update(b)
+    return b
+
+
+def _delete(node, key):
+    if node is None:
+        return None
+    if node.key == key:
+        return _merge(node.left, node.right)
+    if key < node.key:
+        node.left = _delete(node.left, key)
+    else:
+        node.right = _delete(node.right, key)
+    _update(node)
+    return node
+
+
+class Leaderboard:
+    """
+    拼字排行榜 (增量维护)
+
+    - 以 (-得分, user_id) 为键存入带子树大小的 Treap，加分/查名次均为 O(log n)；
+    - 达标集合随加分增量更新；
+    - snapshot() 结果缓存到下一次变更，top(k) 只遍历前 k 个节点；
+    - 变更过的用户记入 dirty，由 RoomRegistry 定期批量写回数据库。
+    """
+
+    def __init__(self, target=0):
+        self.target = target or 0
+        self.root = None
+        self.scores = {}  # user_id -> 得分
+        self.reached = set()  # 已达标的 user_id
+        self.dirty = set()
+        self.version = 0
+        self._snapshot = None
+        self._snapshot_version = -1
+
+    def __len__(self):
+        return len(self.scores)
+
+    def __contains__(self, user_id):
+        return user_id in self.scores
+
+    def _reached(self, score):
+        return self.target > 0 and score >= self.target
+
+    def set_score(self, user_id, score, mark_dirty=True):
+        old = self.scores.get(user_id)
+        if old is not None:
+            if old == score: return score
+            self.root = _delete(self.root, (-old, user_id))
+        left, right = _split(self.root, (-score, user_id))
+        self.root = _merge(_merge(left, _Node((-score, user_id))), right)
+        self.scores[user_id] = score
+
+        if self._reached(score):
+            self.reached.add(user_id)
+        else:
+            self.reached.discard(user_id)
+        if mark_dirty:
+            self.dirty.add(user_id)
+        self.version += 1
+        return score
+
+    def add(self, user_id, increment):
+        return self.set_score(user_id, self.scores.get(user_id, 0) + increment)
+
+    def ensure(self, user_id):
+        """成员入榜 (0 分)，不算作需要写库的变更"""
+        if user_id not in self.scores:
+            self.set_score(user_id, 0, mark_dirty=False)
+
+    def remove(self, user_id):
+        score = self.scores.pop(user_id, None)
+        if score is None: return
+        self.root = _delete(self.root, (-score, user_id))
+        self.reached.discard(user_id)
+        self.dirty.discard(user_id)
+        self.version += 1
+
+    def score(self, user_id):
+        return self.scores.get(user_id, 0)
+
+    def rank(self, user_id):
+        """名次 (1 开始)，同分按 user_id 排列；不在榜上返回 None"""
+        score = self.scores.get(user_id)
+        if score is None: return None
+        key = (-score, user_id)
+        node, less = self.root, 0
+        while node:
+            if node.key < key:
+                less += _size(node.left) + 1
+                node = node.right
+            else:
+                node = node.left
+        return less + 1
+
+    def _iter(self, limit=None):
+        stack, node, count = [], self.root, 0
+        while stack or node:
+            while node:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            count += 1
+            user_id = node.key[1]
+            score = -node.key[0]
+            yield {"user_id": user_id, "word_count": score, "rank": count,
+                   "reached_target": user_id in self.reached}
+            if limit is not None and count >= limit:
+                return
+            node = node.right
+
+    def top(self, k):
+        if self._snapshot_version == self.version:
+            return self._snapshot[:k]
+        return list(self._iter(k))
+
+    def snapshot(self):
+        """完整排行 (按名次)，无变更时直接返回缓存"""
+        if self._snapshot_version != self.version:
+            self._snapshot = list(self._iter())
+            self._snapshot_version = self.version
+        return self._snapshot
+
+    def take_dirty(self):
+        """取出待写库的 {user_id: 得分}"""
+        changed = {uid: self.scores[uid] for uid in self.dirty if uid in self.scores}
+        self.dirty.clear()
+        return changed
@@ -0,0 +1,203 @@
+import bisect
+import heapq
+import threading
+from itertools import islice
+
+from shared.room_rules import MAX_MEMBERS, name_matches
+
+# 大厅分页：默认每页条数与上限
+LOBBY_PAGE_SIZE = 50
+LOBBY_PAGE_MAX = 100
+
+
+def _sort_key(entry):
+    return entry[0]
+
+
+def _bigrams(text):
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def encode_cursor(key):
+    return f"{key[0]!r}:{key[1]}"
+
+
+def decode_cursor(cursor):
+    """游标为上一页最后一张卡片的 (活跃时间戳, 房间 ID)，格式不对时视为从头开始"""
+    try:
+        ts, group_id = str(cursor).rsplit(":", 1)
+        return float(ts), int(group_id)
+    except (TypeError, ValueError):
+        return None
+
+
+class NameIndex:
+    """
+    房间名索引 (不区分大小写，匹配规则见 shared.room_rules.name_matches)
+    - 单个字符：在按名称排序的表上二分，做前缀匹配；
+    - 两个字符以上：二元组倒排表求交集后再校验子串，中文名同样适用。
+    """
+
+    def __init__(self, rooms):
+        self.names = {room.group_id: (room.name or "").lower() for room in rooms}
+        self.sorted_names = sorted((name, gid) for gid, name in self.names.items())
+        self.grams = {}
+        for gid, name in self.names.items():
+            for gram in _bigrams(name):
+                self.grams.setdefault(gram, set()).add(gid)
+
+    def search(self, query):
+        query = (query or "").strip().lower()
+        if not query: return None
+        if len(query) == 1:
+            i = bisect.bisect_left(self.sorted_names, (query,))
+            found = set()
+            while i < len(self.sorted_names) and self.sorted_names[i][0].startswith(query):
+                found.add(self.sorted_names[i][1])
+                i += 1
+            return found
+        postings = sorted((self.grams.get(g, set()) for g in _bigrams(query)), key=len)
+        if not postings[0]: return set()
+        candidates = set(postings[0]).intersection(*postings[1:])
+        return {gid for gid in candidates if name_matches(self.names[gid], query)}
+
+
+class LobbySnapshot:
+    """
+    大厅的共享快照
+
+    - 公开房间的卡片对所有用户都一样，大厅版本变化时才从 RoomRegistry 重建一次 (不查库)；
+    - 私密房间按房主分组保存，请求时只叠加自己和好友的那几组；
+    - 好友集合来自内存好友图 (FriendGraph)，不查库。
+    卡片按 (最近活跃时间, 房间 ID) 倒序，每组预先排好；分页用上一页最后一张卡片的键作游标，
+    公开房间二分定位到游标处，再与私密房间归并，过滤/搜索后取够一页即停。
+
+    正在看大厅的用户显式订阅 (subscribers)，房间变化只推给订阅者中能看到该房间的人。
+    """
+
+    def __init__(self, registry, friends, load_avatar):
+        self.registry = registry
+        self.friends = friends
+        self.load_avatar = load_avatar
+        self.lock = threading.Lock()
+        self.version = None
+        self.public = []  # [(排序键, 卡片)]
+        self.public_neg = []  # 公开房间排序键取负 (升序，供二分定位游标)
+        self.name_index = None
+        self.name_index_version = None
+        self.private = {}  # owner_id -> [(排序键, 卡片)]
+        self.avatars = {}  # avatar_url -> base64
+        self.rebuilds = 0
+        self.subscribers = set()  # 正在看大厅的 user_id
+        self.subscribers_lock = threading.Lock()
+
+    def _avatar(self, avatar_url):
+        if not avatar_url: return ""
+        data = self.avatars.get(avatar_url)
+        if data is None:
+            data = self.avatars[avatar_url] = self.load_avatar(avatar_url)
+        return data
+
+    def forget_avatar(self, avatar_url):
+        """头像文件名不变而内容更新时调用"""
+        self.avatars.pop(avatar_url, None)
+
+    def _card(self, room):
+        updated_at = room.updated_at
+        card = {
+            "id": room.group_id,
+            "name": room.name,
+            "member_count": len(room.members),
+            "updated_at": updated_at.strftime("%H:%M") if updated_at else "",
+            "owner_nickname": room.owner_nickname or "Unknown",
+            "owner_avatar": self._avatar(room.owner_avatar_url),
+            "has_password": True if room.password else False,
+            "is_private": room.is_private,
+            "sprint_active": room.sprint_active
+        }
+        return (updated_at.timestamp() if updated_at else 0.0, room.group_id), card
+
+    def card(self, room):
+        return self._card(room)[1]
+
+    def subscribe(self, user_id):
+        with self.subscribers_lock:
+            self.subscribers.add(user_id)
+
+    def unsubscribe(self, user_id):
+        with self.subscribers_lock:
+            self.subscribers.discard(user_id)
+
+    def audience(self, db, room):
+        """订阅者中能看到该房间的用户：公开房间为全部订阅者，私密房间只有房主与其好友"""
+        with self.subscribers_lock:
+            subscribers = set(self.subscribers)
+        if not subscribers or not room.is_private:
+            return subscribers
+        visible = self.friend_ids(db, room.owner_id) | {room.owner_id}
+        return subscribers & visible
+
+    def snapshot(self, version):
+        """返回 (公开房间, 按房主分组的私密房间)，版本未变时直接复用"""
+        version = (version, self.registry.generation)
+        with self.lock:
+            if self.version != version:
+                public, private = [], {}
+                for room in list(self.registry.rooms.values()):
+                    entry = self._card(room)
+                    if room.is_private:
+                        private.setdefault(room.owner_id, []).append(entry)
+                    else:
+                        public.append(entry)
+                public.sort(key=_sort_key, reverse=True)
+                for entries in private.values():
+                    entries.sort(key=_sort_key, reverse=True)
+                self.version, self.public, self.private = version, public, private
+                self.public_neg = [(-k[0], -k[1]) for k, _ in public]
+                self.rebuilds += 1
+            return self.public, self.public_neg, self.private
+
+    def names(self):
+        version = (self.registry.generation, self.registry.rooms_version)
+        with self.lock:
+            if self.name_index_version != version:
+                self.name_index = NameIndex(list(self.registry.rooms.values()))
+                self.name_index_version = version
+            return self.name_index
+
+    def friend_ids(self, db, user_id):
+        return self.friends.friends(db, user_id)
+
+    def page(self, db, version, user_id, limit=LOBBY_PAGE_SIZE, cursor=None, filters=None, query=None):
+        """
+        公开房间 + 自己或好友的私密房间，按最近活跃倒序分页
+        filters: has_space (未满员) / not_sprinting (未在拼字) / no_password (无密码)；query: 房间名搜索
+        返回 (卡片列表, 下一页游标或 None)
+        """
+        public, public_neg, private = self.snapshot(version)
+        after = decode_cursor(cursor) if cursor else None
+        filters = filters or {}
+        name_ids = self.names().search(query) if query else None
+        if name_ids is not None and not name_ids:
+            return [], None
+
+        start = bisect.bisect_right(public_neg, (-after[0], -after[1])) if after else 0
+        overlay = list(private.get(user_id, ()))
+        for fid in self.friend_ids(db, user_id):
+            overlay.extend(private.get(fid, ()))
+        if after:
+            overlay = [e for e in overlay if e[0] < after]
+        overlay.sort(key=_sort_key, reverse=True)
+        merged = heapq.merge(islice(public, start, None), overlay, key=_sort_key, reverse=True)
+
+        def matches(entry):
+            card = entry[1]
+            if name_ids is not None and card["id"] not in name_ids: return False
+            if filters.get("has_space") and card["member_count"] >= MAX_MEMBERS: return False
+            if filters.get("not_sprinting") and card["sprint_active"]: return False
+            if filters.get("no_password") and card["has_password"]: return False
+            return True
+
+        entries = list(islice(filter(matches, merged), limit + 1))
+        next_cursor = encode_cursor(entries[limit - 1][0]) if len(entries) > limit else None
+        return [card for _, card in entries[:limit]], next_cursor
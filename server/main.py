@@ -8,6 +8,7 @@ import base64
 import time
 import random
 import traceback
+from contextlib import nullcontext
 from datetime import date, timedelta, datetime
 from sqlalchemy import func, or_, and_
 from sqlalchemy.orm.exc import NoResultFound
@@ -15,9 +16,21 @@ from sqlalchemy.orm.exc import NoResultFound
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from shared.security import SecurityManager
+from shared.heatmap_codec import HeatmapCodec
 from database import db_manager, User, DailyReport, DetailRecord, \
-    FriendRequest, Friendship, Group, GroupMember, GroupMessage, SprintScore
+    FriendRequest, Friendship, Group, GroupMember, GroupMessage, SprintScore, SyncDevice
 from email_utils import EmailManager
+import queries
+from room_registry import RoomRegistry, RoomState, message_to_dict, MAX_MEMBERS
+from response_cache import ChangeCounters, ResponseCache
+from lobby import LobbySnapshot, LOBBY_PAGE_SIZE, LOBBY_PAGE_MAX
+from user_index import UserIndex, USER_SEARCH_PAGE_SIZE, USER_SEARCH_PAGE_MAX
+from friend_graph import FriendGraph
+from presence import PresenceRegistry
+from compaction import Compactor
+from cold_archive import ColdArchive, daily_totals as archived_daily_totals
+import analytics
+import rollups
 
 HOST = '0.0.0.0'
 PORT = 23456
@@ -26,9 +39,71 @@ AVATAR_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file
 if not os.path.exists(AVATAR_DIR):
     os.makedirs(AVATAR_DIR)
 
+
+def load_avatar_base64(avatar_url):
+    if avatar_url and avatar_url != "default.jpg":
+        path = os.path.join(AVATAR_DIR, avatar_url)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                return base64.b64encode(f.read()).decode('utf-8')
+    return ""
+
+
 verification_codes = {}
-connected_clients = {}
-clients_lock = threading.Lock()
+
+# 在线会话登记：一个用户可有多个会话，上下线合并后推给在线好友
+presence = PresenceRegistry()
+
+# 旧月份每日字数的列式归档 (内存映射读取)，统计时与库里的行相加
+cold_archive = ColdArchive()
+
+# 后台合并旧明细 (按分钟/按小时)，每个用户每天一个小事务
+compactor = Compactor()
+
+# 同步去重：(user_id, device_id) -> 已入库的最大 seq，首次用到时从 sync_devices 表加载 (仅在单写线程中读写)
+device_high_water = {}
+
+# 房间实时状态 (成员/拼字/得分/最近消息)，启动时从库中重建
+room_registry = RoomRegistry()
+
+# 只读结果的版本号与缓存：写入成功后 bump 对应实体，客户端带回的版本号未变时只回 not_modified
+# 实体键：("friends", uid) 好友列表视图，("friend_requests", uid)，("reports", uid) 字数记录，LOBBY_KEY 大厅
+change_counters = ChangeCounters()
+response_cache = ResponseCache()
+LOBBY_KEY = ("lobby",)
+
+# 好友关系的内存邻接表，启动时载入，接受/删除好友时同步
+friend_graph = FriendGraph()
+
+# 大厅共享快照：公开房间所有人共用，私密房间按好友关系叠加
+lobby = LobbySnapshot(room_registry, friend_graph, load_avatar_base64)
+
+# 聊天记录分页：默认每页条数与上限
+CHAT_PAGE_SIZE = 50
+CHAT_PAGE_MAX = 200
+
+# 用户名/昵称搜索索引 (前缀/子串/模糊)，注册与改昵称时同步
+user_index = UserIndex()
+
+
+def broadcast_to_users(user_ids, message_dict):
+    """推送给这些用户的所有在线会话"""
+    for session in presence.sessions_of(user_ids):
+        try:
+            session.send_packet(message_dict)
+        except:
+            pass
+
+
+def publish_presence(changes):
+    """把一批上下线变化按接收者合并，每个在线好友只收一条 presence_update"""
+    batches = {}
+    for uid, online in changes.items():
+        for fid in friend_graph.online_friends(db_manager, uid, presence.online):
+            batch = batches.setdefault(fid, {"type": "presence_update", "online": [], "offline": []})
+            batch["online" if online else "offline"].append(uid)
+    for fid, batch in batches.items():
+        broadcast_to_users([fid], batch)
 
 
 class ClientHandler(threading.Thread):
@@ -42,6 +117,9 @@ class ClientHandler(threading.Thread):
         self.running = True
         self.user_id = None
         self.username = None
+        self.nickname = None
+        # 回复、广播与在线状态推送来自不同线程，整帧发送需互斥
+        self.send_lock = threading.Lock()
 
     def send_packet(self, plain_text_dict):
         if not self.aes_key: return
@@ -49,7 +127,8 @@ class ClientHandler(threading.Thread):
             json_str = json.dumps(plain_text_dict)
             encrypted_bytes = SecurityManager.encrypt_aes(self.aes_key, json_str)
             header = struct.pack('>I', len(encrypted_bytes))
-            self.conn.sendall(header + encrypted_bytes)
+            with self.send_lock:
+                self.conn.sendall(header + encrypted_bytes)
         except Exception as e:
             print(f"[Send Error] {e}")
 
@@ -80,47 +159,93 @@ class ClientHandler(threading.Thread):
             return False
 
     def broadcast_to_users(self, user_ids, message_dict):
-        with clients_lock:
-            for uid in user_ids:
-                if uid in connected_clients:
-                    try:
-                        connected_clients[uid].send_packet(message_dict)
-                    except:
-                        pass
+        broadcast_to_users(user_ids, message_dict)
 
     def broadcast_to_all(self, message_dict):
-        with clients_lock:
-            for uid, client in connected_clients.items():
-                try:
-                    client.send_packet(message_dict)
-                except:
-                    pass
+        for session in presence.all_sessions():
+            try:
+                session.send_packet(message_dict)
+            except:
+                pass
 
     def load_avatar_base64(self, avatar_url):
-        if avatar_url and avatar_url != "default.jpg":
-            path = os.path.join(AVATAR_DIR, avatar_url)
-            if os.path.exists(path):
-                with open(path, "rb") as f:
-                    return base64.b64encode(f.read()).decode('utf-8')
-        return ""
+        return load_avatar_base64(avatar_url)
+
+    def serve_versioned(self, request, scope, keys, build, extra=None):
+        """
+        可缓存的只读请求：
+        - 客户端带来的 version 与当前版本一致时只回 not_modified；
+        - 否则优先返回缓存中同版本的结果，未命中才调用 build() 重新计算。
+        版本号在计算结果之前取得，结果只可能比版本号新，不会把旧数据标成新版本。
+        """
+        # 版本号与缓存按数据库区分 (切换数据库后旧结果不能复用)
+        db_key = db_manager.key
+        scope = (db_key,) + scope
+        version = change_counters.version(*keys, extra=(db_key, extra))
+        if request.get('version') == version:
+            return {"type": "not_modified", "status": "not_modified", "version": version}
+        response = response_cache.get(scope, version)
+        if response is None:
+            response = build()
+            if response is None: return None
+            response["version"] = version
+            response_cache.put(scope, version, response)
+        return response
+
+    def publish_lobby(self, op, room, **fields):
+        """
+        房间卡片变化：大厅换版本，并把增量推给订阅了大厅且能看到该房间的用户
+        op 为 added (附完整卡片) / removed / updated (只附变化的字段)
+        """
+        change_counters.bump(LOBBY_KEY)
+        targets = lobby.audience(db_manager, room)
+        if not targets: return
+        msg = {"type": "lobby_delta", "op": op, "group_id": room.group_id}
+        if op == "added":
+            msg["card"] = lobby.card(room)
+        else:
+            msg.update(fields)
+        self.broadcast_to_users(targets, msg)
+
+    def bump_related(self, user_id, include_requests=False):
+        """用户资料或在线状态变化：好友看到的好友列表 (及收到其请求的人的请求列表) 需要重新计算"""
+        keys = [("friends", fid) for fid in friend_graph.friends(db_manager, user_id)]
+        if include_requests:
+            session = db_manager.get_read_session()
+            try:
+                keys += [("friend_requests", rid) for (rid,) in
+                         session.query(FriendRequest.receiver_id).filter(FriendRequest.sender_id == user_id)]
+            finally:
+                session.close()
+        change_counters.bump(*keys)
+
+    def sign_out(self):
+        """注销本会话；用户的最后一个会话断开时才算下线"""
+        if presence.disconnect(self.user_id, self):
+            lobby.unsubscribe(self.user_id)
+            self.bump_related(self.user_id)
 
     # --- 业务处理函数 ---
 
     def handle_login(self, request):
         username = request.get('username')
         password_hash = request.get('password')
-        session = db_manager.get_session()
+        session = db_manager.get_read_session()
         try:
             user = session.query(User).filter_by(username=username).first()
             if not user:
                 return {"type": "login_response", "status": "fail", "msg": "用户不存在"}
 
             if user.password_hash == password_hash:
+                if self.user_id and self.user_id != user.id:
+                    self.sign_out()
                 self.user_id = user.id
                 self.username = user.username
+                self.nickname = user.nickname
 
-                with clients_lock:
-                    connected_clients[user.id] = self
+                # 同一用户的其它会话保持登录；第一个会话上线时好友看到的列表才变化
+                if presence.connect(user.id, self):
+                    self.bump_related(user.id)
 
                 avatar_data = self.load_avatar_base64(user.avatar_url)
 
@@ -128,12 +253,8 @@ class ClientHandler(threading.Thread):
                 daily_report = session.query(DailyReport).filter_by(user_id=user.id, report_date=today).first()
                 today_total = daily_report.total_words if daily_report else 0
 
-                current_group_member = session.query(GroupMember).filter_by(user_id=user.id).first()
-                group_info = {}
-                if current_group_member:
-                    g = session.query(Group).get(current_group_member.group_id)
-                    if g:
-                        group_info = {"id": g.id, "name": g.name, "owner_id": g.owner_id}
+                room = room_registry.room_of(user.id)
+                group_info = {"id": room.group_id, "name": room.name, "owner_id": room.owner_id} if room else {}
 
                 print(f"[Login] User {username} logged in successfully.")
                 return {
@@ -157,104 +278,260 @@ class ClientHandler(threading.Thread):
         username = request.get('username')
         password_hash = request.get('password')
         email = request.get('email', '')
-        session = db_manager.get_session()
-        try:
+
+        def write(session):
             existing = session.query(User).filter_by(username=username).first()
             if existing: return {"type": "register_response", "status": "fail", "msg": "用户名已存在"}
             new_user = User(username=username, password_hash=password_hash, nickname=username, email=email or None)
             session.add(new_user)
-            session.commit()
-            print(f"[Register] New user {username} created.")
-            return {"type": "register_response", "status": "success", "msg": "注册成功"}
+            session.flush()
+            return {"type": "register_response", "status": "success", "msg": "注册成功", "user_id": new_user.id}
+
+        try:
+            response = db_manager.write(write)
         except Exception as e:
             print(f"[Register Logic Error] {e}")
             raise e
-        finally:
-            session.close()
+        if response["status"] == "success":
+            user_index.put(db_manager, response.pop("user_id"), username, username)
+            print(f"[Register] New user {username} created.")
+        return response
+
+    @staticmethod
+    def _parse_local_date(date_str):
+        if date_str:
+            try:
+                return datetime.strptime(date_str, "%Y-%m-%d").date()
+            except ValueError:
+                pass
+        return date.today()
+
+    def _load_high_water(self, session, device_id):
+        """返回设备已入库的最大 seq，优先走内存缓存 (只在单写线程中调用)"""
+        key = (self.user_id, device_id)
+        if key not in device_high_water:
+            device = session.query(SyncDevice).filter_by(user_id=self.user_id, device_id=device_id).first()
+            if not device:
+                device = SyncDevice(user_id=self.user_id, device_id=device_id, last_seq=0)
+                session.add(device)
+                session.flush()
+            device_high_water[key] = device.last_seq
+        return device_high_water[key]
 
     def handle_sync_data(self, request):
+        """
+        字数增量同步，支持批量与去重：
+        {"device_id": ..., "deltas": [{"seq", "increment", "duration", "timestamp", "local_date"}, ...]}
+        同一设备的 seq 单调递增，不大于高水位的增量视为重发直接丢弃。
+        旧版客户端把单条增量放在顶层且不带 device_id，照常入库。
+        """
         if not self.user_id: return None
-        increment = request.get('increment', 0)
-        duration = request.get('duration', 0)
-        client_ts = request.get('timestamp')
-        client_date_str = request.get('local_date')
-
-        if increment <= 0 and duration <= 0: return None
-
-        session = db_manager.get_session()
-        try:
-            if client_ts:
-                record_time = datetime.fromtimestamp(client_ts)
-            else:
-                record_time = datetime.now()
-
-            new_record = DetailRecord(
-                user_id=self.user_id,
-                word_increment=increment,
-                duration_seconds=duration,
-                source_type="client_sync",
-                end_time=record_time
-            )
-            session.add(new_record)
-
-            if client_date_str:
-                try:
-                    today = datetime.strptime(client_date_str, "%Y-%m-%d").date()
-                except ValueError:
-                    today = date.today()
-            else:
-                today = date.today()
-
-            daily = session.query(DailyReport).filter_by(user_id=self.user_id, report_date=today).first()
-            if not daily:
-                daily = DailyReport(user_id=self.user_id, report_date=today, total_words=0)
-                session.add(daily)
-            daily.total_words += increment
-
-            # 更新拼字房间进度
-            current_group_member = session.query(GroupMember).filter_by(user_id=self.user_id).first()
-            if current_group_member:
-                group_id = current_group_member.group_id
-                group = session.query(Group).get(group_id)
-
-                if group and group.sprint_active:
-                    sprint_score = session.query(SprintScore).filter_by(
-                        group_id=group_id, user_id=self.user_id
-                    ).first()
-
-                    if not sprint_score:
-                        sprint_score = SprintScore(group_id=group_id, user_id=self.user_id, current_score=0)
-                        session.add(sprint_score)
-
-                    sprint_score.current_score += increment
-
-                    members = session.query(GroupMember).filter_by(group_id=group_id).all()
-                    member_ids = [m.user_id for m in members]
-
-                    self.broadcast_to_users(member_ids, {"type": "sprint_status_push", "group_id": group_id})
-
-            session.commit()
-            return {"type": "response", "status": "ok", "msg": "Synced"}
-        finally:
-            session.close()
+        device_id = request.get('device_id')
+        deltas = request.get('deltas')
+        if deltas is None:
+            deltas = [request]
+        if device_id:
+            deltas = sorted(deltas, key=lambda d: d.get('seq') or 0)
+
+        def write(session):
+            # 在单写线程内执行，同一设备的增量天然串行，无需额外加锁
+            high_water = self._load_high_water(session, device_id) if device_id else 0
+            applied, duplicates = 0, 0
+            daily_increments = {}
+            rollup_entries = []
+            sprint_increment = 0
+
+            for delta in deltas:
+                seq = delta.get('seq')
+                if device_id:
+                    if seq is None or seq <= high_water:
+                        duplicates += 1
+                        continue
+                    high_water = seq
+
+                increment = delta.get('increment', 0)
+                duration = delta.get('duration', 0)
+                if increment <= 0 and duration <= 0: continue
+
+                client_ts = delta.get('timestamp')
+                end_time = datetime.fromtimestamp(client_ts) if client_ts else datetime.now()
+                session.add(DetailRecord(
+                    user_id=self.user_id,
+                    word_increment=increment,
+                    duration_seconds=duration,
+                    source_type="client_sync",
+                    end_time=end_time
+                ))
+                rollup_entries.append((end_time, increment, duration))
+                day = self._parse_local_date(delta.get('local_date'))
+                daily_increments[day] = daily_increments.get(day, 0) + increment
+                sprint_increment += increment
+                applied += 1
+
+            for day, increment in daily_increments.items():
+                daily = session.query(DailyReport).filter_by(user_id=self.user_id, report_date=day).first()
+                if not daily:
+                    daily = DailyReport(user_id=self.user_id, report_date=day, total_words=0)
+                    session.add(daily)
+                daily.total_words += increment
+            rollups.apply(session, self.user_id, rollup_entries)
+
+            if device_id:
+                session.query(SyncDevice).filter_by(user_id=self.user_id, device_id=device_id) \
+                    .update({"last_seq": high_water, "updated_at": datetime.now()})
+                device_high_water[(self.user_id, device_id)] = high_water
+            return high_water, applied, duplicates, sprint_increment
+
+        # 持有房间锁，保证拼字开始/结束与得分累加不交错 (得分只进内存排行榜，定期写回)
+        room = room_registry.room_of(self.user_id)
+        sprint_members = None
+        with room.lock if room else nullcontext():
+            sprint_group_id = room.group_id if room and room.sprint_active else None
+            try:
+                high_water, applied, duplicates, sprint_increment = db_manager.write(write)
+            except Exception:
+                # 缓存可能与库不一致，下次重新加载
+                device_high_water.pop((self.user_id, device_id), None)
+                raise
+            if applied:
+                change_counters.bump(("reports", self.user_id))
+            if sprint_group_id and sprint_increment:
+                room_registry.add_score(room, self.user_id, sprint_increment)
+                sprint_members = list(room.members)
+
+        if sprint_members:
+            self.broadcast_to_users(sprint_members, {"type": "sprint_status_push", "group_id": sprint_group_id})
+
+        # 客户端据此从离线队列中删除 seq 不大于确认值的增量
+        ack_seq = high_water if device_id else deltas[-1].get('seq') if deltas else None
+        return {"type": "sync_ack", "status": "ok", "msg": "Synced", "seq": ack_seq,
+                "applied": applied, "duplicates": duplicates}
 
     def handle_get_analytics(self, request):
+        """
+        热力图数据。带 encoding 时按 [from, to] (默认到今天为止的一年) 返回起始日 + 逐日字数的紧凑编码 (counts)，
+        客户端按年翻页时再取更早的区间；不带 encoding 的旧版客户端照旧返回最近一年的 {日期: 字数}
+        """
         if not self.user_id: return None
-        session = db_manager.get_session()
+        encoding = request.get('encoding')
+        if encoding is None:
+            # 结果是"最近一年"，日期变化也要换版本
+            return self.serve_versioned(request, ("get_analytics", self.user_id), [("reports", self.user_id)],
+                                        self.build_analytics, extra=str(date.today()))
         try:
-            one_year_ago = date.today() - timedelta(days=365)
+            end = date.fromisoformat(request['to']) if request.get('to') else date.today()
+            start = date.fromisoformat(request['from']) if request.get('from') else end - timedelta(days=365)
+        except (TypeError, ValueError):
+            start = end = None
+        if encoding != HeatmapCodec.ENCODING or not start or start > end or \
+                (end - start).days >= analytics.HEATMAP_MAX_DAYS:
+            return {"type": "analytics_data", "status": "fail", "msg": "Invalid range or encoding"}
+
+        def build():
+            counts = self.read_with_archive(start, end, lambda session, archived: analytics.daily_counts(
+                session, self.user_id, start, end, archived))
+            return {"type": "analytics_data", "status": "success", "from": str(start), "to": str(end),
+                    "encoding": encoding, "counts": HeatmapCodec.encode(counts)}
+
+        # 默认区间随日期移动：区间也计入版本号，跨过午夜后旧版本不再命中
+        scope = ("get_analytics", self.user_id, str(start), str(end), encoding)
+        return self.serve_versioned(request, scope, [("reports", self.user_id)], build,
+                                    extra=(str(start), str(end)))
+
+    def read_with_archive(self, start, end, read):
+        """
+        read(session, archived) 同时读库里的行与 [start, end] 内的冷归档
+        经 cold_archive.consistent 执行：归档搬移前后的两边不会混读 (重复计数或漏数)
+        """
+        def attempt():
+            session = db_manager.get_read_session()
+            try:
+                return read(session, cold_archive.range(db_manager, self.user_id, start, end))
+            finally:
+                session.close()
+        return cold_archive.consistent(self.user_id, attempt)
+
+    def build_analytics(self):
+        today = date.today()
+        one_year_ago = today - timedelta(days=365)
+
+        def read(session, archived):
+            heatmap = archived_daily_totals(archived)
             reports = session.query(DailyReport).filter(
                 DailyReport.user_id == self.user_id,
                 DailyReport.report_date >= one_year_ago
             ).all()
-            heatmap = {str(r.report_date): r.total_words for r in reports}
-            return {"type": "analytics_data", "heatmap": heatmap}
-        finally:
-            session.close()
+            for r in reports:
+                key = str(r.report_date)
+                heatmap[key] = heatmap.get(key, 0) + r.total_words
+            return heatmap
+
+        return {"type": "analytics_data", "heatmap": self.read_with_archive(one_year_ago, today, read)}
+
+    def handle_get_analytics_series(self, request):
+        """
+        按时间桶汇总字数：from/to 为 YYYY-MM-DD (默认最近一年)，granularity 为 day/week/month/year
+        返回等长的 buckets (桶起始日) 与 values 数组
+        """
+        if not self.user_id: return None
+        granularity = request.get('granularity') or "day"
+        try:
+            end = date.fromisoformat(request['to']) if request.get('to') else date.today()
+            start = date.fromisoformat(request['from']) if request.get('from') else end - timedelta(days=364)
+        except (TypeError, ValueError):
+            start = end = None
+        if granularity not in analytics.GRANULARITIES or not start or start > end:
+            return {"type": "analytics_series", "status": "fail", "msg": "Invalid range or granularity"}
+        if analytics.bucket_count(start, end, granularity) > analytics.MAX_BUCKETS:
+            return {"type": "analytics_series", "status": "fail", "msg": "Range too large for granularity"}
+
+        def build():
+            buckets, values = self.read_with_archive(start, end, lambda session, archived: analytics.series(
+                session, self.user_id, start, end, granularity, archived))
+            return {"type": "analytics_series", "status": "success", "from": str(start), "to": str(end),
+                    "granularity": granularity, "buckets": buckets, "values": values}
+
+        # 默认区间随日期移动：区间也计入版本号，跨过午夜后旧版本不再命中
+        scope = ("get_analytics_series", self.user_id, str(start), str(end), granularity)
+        return self.serve_versioned(request, scope, [("reports", self.user_id)], build,
+                                    extra=(str(start), str(end)))
+
+    def handle_get_productive_hours(self, request):
+        """
+        一天中各小时的字数/时长合计 (最高产时段)：from/to 为 YYYY-MM-DD (默认最近 90 天)
+        只读 hourly_rollups，不扫明细表
+        """
+        if not self.user_id: return None
+        try:
+            end = date.fromisoformat(request['to']) if request.get('to') else date.today()
+            start = date.fromisoformat(request['from']) if request.get('from') else end - timedelta(days=89)
+        except (TypeError, ValueError):
+            start = end = None
+        if not start or start > end:
+            return {"type": "productive_hours", "status": "fail", "msg": "Invalid range"}
+
+        def build():
+            session = db_manager.get_read_session()
+            try:
+                words, durations = rollups.productive_hours(session, self.user_id, start, end)
+            finally:
+                session.close()
+            best = max(range(24), key=lambda h: words[h]) if any(words) else None
+            return {"type": "productive_hours", "status": "success", "from": str(start), "to": str(end),
+                    "words": words, "durations": durations, "best_hour": best}
+
+        # 默认区间随日期移动：区间也计入版本号，跨过午夜后旧版本不再命中
+        scope = ("get_productive_hours", self.user_id, str(start), str(end))
+        return self.serve_versioned(request, scope, [("reports", self.user_id)], build,
+                                    extra=(str(start), str(end)))
 
     def handle_get_details(self, request):
         if not self.user_id: return None
-        session = db_manager.get_session()
+        return self.serve_versioned(request, ("get_details", self.user_id), [("reports", self.user_id)],
+                                    self.build_details)
+
+    def build_details(self):
+        session = db_manager.get_read_session()
         try:
             records = session.query(DetailRecord).filter_by(user_id=self.user_id) \
                 .order_by(DetailRecord.end_time.desc()) \
@@ -272,7 +549,7 @@ class ClientHandler(threading.Thread):
 
     def handle_send_reset_code(self, request):
         username = request.get('username')
-        session = db_manager.get_session()
+        session = db_manager.get_read_session()
         try:
             user = session.query(User).filter_by(username=username).first()
             if not user or not user.email:
@@ -293,17 +570,17 @@ class ClientHandler(threading.Thread):
         record = verification_codes.get(username)
         if not record or time.time() - record['time'] > 600 or record['code'] != code:
             return {"type": "reset_response", "status": "fail", "msg": "验证码无效或已过期"}
-        session = db_manager.get_session()
-        try:
+
+        def write(session):
             user = session.query(User).filter_by(username=username).first()
-            if user:
-                user.password_hash = new_pw
-                session.commit()
-                del verification_codes[username]
-                return {"type": "reset_response", "status": "success", "msg": "重置成功"}
-            return {"type": "reset_response", "status": "fail", "msg": "用户错误"}
-        finally:
-            session.close()
+            if not user: return False
+            user.password_hash = new_pw
+            return True
+
+        if db_manager.write(write):
+            verification_codes.pop(username, None)
+            return {"type": "reset_response", "status": "success", "msg": "重置成功"}
+        return {"type": "reset_response", "status": "fail", "msg": "用户错误"}
 
     def handle_update_profile(self, request):
         if not self.user_id: return None
@@ -311,65 +588,70 @@ class ClientHandler(threading.Thread):
         new_email = request.get('email')
         new_signature = request.get('signature')
         avatar_b64 = request.get('avatar_data')
-        session = db_manager.get_session()
-        try:
+
+        avatar_fname = None
+        if avatar_b64:
+            avatar_fname = f"user_{self.user_id}.png"
+            path = os.path.join(AVATAR_DIR, avatar_fname)
+            with open(path, "wb") as f:
+                f.write(base64.b64decode(avatar_b64))
+
+        def write(session):
             user = session.query(User).filter_by(id=self.user_id).first()
-            if user:
-                if new_nick: user.nickname = new_nick
-                if new_email is not None: user.email = new_email.strip() or None
-                if new_signature is not None: user.signature = new_signature.strip()
-                if avatar_b64:
-                    fname = f"user_{self.user_id}.png"
-                    path = os.path.join(AVATAR_DIR, fname)
-                    with open(path, "wb") as f:
-                        f.write(base64.b64decode(avatar_b64))
-                    user.avatar_url = fname
-                session.commit()
-                return {"type": "profile_updated", "status": "success"}
-            return {"type": "response", "status": "error"}
-        finally:
-            session.close()
+            if not user: return None
+            if new_nick: user.nickname = new_nick
+            if new_email is not None: user.email = new_email.strip() or None
+            if new_signature is not None: user.signature = new_signature.strip()
+            if avatar_fname: user.avatar_url = avatar_fname
+            return user.username
+
+        username = db_manager.write(write)
+        if username:
+            if new_nick:
+                self.nickname = new_nick
+                user_index.put(db_manager, self.user_id, username, new_nick)
+            self.bump_related(self.user_id, include_requests=True)
+            room = room_registry.room_of(self.user_id)
+            if room and room.owner_id == self.user_id:
+                with room.lock:
+                    if new_nick: room.owner_nickname = new_nick
+                    if avatar_fname: room.owner_avatar_url = avatar_fname
+            if avatar_fname: lobby.forget_avatar(avatar_fname)
+            change_counters.bump(LOBBY_KEY)  # 房主昵称/头像出现在大厅
+            return {"type": "profile_updated", "status": "success"}
+        return {"type": "response", "status": "error"}
 
     def handle_search_user(self, request):
-        target_query = request.get('query')
-        session = db_manager.get_session()
+        """按 ID、用户名或昵称搜索 (前缀/子串/模糊)，结果排好序按 offset 分页"""
+        query = request.get('query')
         try:
-            try:
-                target_id = int(target_query)
-                is_numeric = True
-            except ValueError:
-                target_id = None
-                is_numeric = False
-
-            filter_conditions = (User.username == target_query) | (User.nickname == target_query)
-            if is_numeric:
-                filter_conditions = filter_conditions | (User.id == target_id)
-
-            user = session.query(User).filter(filter_conditions).first()
-
-            if user:
-                return {
-                    "type": "search_user_response",
-                    "status": "success",
-                    "data": {"id": user.id, "username": user.username, "nickname": user.nickname}
-                }
-            return {"type": "search_user_response", "status": "fail", "msg": "User not found"}
-        finally:
-            session.close()
+            offset = max(int(request.get('offset') or 0), 0)
+            limit = min(max(int(request.get('limit') or USER_SEARCH_PAGE_SIZE), 1), USER_SEARCH_PAGE_MAX)
+        except (TypeError, ValueError):
+            offset, limit = 0, USER_SEARCH_PAGE_SIZE
+
+        user_index.ensure(db_manager)
+        users, has_more = user_index.search(query, offset, limit)
+        if not users:
+            return {"type": "search_user_response", "status": "fail", "msg": "User not found",
+                    "data": [], "offset": offset, "has_more": False}
+        return {
+            "type": "search_user_response",
+            "status": "success",
+            "data": [{"id": uid, "username": username, "nickname": nickname} for uid, username, nickname in users],
+            "offset": offset,
+            "has_more": has_more
+        }
 
     def handle_add_friend(self, request):
         if not self.user_id: return None
         friend_id = request.get('friend_id')
-        session = db_manager.get_session()
-        try:
-            if friend_id == self.user_id:
-                return {"type": "response", "status": "fail", "msg": "Cannot add yourself"}
-
-            id1, id2 = sorted([self.user_id, friend_id])
-            is_friend = session.query(Friendship).filter_by(user_a_id=id1, user_b_id=id2).first()
-            if is_friend:
-                return {"type": "response", "status": "fail", "msg": "Already friends"}
+        if friend_id == self.user_id:
+            return {"type": "response", "status": "fail", "msg": "Cannot add yourself"}
+        if friend_graph.are_friends(db_manager, self.user_id, friend_id):
+            return {"type": "response", "status": "fail", "msg": "Already friends"}
 
+        def write(session):
             pending = session.query(FriendRequest).filter(
                 ((FriendRequest.sender_id == self.user_id) & (FriendRequest.receiver_id == friend_id)) |
                 ((FriendRequest.sender_id == friend_id) & (FriendRequest.receiver_id == self.user_id))
@@ -377,43 +659,44 @@ class ClientHandler(threading.Thread):
             if pending:
                 return {"type": "response", "status": "fail", "msg": "Request already sent or pending response"}
 
-            new_request = FriendRequest(sender_id=self.user_id, receiver_id=friend_id)
-            session.add(new_request)
-            session.commit()
+            session.add(FriendRequest(sender_id=self.user_id, receiver_id=friend_id))
+            return {"type": "response", "status": "success", "msg": "Request sent"}
 
+        response = db_manager.write(write)
+        if response["status"] == "success":
+            change_counters.bump(("friend_requests", friend_id))
             self.broadcast_to_users([friend_id], {"type": "refresh_friend_requests"})
-
-            return {"type": "response", "status": "success", "msg": "Request sent"}
-        finally:
-            session.close()
+        return response
 
     def handle_delete_friend(self, request):
         if not self.user_id: return None
         friend_id = request.get('friend_id')
-        session = db_manager.get_session()
-        try:
-            id1, id2 = sorted([self.user_id, friend_id])
+        id1, id2 = sorted([self.user_id, friend_id])
+
+        def write(session):
             session.query(Friendship).filter_by(user_a_id=id1, user_b_id=id2).delete()
-            session.commit()
-            return {"type": "delete_friend_response", "status": "success", "msg": "Friend deleted"}
-        finally:
-            session.close()
+
+        db_manager.write(write)
+        friend_graph.remove(db_manager, self.user_id, friend_id)
+        change_counters.bump(("friends", self.user_id), ("friends", friend_id))
+        return {"type": "delete_friend_response", "status": "success", "msg": "Friend deleted"}
 
     def handle_get_friend_requests(self, request):
         if not self.user_id: return None
-        session = db_manager.get_session()
+        return self.serve_versioned(request, ("get_friend_requests", self.user_id),
+                                    [("friend_requests", self.user_id)], self.build_friend_requests)
+
+    def build_friend_requests(self):
+        session = db_manager.get_read_session()
         try:
-            reqs = session.query(FriendRequest).filter_by(receiver_id=self.user_id).all()
             data = []
-            for r in reqs:
-                sender = session.query(User).get(r.sender_id)
-                if sender:
-                    data.append({
-                        "request_id": r.id,
-                        "user_id": sender.id,
-                        "username": sender.username,
-                        "nickname": sender.nickname
-                    })
+            for r, sender in queries.incoming_friend_requests(session, self.user_id):
+                data.append({
+                    "request_id": r.id,
+                    "user_id": sender.id,
+                    "username": sender.username,
+                    "nickname": sender.nickname
+                })
             return {"type": "friend_requests_response", "data": data}
         finally:
             session.close()
@@ -422,56 +705,62 @@ class ClientHandler(threading.Thread):
         if not self.user_id: return None
         request_id = request.get('request_id')
         action = request.get('action')
-        session = db_manager.get_session()
-        try:
+
+        def write(session):
             friend_req = session.query(FriendRequest).get(request_id)
             if not friend_req or friend_req.receiver_id != self.user_id:
-                return {"type": "response", "status": "fail", "msg": "Invalid request"}
+                return None
 
             sender_id = friend_req.sender_id
-
             if action == 'accept':
                 id1, id2 = sorted([self.user_id, sender_id])
                 existing_friendship = session.query(Friendship).filter_by(user_a_id=id1, user_b_id=id2).first()
                 if not existing_friendship:
-                    new_friendship = Friendship(user_a_id=id1, user_b_id=id2)
-                    session.add(new_friendship)
+                    session.add(Friendship(user_a_id=id1, user_b_id=id2))
                 session.delete(friend_req)
-                session.commit()
-                self.broadcast_to_users([self.user_id, sender_id], {"type": "refresh_friends"})
-
             elif action == 'reject':
                 session.delete(friend_req)
-                session.commit()
-                self.broadcast_to_users([self.user_id], {"type": "refresh_friend_requests"})
+            return sender_id
 
-            return {"type": "response", "status": "success"}
-        finally:
-            session.close()
+        sender_id = db_manager.write(write)
+        if sender_id is None:
+            return {"type": "response", "status": "fail", "msg": "Invalid request"}
+        change_counters.bump(("friend_requests", self.user_id))
+        if action == 'accept':
+            friend_graph.add(db_manager, self.user_id, sender_id)
+            change_counters.bump(("friends", self.user_id), ("friends", sender_id))
+
+        if action == 'accept':
+            self.broadcast_to_users([self.user_id, sender_id], {"type": "refresh_friends"})
+        elif action == 'reject':
+            self.broadcast_to_users([self.user_id], {"type": "refresh_friend_requests"})
+
+        return {"type": "response", "status": "success"}
 
     def handle_get_friends(self, request):
         if not self.user_id: return None
-        session = db_manager.get_session()
+        return self.serve_versioned(request, ("get_friends", self.user_id), [("friends", self.user_id)],
+                                    self.build_friends)
+
+    def build_friends(self):
+        friend_ids = friend_graph.friends(db_manager, self.user_id)
+        if not friend_ids:
+            return {"type": "get_friends_response", "data": []}
+        online = set(friend_graph.online_friends(db_manager, self.user_id, presence.online))
+        session = db_manager.get_read_session()
         try:
-            friends_rels = session.query(Friendship).filter(
-                (Friendship.user_a_id == self.user_id) | (Friendship.user_b_id == self.user_id)
-            ).all()
-
             friend_list = []
-            for rel in friends_rels:
-                friend_id = rel.user_b_id if rel.user_a_id == self.user_id else rel.user_a_id
-                u = session.query(User).get(friend_id)
-                if u:
-                    status = "Online" if u.id in connected_clients else "Offline"
-                    avatar_data = self.load_avatar_base64(u.avatar_url)
-                    friend_list.append({
-                        "id": u.id,
-                        "username": u.username,
-                        "nickname": u.nickname,
-                        "signature": u.signature,  # 返回个性签名
-                        "avatar_data": avatar_data,  # 返回头像
-                        "status": status
-                    })
+            for u in queries.users_by_ids(session, friend_ids):
+                status = "Online" if u.id in online else "Offline"
+                avatar_data = self.load_avatar_base64(u.avatar_url)
+                friend_list.append({
+                    "id": u.id,
+                    "username": u.username,
+                    "nickname": u.nickname,
+                    "signature": u.signature,  # 返回个性签名
+                    "avatar_data": avatar_data,  # 返回头像
+                    "status": status
+                })
             return {"type": "get_friends_response", "data": friend_list}
         finally:
             session.close()
@@ -490,255 +779,281 @@ class ClientHandler(threading.Thread):
         if password and not password.strip():
             password = None
 
-        session = db_manager.get_session()
-        try:
-            current = session.query(GroupMember).filter_by(user_id=self.user_id).first()
-            if current:
-                return {
-                    "type": "create_group_response",
-                    "status": "fail",
-                    "msg": "You are already in a group.",
-                    "current_group_id": current.group_id
-                }
+        current = room_registry.room_of(self.user_id)
+        if current:
+            return {
+                "type": "create_group_response",
+                "status": "fail",
+                "msg": "You are already in a group.",
+                "current_group_id": current.group_id
+            }
 
+        def write(session):
             new_group = Group(name=name, owner_id=self.user_id, is_private=is_private, password=password)
             session.add(new_group)
             session.flush()
+            session.add(GroupMember(group_id=new_group.id, user_id=self.user_id))
+            return RoomState.from_group(new_group, session.get(User, self.user_id))
 
-            member = GroupMember(group_id=new_group.id, user_id=self.user_id)
-            session.add(member)
-            session.commit()
+        room = db_manager.write(write)
+        room.members.add(self.user_id)
+        room_registry.add_room(room)
 
-            # 无论是否私密，创建成功后可能都需要更新客户端列表（私密对好友可见）
-            self.broadcast_to_all({"type": "refresh_groups"})
+        # 私密房间只推给房主的好友
+        self.publish_lobby("added", room)
 
-            return {"type": "create_group_response", "status": "success", "group_id": new_group.id, "group_name": name}
-        finally:
-            session.close()
+        return {"type": "create_group_response", "status": "success", "group_id": room.group_id, "group_name": name}
 
     def handle_join_group(self, request):
         if not self.user_id: return None
         group_id = request.get('group_id')
         input_password = request.get('password')
 
-        session = db_manager.get_session()
-        try:
-            current = session.query(GroupMember).filter_by(user_id=self.user_id).first()
-            if current:
-                if current.group_id == group_id:
-                    return {"type": "join_group_response", "status": "success", "group_id": group_id}
-                else:
-                    return {
-                        "type": "join_group_response",
-                        "status": "fail",
-                        "msg": "You are already in another group.",
-                        "current_group_id": current.group_id
-                    }
+        current = room_registry.room_of(self.user_id)
+        if current:
+            if current.group_id == group_id:
+                return {"type": "join_group_response", "status": "success", "group_id": group_id}
+            else:
+                return {
+                    "type": "join_group_response",
+                    "status": "fail",
+                    "msg": "You are already in another group.",
+                    "current_group_id": current.group_id
+                }
 
-            group = session.query(Group).get(group_id)
-            if not group:
+        room = room_registry.get(group_id)
+        if not room:
+            return {"type": "join_group_response", "status": "fail", "msg": "Group not found"}
+
+        with room.lock:
+            # 拿到锁之前房间可能已被解散
+            if room_registry.get(group_id) is not room:
                 return {"type": "join_group_response", "status": "fail", "msg": "Group not found"}
 
             # 1. 检查是否正在拼字 (Sprint Active)
-            if group.sprint_active:
+            if room.sprint_active:
                 return {"type": "join_group_response", "status": "fail", "msg": "Room is currently sprinting"}
 
             # 2. 检查密码
-            if group.password:
-                if not input_password or input_password != group.password:
+            if room.password:
+                if not input_password or input_password != room.password:
                     return {"type": "join_group_response", "status": "fail",
                             "msg": "password_required" if not input_password else "Incorrect password"}
 
-            count = session.query(GroupMember).filter_by(group_id=group_id).count()
-            if count >= 10:
-                return {"type": "join_group_response", "status": "fail", "msg": "Group is full (Max 10)"}
+            if len(room.members) >= MAX_MEMBERS:
+                return {"type": "join_group_response", "status": "fail", "msg": f"Group is full (Max {MAX_MEMBERS})"}
 
-            new_mem = GroupMember(group_id=group_id, user_id=self.user_id)
-            session.add(new_mem)
+            now = datetime.now()
 
-            group.updated_at = datetime.now()
-            session.commit()
+            def write(session):
+                session.add(GroupMember(group_id=group_id, user_id=self.user_id))
+                session.query(Group).filter_by(id=group_id).update({"updated_at": now})
 
-            self.broadcast_to_all({"type": "refresh_groups"})
+            db_manager.write(write)
+            room.updated_at = now
+            room_registry.add_member(room, self.user_id)
+            member_count = len(room.members)
 
-            return {"type": "join_group_response", "status": "success", "group_id": group_id}
-        finally:
-            session.close()
+        self.publish_lobby("updated", room, member_count=member_count)
+
+        return {"type": "join_group_response", "status": "success", "group_id": group_id}
 
     def handle_leave_group(self, request):
         if not self.user_id: return None
         group_id = request.get('group_id')
-        session = db_manager.get_session()
-        try:
-            group = session.query(Group).get(group_id)
-            if group and group.owner_id == self.user_id:
-                # 房主离开，解散房间
-                session.delete(group)
-                session.commit()
-                # 获取该房间所有成员并通知
-                members = session.query(GroupMember).filter_by(group_id=group_id).all()
-                member_ids = [m.user_id for m in members]  # 此时已被级联删除，需注意逻辑
-                # 因为 delete group 会级联删除 members，所以需要在 delete 前获取 members
-                # 但上面 session.delete(group) 已经执行，但只要没 commit，session 内可能还有状态
-                # 最好的方式是先把 IDs 查出来
-                # 上面代码逻辑有点问题，session.delete(group) 后 members 可能访问不到。
-                # 修正：应该在 delete 前查 ID。
-                # 这里做简化，假设客户端收到 group_disbanded 会自己处理
-                self.broadcast_to_all({"type": "refresh_groups"})
-                # 这里发送解散广播有点晚了，因为 member 记录已被删。
-                # 客户端轮询或收到 refresh_groups 发现自己不在房间即可。
-                # 或者在 delete 前查询 member_ids
-                return {"type": "leave_group_response", "status": "success", "msg": "Group disbanded"}
-
-            # 普通成员离开
+        room = room_registry.get(group_id)
+
+        if room and room.owner_id == self.user_id:
+            # 房主离开，解散房间 (成员随房间级联删除)
+            def disband(session):
+                group = session.query(Group).get(group_id)
+                if group: session.delete(group)
+
+            with room.lock:
+                db_manager.write(disband)
+                room_registry.remove_room(group_id)
+                members = [uid for uid in room.members if uid != self.user_id]
+            self.publish_lobby("removed", room)
+            self.broadcast_to_users(members, {"type": "group_disbanded", "group_id": group_id})
+            return {"type": "leave_group_response", "status": "success", "msg": "Group disbanded"}
+
+        # 普通成员离开
+        def leave(session):
             session.query(GroupMember).filter_by(user_id=self.user_id, group_id=group_id).delete()
             session.query(SprintScore).filter_by(user_id=self.user_id, group_id=group_id).delete()
-            session.commit()
 
-            self.broadcast_to_all({"type": "refresh_groups"})
-            self.broadcast_to_users(
-                [m.user_id for m in session.query(GroupMember).filter_by(group_id=group_id).all()],
-                {"type": "sprint_status_push", "group_id": group_id}
-            )
+        remaining = []
+        if room:
+            with room.lock:
+                db_manager.write(leave)
+                room_registry.remove_member(room, self.user_id)
+                remaining = list(room.members)
+            self.publish_lobby("updated", room, member_count=len(remaining))
+        else:
+            db_manager.write(leave)
 
-            return {"type": "leave_group_response", "status": "success"}
-        finally:
-            session.close()
+        self.broadcast_to_users(remaining, {"type": "sprint_status_push", "group_id": group_id})
+
+        return {"type": "leave_group_response", "status": "success"}
 
     def handle_get_lobby_data(self, request):
-        """获取大厅数据：公开房间 + 自己的私密房间 + 好友的私密房间"""
+        """
+        获取大厅数据：公开房间 + 自己的私密房间 + 好友的私密房间
+        可选参数：cursor (上一页返回的 next_cursor)、limit、filters {has_space, not_sprinting, no_password}、query (房间名)
+        """
         if not self.user_id: return None
-        session = db_manager.get_session()
-        try:
-            # 1. 获取好友 ID 列表
-            friends_rels = session.query(Friendship).filter(
-                (Friendship.user_a_id == self.user_id) | (Friendship.user_b_id == self.user_id)
-            ).all()
-            friend_ids = []
-            for rel in friends_rels:
-                friend_ids.append(rel.user_b_id if rel.user_a_id == self.user_id else rel.user_a_id)
-
-            # 包括自己
-            allowed_ids = friend_ids + [self.user_id]
-
-            # 2. 查询所有符合条件的房间
-            # 条件：(公开) OR (私密 AND 房主是好友或自己)
-            groups = session.query(Group).filter(
-                or_(
-                    Group.is_private == False,
-                    and_(Group.is_private == True, Group.owner_id.in_(allowed_ids))
-                )
-            ).order_by(Group.updated_at.desc()).limit(50).all()
+        params = {k: request[k] for k in ("cursor", "limit", "filters", "query") if request.get(k)}
+        scope = ("get_public_groups", self.user_id, json.dumps(params, sort_keys=True))
+        return self.serve_versioned(request, scope, [LOBBY_KEY, ("friends", self.user_id)],
+                                    lambda: self.build_lobby(params))
 
-            data = []
-            for g in groups:
-                count = session.query(GroupMember).filter_by(group_id=g.id).count()
-                owner = session.query(User).get(g.owner_id)
-                owner_nick = owner.nickname if owner else "Unknown"
-                owner_avatar = self.load_avatar_base64(owner.avatar_url) if owner else ""
+    def handle_lobby_subscribe(self, request):
+        """打开大厅时订阅房间卡片增量，同时返回当前大厅 (带版本号，未变化时只回 not_modified)"""
+        if not self.user_id: return None
+        lobby.subscribe(self.user_id)
+        return self.handle_get_lobby_data(request)
 
-                data.append({
-                    "id": g.id,
-                    "name": g.name,
-                    "member_count": count,
-                    "updated_at": g.updated_at.strftime("%H:%M"),
-                    "owner_nickname": owner_nick,
-                    "owner_avatar": owner_avatar,
-                    "has_password": True if g.password else False,
-                    "is_private": g.is_private,
-                    "sprint_active": g.sprint_active
-                })
-            return {"type": "group_list_response", "data": data}
-        finally:
-            session.close()
+    def handle_lobby_unsubscribe(self, request):
+        if not self.user_id: return None
+        lobby.unsubscribe(self.user_id)
+        return {"type": "lobby_unsubscribe_response", "status": "success"}
+
+    def build_lobby(self, params):
+        try:
+            limit = min(max(int(params.get('limit') or LOBBY_PAGE_SIZE), 1), LOBBY_PAGE_MAX)
+        except (TypeError, ValueError):
+            limit = LOBBY_PAGE_SIZE
+        filters = params.get('filters') if isinstance(params.get('filters'), dict) else {}
+        data, next_cursor = lobby.page(db_manager, change_counters.get(LOBBY_KEY), self.user_id, limit=limit,
+                                       cursor=params.get('cursor'), filters=filters, query=params.get('query'))
+        # append：带游标的请求是"加载更多"，客户端追加到列表末尾
+        return {"type": "group_list_response", "data": data, "next_cursor": next_cursor,
+                "append": bool(params.get('cursor'))}
 
     def handle_send_group_msg(self, request):
         if not self.user_id: return None
         group_id = request.get('group_id')
         content = request.get('content')
-        session = db_manager.get_session()
-        try:
-            member = session.query(GroupMember).filter_by(group_id=group_id, user_id=self.user_id).first()
-            if not member: return
-            user = session.query(User).get(self.user_id)
-            msg = GroupMessage(group_id=group_id, user_id=self.user_id, user_nickname=user.nickname, content=content)
+        room = room_registry.get(group_id)
+        if not room or not room_registry.is_member(group_id, self.user_id): return
+        nickname = self.nickname or self.username
+        now = datetime.now()
+
+        def write(session):
+            msg = GroupMessage(group_id=group_id, user_id=self.user_id, user_nickname=nickname,
+                               content=content, timestamp=now)
             session.add(msg)
-            group = session.query(Group).get(group_id)
-            group.updated_at = datetime.now()
-            session.commit()
-            members = session.query(GroupMember).filter_by(group_id=group_id).all()
-            member_ids = [m.user_id for m in members]
-            push_msg = {
-                "type": "group_msg_push",
-                "group_id": group_id,
-                "sender": user.nickname,
-                "content": content,
-                "time": time.time()
-            }
-            self.broadcast_to_users(member_ids, push_msg)
-        finally:
-            session.close()
+            session.query(Group).filter_by(id=group_id).update({"updated_at": now})
+            session.flush()
+            return message_to_dict(msg)
+
+        # 持有房间锁，保证消息按 id 顺序进入环形缓冲区
+        with room.lock:
+            message = db_manager.write(write)
+            room_registry.add_message(room, message)
+            room.updated_at = now
+        change_counters.bump(LOBBY_KEY)  # 大厅按最近活跃排序
+        push_msg = dict(message, type="group_msg_push", group_id=group_id)
+        self.broadcast_to_users(room_registry.members(group_id), push_msg)
+
+    def handle_get_group_messages(self, request):
+        """
+        聊天记录分页 (按消息 id 游标)：
+        since_id 取之后的新消息，before_id 向上翻页，都不带则取最近一页。
+        优先从房间环形缓冲区读取，缓冲区覆盖不到时查库。
+        """
+        if not self.user_id: return None
+        group_id = request.get('group_id')
+        room = room_registry.get(group_id)
+        if not room or not room_registry.is_member(group_id, self.user_id):
+            return {"type": "group_messages_response", "status": "fail", "group_id": group_id, "messages": []}
+
+        since_id = request.get('since_id')
+        before_id = request.get('before_id')
+        try:
+            limit = min(max(int(request.get('limit') or CHAT_PAGE_SIZE), 1), CHAT_PAGE_MAX)
+        except (TypeError, ValueError):
+            limit = CHAT_PAGE_SIZE
+
+        page = room_registry.message_page(room, since_id, before_id, limit)
+        if page is None:
+            session = db_manager.get_read_session()
+            try:
+                rows = queries.group_messages(session, group_id, since_id, before_id, limit + 1)
+            finally:
+                session.close()
+            has_more = len(rows) > limit
+            rows = rows[:limit] if since_id is not None else rows[-limit:]
+            page = [message_to_dict(m) for m in rows], has_more
+
+        messages, has_more = page
+        return {"type": "group_messages_response", "status": "success", "group_id": group_id,
+                "messages": messages, "has_more": has_more,
+                "direction": "newer" if since_id is not None else "older"}
 
     def handle_get_group_detail(self, request):
         group_id = request.get('group_id')
         if not group_id: return None
-        session = db_manager.get_session()
-        try:
-            group = session.query(Group).get(group_id)
-            if not group: return None
-
-            two_days_ago = datetime.now() - timedelta(days=2)
-            msgs = session.query(GroupMessage).filter(
-                GroupMessage.group_id == group_id,
-                GroupMessage.timestamp >= two_days_ago
-            ).order_by(GroupMessage.timestamp.asc()).all()
-
-            chat_history = [{
-                "sender": m.user_nickname,
-                "content": m.content,
-                "time": m.timestamp.timestamp()
-            } for m in msgs]
-
-            members = session.query(GroupMember).filter_by(group_id=group_id).all()
-            member_ids = [m.user_id for m in members]
-            scores = session.query(SprintScore).filter(
-                SprintScore.group_id == group_id,
-                SprintScore.user_id.in_(member_ids)
-            ).all()
-            score_map = {s.user_id: s.current_score for s in scores}
+        room = room_registry.get(group_id)
+        if not room: return None
+
+        with room.lock:
+            # 排行榜增量维护，无变更时直接复用缓存的快照；没有得分记录的成员按 0 分排在最后
+            ranked = room.leaderboard.snapshot()
+            unranked = sorted(room.members - room.leaderboard.scores.keys())
+            sprint_active = room.sprint_active
+            sprint_target = room.sprint_target_words
+            name, owner_id = room.name, room.owner_id
+
+        rows = [(e["user_id"], e["word_count"], e["rank"], e["reached_target"]) for e in ranked]
+        rows += [(uid, 0, len(ranked) + i + 1, False) for i, uid in enumerate(unranked)]
+        limit = request.get('limit')
+        if limit:
+            try:
+                limit = max(1, min(int(limit), MAX_MEMBERS))
+            except (TypeError, ValueError):
+                return {"type": "group_detail_response", "status": "fail", "group_id": group_id, "msg": "Invalid limit"}
+            rows = rows[:limit]
 
-            leaderboard = []
-            owner_avatar_data = ""
-            for m in members:
-                user = session.query(User).get(m.user_id)
-                word_count = score_map.get(m.user_id, 0)
-                avatar_data = self.load_avatar_base64(user.avatar_url)
+        # 聊天记录改由 get_group_messages 分页获取，旧客户端仍从缓冲区拿最近一页
+        chat_history = []
+        if request.get('include_chat', True):
+            chat_history, _ = room_registry.message_page(room, limit=CHAT_PAGE_SIZE) or ([], False)
 
-                if user.id == group.owner_id:
-                    owner_avatar_data = avatar_data
+        session = db_manager.get_read_session()
+        try:
+            ids = [r[0] for r in rows]
+            if owner_id not in ids: ids.append(owner_id)
+            users = {u.id: u for u in session.query(User).filter(User.id.in_(ids)).all()}
+
+            owner = users.get(owner_id)
+            owner_avatar_data = self.load_avatar_base64(owner.avatar_url) if owner else ""
 
-                is_online = m.user_id in connected_clients
+            leaderboard = []
+            for user_id, word_count, rank, reached in rows:
+                user = users.get(user_id)
+                if not user: continue
                 leaderboard.append({
                     "user_id": user.id,  # 关键：返回 ID 以便添加好友
                     "nickname": user.nickname,
                     "word_count": word_count,
-                    "is_online": is_online,
-                    "avatar_data": avatar_data,
-                    "reached_target": (word_count >= group.sprint_target_words) if group.sprint_active else False
+                    "rank": rank,
+                    "is_online": presence.is_online(user.id),
+                    "avatar_data": owner_avatar_data if user.id == owner_id else self.load_avatar_base64(user.avatar_url),
+                    "reached_target": reached and sprint_active
                 })
 
-            leaderboard.sort(key=lambda x: x['word_count'], reverse=True)
-
             return {
                 "type": "group_detail_response",
                 "group_id": group_id,
-                "name": group.name,
-                "owner_id": group.owner_id,
+                "name": name,
+                "owner_id": owner_id,
                 "owner_avatar": owner_avatar_data,
-                "sprint_active": group.sprint_active,
-                "sprint_target": group.sprint_target_words,
+                "sprint_active": sprint_active,
+                "sprint_target": sprint_target,
                 "chat_history": chat_history,
-                "leaderboard": leaderboard
+                "leaderboard": leaderboard,
+                "member_count": len(ranked) + len(unranked)
             }
         finally:
             session.close()
@@ -748,51 +1063,57 @@ class ClientHandler(threading.Thread):
         group_id = request.get('group_id')
         action = request.get('action')
         target = request.get('target', 0)
-        session = db_manager.get_session()
-        try:
-            group = session.query(Group).get(group_id)
-            if group.owner_id != self.user_id:
-                return {"type": "response", "msg": "Only owner can control sprint"}
+        room = room_registry.get(group_id)
+        if not room or room.owner_id != self.user_id:
+            return {"type": "response", "msg": "Only owner can control sprint"}
+
+        now = datetime.now()
+        if action == 'start':
+            msg_content = f"📢 拼字开始！目标: {target}字"
+        else:
+            msg_content = f"🛑 拼字结束。"
 
+        def write(session):
+            group = session.query(Group).get(group_id)
             if action == 'start':
                 session.query(SprintScore).filter_by(group_id=group_id).delete()
                 group.sprint_active = True
-                group.sprint_start_time = datetime.now()
+                group.sprint_start_time = now
                 group.sprint_target_words = target
-                msg_content = f"📢 拼字开始！目标: {target}字"
             else:
                 group.sprint_active = False
-                msg_content = f"🛑 拼字结束。"
 
             sys_msg = GroupMessage(
                 group_id=group_id,
                 user_id=None,
                 user_nickname="SYSTEM",
                 content=msg_content,
-                timestamp=datetime.now()
+                timestamp=now
             )
             session.add(sys_msg)
-            session.commit()
+            session.flush()
+            return message_to_dict(sys_msg)
+
+        with room.lock:
+            if action != 'start':
+                # 结束前把本轮得分写回
+                room_registry.flush_room(db_manager, room)
+            message = db_manager.write(write)
+            room_registry.add_message(room, message)
+            if action == 'start':
+                room_registry.start_sprint(room, target, now)
+            else:
+                room_registry.stop_sprint(room)
+            member_ids = list(room.members)
 
-            members = session.query(GroupMember).filter_by(group_id=group_id).all()
-            member_ids = [m.user_id for m in members]
+        push_msg = dict(message, type="group_msg_push", group_id=group_id)
+        self.broadcast_to_users(member_ids, push_msg)
+        self.broadcast_to_users(member_ids, {"type": "sprint_status_push", "group_id": group_id})
 
-            push_msg = {
-                "type": "group_msg_push",
-                "group_id": group_id,
-                "sender": "SYSTEM",
-                "content": msg_content,
-                "time": time.time()
-            }
-            self.broadcast_to_users(member_ids, push_msg)
-            self.broadcast_to_users(member_ids, {"type": "sprint_status_push", "group_id": group_id})
+        # 更新大厅状态 (拼字中不可加入)
+        self.publish_lobby("updated", room, sprint_active=action == 'start')
 
-            # 更新大厅状态 (拼字中不可加入)
-            self.broadcast_to_all({"type": "refresh_groups"})
-
-            return {"type": "response", "status": "success"}
-        finally:
-            session.close()
+        return {"type": "response", "status": "success"}
 
     def run(self):
         if not self.perform_handshake():
@@ -823,6 +1144,10 @@ class ClientHandler(threading.Thread):
                     response = self.handle_sync_data(request)
                 elif rtype == 'get_analytics':
                     response = self.handle_get_analytics(request)
+                elif rtype == 'get_analytics_series':
+                    response = self.handle_get_analytics_series(request)
+                elif rtype == 'get_productive_hours':
+                    response = self.handle_get_productive_hours(request)
                 elif rtype == 'get_details':
                     response = self.handle_get_details(request)
                 elif rtype == 'send_code':
@@ -847,12 +1172,18 @@ class ClientHandler(threading.Thread):
                     response = self.handle_create_group(request)
                 elif rtype == 'get_public_groups':
                     response = self.handle_get_lobby_data(request)  # 替换为新逻辑
+                elif rtype == 'lobby_subscribe':
+                    response = self.handle_lobby_subscribe(request)
+                elif rtype == 'lobby_unsubscribe':
+                    response = self.handle_lobby_unsubscribe(request)
                 elif rtype == 'join_group':
                     response = self.handle_join_group(request)
                 elif rtype == 'leave_group':
                     response = self.handle_leave_group(request)
                 elif rtype == 'group_chat':
                     self.handle_send_group_msg(request)
+                elif rtype == 'get_group_messages':
+                    response = self.handle_get_group_messages(request)
                 elif rtype == 'get_group_detail':
                     response = self.handle_get_group_detail(request)
                 elif rtype == 'sprint_control':
@@ -861,6 +1192,9 @@ class ClientHandler(threading.Thread):
                     response = {"type": "response", "status": "ok", "msg": "Ack"}
 
                 if response:
+                    # 回显请求号，客户端据此把回复对应到具体请求
+                    if 'req_id' in request:
+                        response['req_id'] = request['req_id']
                     self.send_packet(response)
 
             except json.JSONDecodeError:
@@ -871,9 +1205,11 @@ class ClientHandler(threading.Thread):
                 traceback.print_exc()
                 break
 
-        with clients_lock:
-            if self.user_id and self.user_id in connected_clients:
-                del connected_clients[self.user_id]
+        if self.user_id:
+            try:
+                self.sign_out()
+            except Exception as e:
+                print(f"[Handler Error] {e}")
         self.conn.close()
 
 
@@ -886,6 +1222,14 @@ class InkServer:
 
     def start(self):
         try:
+            room_registry.load(db_manager)
+            room_registry.start_flusher(db_manager)
+            user_index.load(db_manager)
+            friend_graph.load(db_manager)
+            presence.start_flusher(publish_presence)
+            compactor.start(db_manager, on_change=lambda uid: change_counters.bump(("reports", uid)))
+            cold_archive.recover(db_manager)
+            cold_archive.start(db_manager, on_change=lambda uid: change_counters.bump(("reports", uid)))
             self.socket.bind((HOST, PORT))
             self.socket.listen(10)
             print(f"[Server] Running on {HOST}:{PORT}")
@@ -896,6 +1240,10 @@ class InkServer:
             print(f"[Server Crash] {e}")
         finally:
             self.socket.close()
+            room_registry.stop_flusher(db_manager)
+            presence.stop_flusher()
+            compactor.stop()
+            cold_archive.stop()
 
 
 if __name__ == '__main__':
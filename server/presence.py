@@ -0,0 +1,99 @@
+import threading
+
+# 在线状态变化推送给好友的合并间隔 (秒)：间隔内断线又重连的用户不会推送
+PRESENCE_FLUSH_INTERVAL = 2
+
+
+class PresenceRegistry:
+    """
+    在线状态登记
+
+    - 一个用户可以有多个会话 (多端登录)，第一个会话登录时上线，最后一个会话断开时下线；
+    - online 是在线用户 ID 的集合，只在持有 lock 时修改；单个 ID 的成员判断 (in) 在 CPython 中是原子的，
+      批量查询只遍历传入的 ID，因此查询方不需要持锁，也不会碰到会话表；
+    - 上下线只记下"状态变了"，由 take_changes() 定期取出与上次推送结果不同的用户，
+      一个间隔内下线又上线 (重连抖动) 的用户状态没有变化，不会推送。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions = {}  # user_id -> [ClientHandler]
+        self.online = set()
+        self.published = set()  # 上次推送给好友时在线的用户
+        self.dirty = set()  # 自上次推送以来上下线过的用户
+        self.flush_stop = threading.Event()
+        self.flusher = None
+
+    def connect(self, user_id, session):
+        """登记一个会话，返回该用户是否因此上线"""
+        with self.lock:
+            sessions = self.sessions.setdefault(user_id, [])
+            if session not in sessions:
+                sessions.append(session)
+            if user_id in self.online: return False
+            self.online.add(user_id)
+            self.dirty.add(user_id)
+            return True
+
+    def disconnect(self, user_id, session):
+        """注销一个会话，返回该用户是否因此下线"""
+        with self.lock:
+            sessions = self.sessions.get(user_id)
+            if not sessions or session not in sessions: return False
+            sessions.remove(session)
+            if sessions: return False
+            del self.sessions[user_id]
+            self.online.discard(user_id)
+            self.dirty.add(user_id)
+            return True
+
+    def sessions_of(self, user_ids):
+        with self.lock:
+            return [s for uid in user_ids for s in self.sessions.get(uid, ())]
+
+    def all_sessions(self):
+        with self.lock:
+            return [s for sessions in self.sessions.values() for s in sessions]
+
+    def is_online(self, user_id):
+        return user_id in self.online
+
+    def online_among(self, user_ids):
+        """批量查询：user_ids 中在线的 ID (不持锁)"""
+        online = self.online
+        return [uid for uid in user_ids if uid in online]
+
+    def take_changes(self):
+        """取出需要推送的状态变化 {user_id: 是否在线}，只含与上次推送结果不同的用户"""
+        with self.lock:
+            changes = {}
+            for uid in self.dirty:
+                online = uid in self.online
+                if online != (uid in self.published):
+                    changes[uid] = online
+                    if online:
+                        self.published.add(uid)
+                    else:
+                        self.published.discard(uid)
+            self.dirty.clear()
+            return changes
+
+    def start_flusher(self, publish, interval=PRESENCE_FLUSH_INTERVAL):
+        """publish(changes) 每个间隔调用一次，负责把变化推给在线好友"""
+        def loop():
+            while not self.flush_stop.wait(interval):
+                try:
+                    changes = self.take_changes()
+                    if changes: publish(changes)
+                except Exception as e:
+                    print(f"[Presence] Push failed: {e}")
+
+        self.flush_stop.clear()
+        self.flusher = threading.Thread(target=loop, name="PresenceFlusher", daemon=True)
+        self.flusher.start()
+
+    def stop_flusher(self):
+        self.flush_stop.set()
+        if self.flusher:
+            self.flusher.join()
+            self.flusher = None
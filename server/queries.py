@@ -0,0 +1,103 @@
+"""
+集合化查询层
+
+处理函数里常见的"先查列表、再逐条 query(User).get()"会随数据量线性增加 SQL 条数 (N+1)。
+这里的函数都用 JOIN / 子查询 / GROUP BY 一次取回所需数据，每个函数执行的语句数是常数。
+"""
+from sqlalchemy import func, cast, Date, Integer, extract
+
+from database import User, FriendRequest, GroupMessage, DailyReport
+
+
+def users_by_ids(session, user_ids):
+    """按 ID 批量取用户 (按 ID 升序)，1 条语句"""
+    return session.query(User).filter(User.id.in_(list(user_ids))).order_by(User.id).all()
+
+
+def friend_requests_query(session, user_id):
+    return session.query(FriendRequest, User) \
+        .join(User, User.id == FriendRequest.sender_id) \
+        .filter(FriendRequest.receiver_id == user_id) \
+        .order_by(FriendRequest.id)
+
+
+def incoming_friend_requests(session, user_id):
+    """收到的好友请求及发送者：[(FriendRequest, User)]，1 条语句"""
+    return friend_requests_query(session, user_id).all()
+
+
+def recent_messages_query(session, per_room):
+    ranked = session.query(
+        GroupMessage.id.label("id"),
+        func.row_number().over(partition_by=GroupMessage.group_id, order_by=GroupMessage.id.desc()).label("rn")
+    ).subquery()
+    return session.query(GroupMessage) \
+        .join(ranked, ranked.c.id == GroupMessage.id) \
+        .filter(ranked.c.rn <= per_room) \
+        .order_by(GroupMessage.group_id, GroupMessage.id)
+
+
+def recent_messages(session, per_room):
+    """每个房间最近 per_room 条消息 (窗口函数)，按房间、id 升序，1 条语句"""
+    return recent_messages_query(session, per_room).all()
+
+
+def group_messages_query(session, group_id, since_id=None, before_id=None, limit=50):
+    q = session.query(GroupMessage).filter(GroupMessage.group_id == group_id)
+    if since_id is not None:
+        return q.filter(GroupMessage.id > since_id).order_by(GroupMessage.id.asc()).limit(limit)
+    if before_id is not None:
+        q = q.filter(GroupMessage.id < before_id)
+    return q.order_by(GroupMessage.id.desc()).limit(limit)
+
+
+def group_messages(session, group_id, since_id=None, before_id=None, limit=50):
+    """
+    群聊分页 (按 id 游标)，结果按 id 升序，1 条语句
+    - since_id：其后最早的 limit 条；
+    - before_id：其前最近的 limit 条；都不带则为最近的 limit 条。
+    """
+    rows = group_messages_query(session, group_id, since_id, before_id, limit).all()
+    return rows if since_id is not None else rows[::-1]
+
+
+def date_bucket(session, column, granularity):
+    """日期所在桶的起始日：day 原样，week 为周一，month/year 为当月/当年 1 日"""
+    if granularity == "day":
+        return column
+    if session.get_bind().dialect.name == "postgresql":
+        return cast(func.date_trunc(granularity, column), Date)
+    if granularity == "week":
+        return func.date(column, "weekday 0", "-6 days")
+    return func.strftime("%Y-%m-01" if granularity == "month" else "%Y-01-01", column)
+
+
+def report_totals_query(session, user_id, start, end, granularity):
+    bucket = date_bucket(session, DailyReport.report_date, granularity).label("bucket")
+    return session.query(bucket, func.sum(DailyReport.total_words)) \
+        .filter(DailyReport.user_id == user_id, DailyReport.report_date >= start, DailyReport.report_date <= end) \
+        .group_by(bucket).order_by(bucket)
+
+
+def report_totals(session, user_id, start, end, granularity):
+    """[start, end] 内按桶汇总的每日字数：[(桶起始日, 合计)]，按桶升序，1 条语句 (GROUP BY)"""
+    return report_totals_query(session, user_id, start, end, granularity).all()
+
+
+def hour_bucket(session, column):
+    """时间所在的整点；SQLite 里按 DateTime 列的存储格式输出，才能与 ORM 写入的值比较"""
+    if session.get_bind().dialect.name == "postgresql":
+        return func.date_trunc("hour", column)
+    return func.strftime("%Y-%m-%d %H:00:00.000000", column)
+
+
+def day_of(session, column):
+    if session.get_bind().dialect.name == "postgresql":
+        return cast(column, Date)
+    return func.date(column)
+
+
+def hour_of_day(session, column):
+    if session.get_bind().dialect.name == "postgresql":
+        return cast(extract("hour", column), Integer)
+    return cast(func.strftime("%H", column), Integer)
@@ -0,0 +1,69 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+
+class ChangeCounters:
+    """
+    按实体计数的变更计数器，用来给只读结果生成版本号 (类似 ETag)
+
+    写入成功后 bump() 相关实体，读取时把用到的实体计数拼成版本号；
+    计数只在内存中，版本号带上进程级 epoch，服务器重启后旧版本号全部失效。
+    """
+
+    def __init__(self):
+        self.epoch = os.urandom(4).hex()
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def bump(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.counters[key] = self.counters.get(key, 0) + 1
+
+    def get(self, key):
+        return self.counters.get(key, 0)
+
+    def version(self, *keys, extra=None):
+        """keys 为 (实体, id) 元组；extra 用于与计数无关但影响结果的因素 (如日期)"""
+        with self.lock:
+            parts = [(key, self.counters.get(key, 0)) for key in keys]
+        digest = hashlib.sha1(repr((parts, extra)).encode("utf-8")).hexdigest()[:16]
+        return f"{self.epoch}-{digest}"
+
+
+class ResponseCache:
+    """
+    只读结果缓存：scope -> (版本号, 响应)，每个 scope 只保留最新版本，按 LRU 淘汰
+
+    返回的是浅拷贝，调用方可以放心添加 req_id 等字段。
+    """
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, scope, version):
+        with self.lock:
+            entry = self.entries.get(scope)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(scope)
+            self.hits += 1
+            return dict(entry[1])
+
+    def put(self, scope, version, response):
+        with self.lock:
+            self.entries[scope] = (version, dict(response))
+            self.entries.move_to_end(scope)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
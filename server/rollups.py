@@ -0,0 +1,105 @@
+"""
+明细汇总 (rollup)
+
+客户端每 10 秒同步一次，活跃用户一天最多产生 8640 条 DetailRecord。按时段/按天的分析不再扫明细表，
+而是读每用户每小时 (hourly_rollups)、每天 (daily_rollups) 的字数与时长合计：
+- 增量入库时在同一个写事务里调用 apply() 累加，汇总与明细同时提交；
+- rebuild() 用 DELETE + INSERT ... SELECT ... GROUP BY 从明细表整体重建，用于上线前回填或修复，
+  命令行：python rollups.py [--user ID] [--since YYYY-MM-DD]
+桶按明细的 end_time 划分 (服务器时间)。
+"""
+import argparse
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import delete, func, insert, select
+
+import queries
+from database import DetailRecord, HourlyRollup, DailyRollup
+
+
+def apply(session, user_id, entries):
+    """
+    entries: [(end_time, 字数, 时长秒)]，在写线程内与明细一起调用，不提交
+    每张表 1 条 SELECT 取出已有的桶，其余为新增
+    """
+    hourly, daily = {}, {}
+    for end_time, words, duration in entries:
+        for totals, key in ((hourly, end_time.replace(minute=0, second=0, microsecond=0)),
+                            (daily, end_time.date())):
+            current = totals.get(key, (0, 0, 0))
+            totals[key] = (current[0] + words, current[1] + duration, current[2] + 1)
+    _upsert(session, HourlyRollup, user_id, hourly)
+    _upsert(session, DailyRollup, user_id, daily)
+
+
+def _upsert(session, model, user_id, totals):
+    if not totals: return
+    existing = {row.bucket_start: row for row in session.query(model).filter(
+        model.user_id == user_id, model.bucket_start.in_(list(totals)))}
+    for key, (words, duration, records) in totals.items():
+        row = existing.get(key)
+        if row is None:
+            session.add(model(user_id=user_id, bucket_start=key, words=words,
+                              duration_seconds=duration, records=records))
+        else:
+            row.words += words
+            row.duration_seconds += duration
+            row.records += records
+
+
+def rebuild(session, user_id=None, since=None):
+    """
+    从明细表重建汇总 (全部用户或单个用户；since 为日期时只重建该日及以后的桶)
+    每张表一条 DELETE、一条 INSERT ... SELECT，返回 (小时桶数, 天桶数)
+    明细被压缩 (compaction.py) 过的时段，records 是合并后的条数；字数与时长不变
+    """
+    start = datetime.combine(since, time.min) if since else None
+    counts = []
+    for model, bucket in ((HourlyRollup, queries.hour_bucket(session, DetailRecord.end_time)),
+                          (DailyRollup, queries.day_of(session, DetailRecord.end_time))):
+        removal = delete(model)
+        source = select(DetailRecord.user_id, bucket.label("bucket_start"),
+                        func.sum(DetailRecord.word_increment), func.sum(func.coalesce(DetailRecord.duration_seconds, 0)),
+                        func.count())
+        if user_id is not None:
+            removal = removal.where(model.user_id == user_id)
+            source = source.where(DetailRecord.user_id == user_id)
+        if start:
+            removal = removal.where(model.bucket_start >= (start if model is HourlyRollup else since))
+            source = source.where(DetailRecord.end_time >= start)
+        session.execute(removal)
+        result = session.execute(insert(model).from_select(
+            ["user_id", "bucket_start", "words", "duration_seconds", "records"],
+            source.group_by(DetailRecord.user_id, bucket)))
+        counts.append(result.rowcount)
+    return tuple(counts)
+
+
+def productive_hours_query(session, user_id, start, end):
+    hour = queries.hour_of_day(session, HourlyRollup.bucket_start).label("hour")
+    return session.query(hour, func.sum(HourlyRollup.words), func.sum(HourlyRollup.duration_seconds)) \
+        .filter(HourlyRollup.user_id == user_id,
+                HourlyRollup.bucket_start >= datetime.combine(start, time.min),
+                HourlyRollup.bucket_start < datetime.combine(end + timedelta(days=1), time.min)) \
+        .group_by(hour)
+
+
+def productive_hours(session, user_id, start, end):
+    """[start, end] 内按一天中的小时 (0-23) 合计的 (字数列表, 时长列表)，只读 hourly_rollups，1 条语句"""
+    rows = productive_hours_query(session, user_id, start, end).all()
+    words, durations = [0] * 24, [0] * 24
+    for h, w, d in rows:
+        words[int(h)], durations[int(h)] = int(w or 0), int(d or 0)
+    return words, durations
+
+
+if __name__ == '__main__':
+    from database import db_manager
+
+    parser = argparse.ArgumentParser(description="从 detail_records 回填/修复 hourly_rollups 与 daily_rollups")
+    parser.add_argument("--user", type=int, help="只重建该用户")
+    parser.add_argument("--since", type=date.fromisoformat, help="只重建该日 (YYYY-MM-DD) 及以后的桶")
+    args = parser.parse_args()
+    db_manager.init_db()
+    hours, days = db_manager.write(rebuild, args.user, args.since)
+    print(f"[Rollups] Rebuilt {hours} hourly and {days} daily buckets")
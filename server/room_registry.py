@@ -0,0 +1,266 @@
+import threading
+from collections import deque
+
+from database import Group, GroupMember, SprintScore, User
+from leaderboard import Leaderboard
+from shared.room_rules import MAX_MEMBERS
+import queries
+
+# 拼字得分写回数据库的间隔 (秒)
+SCORE_FLUSH_INTERVAL = 5
+# 每个房间在内存中保留的最近消息条数
+CHAT_BUFFER_SIZE = 200
+
+
+def message_to_dict(m):
+    return {
+        "id": m.id,
+        "sender": m.user_nickname,
+        "content": m.content,
+        "time": m.timestamp.timestamp() if m.timestamp else 0
+    }
+
+
+class RoomState:
+    """单个房间的实时状态，修改前需持有 lock"""
+
+    def __init__(self, group_id, name, owner_id, is_private=False, password=None, description=None,
+                 sprint_active=False, sprint_start_time=None, sprint_target_words=0, updated_at=None):
+        self.group_id = group_id
+        self.name = name
+        self.owner_id = owner_id
+        self.is_private = is_private
+        self.password = password
+        self.description = description
+        self.sprint_active = sprint_active
+        self.sprint_start_time = sprint_start_time
+        self.sprint_target_words = sprint_target_words or 0
+        self.updated_at = updated_at
+        # 房主资料 (大厅卡片展示用)，房主修改资料时同步更新
+        self.owner_nickname = None
+        self.owner_avatar_url = None
+        self.members = set()
+        self.leaderboard = Leaderboard(self.sprint_target_words)  # 本轮拼字排行
+        self.messages = deque(maxlen=CHAT_BUFFER_SIZE)  # 最近消息 (按 id 升序)
+        self.messages_complete = True  # 环形缓冲区是否包含房间的全部消息
+        self.lock = threading.RLock()
+
+    @property
+    def scores(self):
+        """user_id -> 本轮拼字得分 (只含有得分记录的成员)"""
+        return self.leaderboard.scores
+
+    @classmethod
+    def from_group(cls, group, owner=None):
+        room = cls(group.id, group.name, group.owner_id, bool(group.is_private), group.password,
+                   group.description, bool(group.sprint_active), group.sprint_start_time,
+                   group.sprint_target_words, group.updated_at)
+        if owner:
+            room.owner_nickname = owner.nickname or owner.username
+            room.owner_avatar_url = owner.avatar_url
+        return room
+
+
+class RoomRegistry:
+    """
+    房间状态的内存权威副本
+
+    - 成员、房主、拼字状态与得分常驻内存，成员判断与广播名单都是字典查找；
+    - 修改时先持有房间锁，写库 (写穿) 成功后再更新内存，保证两者一致；
+    - 拼字得分例外：只改内存排行榜，由 flush() 定期把变更批量写回 (写回)，
+      拼字结束与服务器退出时也会写回，异常退出最多丢失一个间隔内的房间得分；
+    - 服务器启动时调用 load() 从数据库重建。
+    """
+
+    def __init__(self):
+        self.rooms = {}  # group_id -> RoomState
+        self.user_rooms = {}  # user_id -> group_id
+        self.lock = threading.Lock()
+        self.generation = 0  # 每次 load() 加一，依赖房间状态的缓存据此失效
+        self.rooms_version = 0  # 房间增删时加一 (房间名索引据此重建)
+        self.flush_stop = threading.Event()
+        self.flusher = None
+
+    def load(self, db):
+        session = db.get_read_session()
+        try:
+            rooms = {g.id: RoomState.from_group(g, owner) for g, owner in
+                     session.query(Group, User).outerjoin(User, User.id == Group.owner_id).all()}
+            user_rooms = {}
+            for m in session.query(GroupMember).all():
+                room = rooms.get(m.group_id)
+                if room:
+                    room.members.add(m.user_id)
+                    user_rooms[m.user_id] = m.group_id
+            for s in session.query(SprintScore).all():
+                room = rooms.get(s.group_id)
+                if room and s.user_id in room.members:
+                    room.leaderboard.set_score(s.user_id, s.current_score or 0, mark_dirty=False)
+            for m in queries.recent_messages(session, CHAT_BUFFER_SIZE):
+                room = rooms.get(m.group_id)
+                if room:
+                    room.messages.append(message_to_dict(m))
+            for room in rooms.values():
+                # 取满说明更早的消息可能已不在内存中
+                room.messages_complete = len(room.messages) < CHAT_BUFFER_SIZE
+        finally:
+            session.close()
+
+        with self.lock:
+            self.rooms = rooms
+            self.user_rooms = user_rooms
+            self.generation += 1
+            self.rooms_version += 1
+        print(f"[Rooms] Loaded {len(rooms)} rooms, {len(user_rooms)} members")
+
+    # --- 查询 ---
+
+    def get(self, group_id):
+        return self.rooms.get(group_id)
+
+    def room_of(self, user_id):
+        """用户当前所在的房间 (RoomState) 或 None"""
+        group_id = self.user_rooms.get(user_id)
+        return self.rooms.get(group_id) if group_id is not None else None
+
+    def members(self, group_id):
+        room = self.rooms.get(group_id)
+        if not room: return []
+        with room.lock:
+            return list(room.members)
+
+    def is_member(self, group_id, user_id):
+        return self.user_rooms.get(user_id) == group_id
+
+    def message_page(self, room, since_id=None, before_id=None, limit=50):
+        """
+        从环形缓冲区取一页消息，返回 (消息列表, 是否还有更多)；
+        缓冲区无法确定完整结果 (更早的消息已被挤出) 时返回 None，由调用方查库。
+        """
+        with room.lock:
+            buf = list(room.messages)
+            complete = room.messages_complete
+        if since_id is not None:
+            if not complete and (not buf or since_id < buf[0]["id"]):
+                return None
+            newer = [m for m in buf if m["id"] > since_id]
+            return newer[:limit], len(newer) > limit
+
+        older = [m for m in buf if before_id is None or m["id"] < before_id]
+        if len(older) > limit:
+            return older[-limit:], True
+        if complete:
+            return older, False
+        return None
+
+    # --- 修改 (调用方在写库成功后调用) ---
+
+    def add_room(self, room):
+        with self.lock:
+            self.rooms[room.group_id] = room
+            self.rooms_version += 1
+            for uid in room.members:
+                self.user_rooms[uid] = room.group_id
+
+    def remove_room(self, group_id):
+        with self.lock:
+            room = self.rooms.pop(group_id, None)
+            self.rooms_version += 1
+            if room:
+                for uid in room.members:
+                    if self.user_rooms.get(uid) == group_id:
+                        del self.user_rooms[uid]
+        return room
+
+    def add_member(self, room, user_id):
+        with room.lock:
+            room.members.add(user_id)
+        with self.lock:
+            self.user_rooms[user_id] = room.group_id
+
+    def remove_member(self, room, user_id):
+        with room.lock:
+            room.members.discard(user_id)
+            room.leaderboard.remove(user_id)
+        with self.lock:
+            if self.user_rooms.get(user_id) == room.group_id:
+                del self.user_rooms[user_id]
+
+    def start_sprint(self, room, target, start_time):
+        with room.lock:
+            room.sprint_active = True
+            room.sprint_target_words = target
+            room.sprint_start_time = start_time
+            room.leaderboard = Leaderboard(target)
+
+    def stop_sprint(self, room):
+        with room.lock:
+            room.sprint_active = False
+
+    def add_message(self, room, message):
+        """消息入库后追加到环形缓冲区 (调用方持有房间锁，保证按 id 顺序追加)"""
+        with room.lock:
+            if len(room.messages) == room.messages.maxlen:
+                room.messages_complete = False
+            room.messages.append(message)
+
+    def add_score(self, room, user_id, increment):
+        """只更新内存排行榜，O(log n)；由 flush() 写回数据库"""
+        with room.lock:
+            return room.leaderboard.add(user_id, increment)
+
+    # --- 得分写回 ---
+
+    def flush_room(self, db, room):
+        """把房间内变更过的得分写回 sprint_scores，返回写回条数"""
+        with room.lock:
+            changed = room.leaderboard.take_dirty()
+            if not changed: return 0
+            group_id = room.group_id
+
+            def write(session):
+                rows = session.query(SprintScore).filter(
+                    SprintScore.group_id == group_id,
+                    SprintScore.user_id.in_(list(changed))
+                ).all()
+                existing = {r.user_id: r for r in rows}
+                for uid, score in changed.items():
+                    row = existing.get(uid)
+                    if row:
+                        row.current_score = score
+                    else:
+                        session.add(SprintScore(group_id=group_id, user_id=uid, current_score=score))
+
+            try:
+                db.write(write)
+            except Exception:
+                # 写回失败，留到下一轮
+                room.leaderboard.dirty.update(uid for uid in changed if uid in room.leaderboard)
+                raise
+            return len(changed)
+
+    def flush(self, db):
+        written = 0
+        for room in list(self.rooms.values()):
+            if room.leaderboard.dirty:
+                written += self.flush_room(db, room)
+        return written
+
+    def start_flusher(self, db, interval=SCORE_FLUSH_INTERVAL):
+        def loop():
+            while not self.flush_stop.wait(interval):
+                try:
+                    self.flush(db)
+                except Exception as e:
+                    print(f"[Rooms] Score flush failed: {e}")
+
+        self.flush_stop.clear()
+        self.flusher = threading.Thread(target=loop, name="ScoreFlusher", daemon=True)
+        self.flusher.start()
+
+    def stop_flusher(self, db):
+        self.flush_stop.set()
+        if self.flusher:
+            self.flusher.join()
+            self.flusher = None
+        self.flush(db)
@@ -0,0 +1,110 @@
+# server/test_analytics_series.py
+# 统计汇总接口：按 from/to/granularity 在库里 GROUP BY，结果与逐日累加一致；只读范围内的行 (走索引)
+import os
+import random
+import tempfile
+from collections import defaultdict
+from datetime import date, timedelta
+
+from sqlalchemy import event, text
+
+import analytics
+import main as server_main
+from database import DatabaseManager, User, DailyReport
+
+
+def seed(db, start, days):
+    """两个用户，每人每天一条 DailyReport (有的天为空)"""
+    rnd = random.Random(44)
+    session = db.get_session()
+    try:
+        users = [User(username=f"series_{i}", password_hash="x") for i in range(2)]
+        session.add_all(users)
+        session.flush()
+        daily = {}
+        for u in users:
+            for i in range(days):
+                if rnd.random() < 0.3: continue
+                day = start + timedelta(days=i)
+                words = rnd.randint(1, 5000)
+                session.add(DailyReport(user_id=u.id, report_date=day, total_words=words))
+                if u is users[0]: daily[day] = words
+        session.commit()
+        return users[0].id, daily
+    finally:
+        session.close()
+
+
+def expected(daily, start, end, granularity):
+    totals = defaultdict(int)
+    for day, words in daily.items():
+        if start <= day <= end:
+            totals[analytics.bucket_start(day, granularity)] += words
+    starts = analytics.bucket_starts(start, end, granularity)
+    return [str(s) for s in starts], [totals.get(s, 0) for s in starts]
+
+
+def test_series_matches_daily_sums_for_every_granularity():
+    db = DatabaseManager(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'series.db')}")
+    db.init_db()
+    first = date(2022, 1, 1)
+    user_id, daily = seed(db, first, 365 * 4)
+
+    original_db = server_main.db_manager
+    server_main.db_manager = db
+    try:
+        handler = server_main.ClientHandler(None, None, None, None)
+        handler.user_id = user_id
+        ranges = [("day", date(2024, 2, 20), date(2024, 3, 10)), ("week", date(2023, 1, 4), date(2023, 6, 30)),
+                  ("month", date(2022, 3, 15), date(2025, 12, 31)), ("year", first, date(2025, 12, 31))]
+        for granularity, start, end in ranges:
+            statements = []
+            listener = lambda *args: statements.append(args[2])
+            event.listen(db.read_engine, "before_cursor_execute", listener)
+            try:
+                response = handler.handle_get_analytics_series(
+                    {"from": str(start), "to": str(end), "granularity": granularity})
+            finally:
+                event.remove(db.read_engine, "before_cursor_execute", listener)
+            assert len(statements) == 1, granularity
+            assert (response["buckets"], response["values"]) == expected(daily, start, end, granularity), granularity
+
+        # 周从周一开始，首尾不完整的桶只计范围内的天
+        week = handler.handle_get_analytics_series({"from": "2023-01-04", "to": "2023-01-20", "granularity": "week"})
+        assert week["buckets"] == ["2023-01-02", "2023-01-09", "2023-01-16"]
+
+        # 同参数再请求走缓存/版本号
+        params = {"from": "2022-01-01", "to": "2025-12-31", "granularity": "year"}
+        version = handler.handle_get_analytics_series(params)["version"]
+        assert handler.handle_get_analytics_series(dict(params, version=version))["status"] == "not_modified"
+
+        # 默认区间 (最近一年) 跨过午夜后，带着昨天的版本号也要拿到新区间
+        class Tomorrow(date):
+            @classmethod
+            def today(cls):
+                return date.today() + timedelta(days=1)
+
+        version = handler.handle_get_analytics_series({})["version"]
+        server_main.date = Tomorrow
+        try:
+            moved = handler.handle_get_analytics_series({"version": version})
+        finally:
+            server_main.date = date
+        assert moved["status"] == "success" and moved["to"] == str(Tomorrow.today())
+
+        # 非法参数与过大的范围
+        for bad in ({"granularity": "hour"}, {"from": "2024-13-01"}, {"from": "2024-02-01", "to": "2024-01-01"},
+                    {"from": "2000-01-01", "to": "2025-01-01", "granularity": "day"}):
+            assert handler.handle_get_analytics_series(bad)["status"] == "fail", bad
+
+        # 多年历史下只按 (user_id, report_date) 索引取范围内的行
+        session = db.get_read_session()
+        try:
+            plan = " ".join(str(row[-1]) for row in session.execute(text(
+                "EXPLAIN QUERY PLAN SELECT sum(total_words) FROM daily_reports "
+                "WHERE user_id = 1 AND report_date >= '2024-01-01' AND report_date <= '2024-12-31'")))
+        finally:
+            session.close()
+        assert "ix_daily_user_date" in plan
+    finally:
+        server_main.db_manager = original_db
@@ -0,0 +1,101 @@
+# server/test_chat_history.py
+# 聊天记录分页：按 id 游标取新消息/翻旧消息，最近消息由房间环形缓冲区直接返回，挤出缓冲区的部分查库
+import os
+import tempfile
+
+from sqlalchemy import event
+
+import main as server_main
+import room_registry as room_registry_module
+from database import DatabaseManager, User
+from room_registry import RoomRegistry
+
+
+def make_handler(user_id):
+    handler = server_main.ClientHandler(None, None, None, None)
+    handler.user_id = user_id
+    handler.username = handler.nickname = f"chat_{user_id}"
+    return handler
+
+
+def count_statements(db, call):
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.read_engine, "before_cursor_execute", listener)
+    try:
+        return call(), len(statements)
+    finally:
+        event.remove(db.read_engine, "before_cursor_execute", listener)
+
+
+def test_cursor_pagination_from_buffer_and_database(monkeypatch):
+    monkeypatch.setattr(room_registry_module, "CHAT_BUFFER_SIZE", 20)
+    db = DatabaseManager(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'chat.db')}")
+    db.init_db()
+    session = db.get_session()
+    users = [User(username=f"chat_{i}", password_hash="x", nickname=f"C{i}") for i in range(3)]
+    session.add_all(users)
+    session.commit()
+    ids = [u.id for u in users]
+    session.close()
+
+    original_db = server_main.db_manager
+    server_main.db_manager = db
+    server_main.room_registry.load(db)
+    try:
+        owner, member, outsider = (make_handler(uid) for uid in ids)
+        group_id = owner.handle_create_group({"name": "Chatty"})["group_id"]
+        member.handle_join_group({"group_id": group_id})
+        for i in range(50):
+            (owner if i % 2 else member).handle_send_group_msg({"group_id": group_id, "content": f"m{i}"})
+
+        def page(**kw):
+            return member.handle_get_group_messages(dict(kw, group_id=group_id))
+
+        # 最近一页、新消息增量都由缓冲区返回，不查库
+        latest, n = count_statements(db, lambda: page(limit=10))
+        assert n == 0
+        assert [m["content"] for m in latest["messages"]] == [f"m{i}" for i in range(40, 50)]
+        assert latest["has_more"] is True
+        last_id = latest["messages"][-1]["id"]
+        assert page(since_id=last_id)["messages"] == []
+
+        owner.handle_send_group_msg({"group_id": group_id, "content": "fresh"})
+        newer, n = count_statements(db, lambda: page(since_id=last_id))
+        assert n == 0
+        assert [m["content"] for m in newer["messages"]] == ["fresh"]
+        assert newer["direction"] == "newer"
+
+        # 向上翻页直到最早：超出缓冲区的部分查库
+        seen = [m["content"] for m in latest["messages"]]
+        before_id, queries_used = latest["messages"][0]["id"], 0
+        while True:
+            older, n = count_statements(db, lambda: page(before_id=before_id, limit=10))
+            queries_used += n
+            seen = [m["content"] for m in older["messages"]] + seen
+            if not older["has_more"]: break
+            before_id = older["messages"][0]["id"]
+        assert seen == [f"m{i}" for i in range(50)]
+        assert queries_used > 0
+
+        # since_id 落在缓冲区之前，同样回退到查库并按页返回
+        gap = page(since_id=0, limit=5)
+        assert [m["content"] for m in gap["messages"]] == ["m0", "m1", "m2", "m3", "m4"]
+        assert gap["has_more"] is True
+
+        # 房间详情不再查聊天记录，只带缓冲区中的最近一页
+        detail = member.handle_get_group_detail({"group_id": group_id, "include_chat": False})
+        assert detail["chat_history"] == []
+
+        # 非成员不能读取
+        assert outsider.handle_get_group_messages({"group_id": group_id})["status"] == "fail"
+
+        # 重启后缓冲区从库中重建最近的消息
+        rebuilt = RoomRegistry()
+        rebuilt.load(db)
+        room = rebuilt.get(group_id)
+        assert len(room.messages) == 20
+        assert room.messages[-1]["content"] == "fresh"
+        assert room.messages_complete is False
+    finally:
+        server_main.db_manager = original_db
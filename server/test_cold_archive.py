@@ -0,0 +1,212 @@
+# server/test_cold_archive.py
+# 冷归档：旧月份的每日字数移到内存映射的列式文件后，统计结果与归档前一致；迟到的旧增量照常计入并在下次归档时并入
+import os
+import random
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from sqlalchemy import event
+
+import cold_archive
+import main as server_main
+from database import DatabaseManager, User, DailyReport
+
+TODAY = date.today()
+
+
+def seed(db, years=6):
+    rnd = random.Random(47)
+    session = db.get_session()
+    try:
+        users = [User(username=f"archive_{i}", password_hash="x") for i in range(2)]
+        session.add_all(users)
+        session.flush()
+        first = TODAY - timedelta(days=365 * years)
+        for u in users:
+            session.add_all(DailyReport(user_id=u.id, report_date=first + timedelta(days=i),
+                                        total_words=rnd.randint(1, 5000))
+                            for i in range(365 * years) if rnd.random() < 0.8)
+        session.commit()
+        return [u.id for u in users], first
+    finally:
+        session.close()
+
+
+def test_archived_months_read_through_memory_maps():
+    db = DatabaseManager(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'archive.db')}")
+    db.init_db()
+    user_ids, first = seed(db)
+
+    original_db = server_main.db_manager
+    server_main.db_manager = db
+    try:
+        handler = server_main.ClientHandler(None, None, None, None)
+        handler.user_id = user_ids[0]
+        ranges = [{"from": str(first), "to": str(TODAY), "granularity": "month"},
+                  {"from": str(first), "to": str(TODAY), "granularity": "year"},
+                  {"from": str(first + timedelta(days=700)), "to": str(TODAY - timedelta(days=200)),
+                   "granularity": "week"},
+                  {"from": str(TODAY - timedelta(days=420)), "to": str(TODAY - timedelta(days=330)),
+                   "granularity": "day"}]
+        before = [handler.handle_get_analytics_series(params)["values"] for params in ranges]
+        other = server_main.ClientHandler(None, None, None, None)
+        other.user_id = user_ids[1]
+        heatmap_before = other.build_analytics()["heatmap"]
+
+        archive = server_main.cold_archive
+        report = cold_archive.archive_cold_months(db, archive, months=12, today=TODAY)
+        boundary = cold_archive.month_boundary(TODAY, 12)
+        session = db.get_read_session()
+        try:
+            assert session.query(DailyReport).filter(DailyReport.report_date < boundary).count() == 0
+            assert session.query(DailyReport).filter(DailyReport.report_date >= boundary).count() > 0
+        finally:
+            session.close()
+        assert report["users"] == 2 and report["rows"] > 0
+        print(f"\n[Archive] Moved {report['rows']} rows, archive size {report['bytes']} bytes")
+
+        # 结果不变 (总量没变，这里手动换版本以免直接命中缓存)；整段都在归档里的区间只查一次库
+        for uid in user_ids:
+            server_main.change_counters.bump(("reports", uid))
+        after = [handler.handle_get_analytics_series(params)["values"] for params in ranges]
+        assert after == before
+        assert isinstance(archive.columns(db, user_ids[0]), np.memmap)
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.read_engine, "before_cursor_execute", listener)
+        try:
+            old_range = {"from": str(first), "to": str(boundary - timedelta(days=1)), "granularity": "month"}
+            handler.handle_get_analytics_series(old_range)
+        finally:
+            event.remove(db.read_engine, "before_cursor_execute", listener)
+        assert len(statements) == 1
+
+        # 多年区间的归档部分只按二分取切片
+        started = time.perf_counter()
+        for _ in range(1000):
+            archive.range(db, user_ids[0], first, TODAY)
+        elapsed = (time.perf_counter() - started) / 1000
+        print(f"[Archive] {(TODAY - first).days} day range lookup: {elapsed * 1e6:.0f} us")
+        assert elapsed < 0.005
+
+        # 离线很久才同步的旧增量：先在库里计入，下次归档时并入文件
+        old_day = first + timedelta(days=100)
+        expected = handler.handle_get_analytics_series(
+            {"from": str(old_day), "to": str(old_day), "granularity": "day"})["values"][0] + 123
+        handler.handle_sync_data({"device_id": "archive-pc", "deltas": [
+            {"seq": 1, "increment": 123, "duration": 10, "timestamp": datetime.now().timestamp(),
+             "local_date": str(old_day)}]})
+        single = {"from": str(old_day), "to": str(old_day), "granularity": "day"}
+        assert handler.handle_get_analytics_series(single)["values"] == [expected]
+        cold_archive.archive_cold_months(db, archive, months=12, today=TODAY)
+        assert handler.handle_get_analytics_series(single)["values"] == [expected]
+        assert sorted(os.listdir(os.path.join(cold_archive.archive_root(db), str(user_ids[0])))) == ["2.npy"]
+
+        # 只保留半年在库里时，最近一年的热力图跨越归档边界
+        cold_archive.archive_cold_months(db, archive, months=6, today=TODAY)
+        assert archive.daily_totals(db, user_ids[1], TODAY - timedelta(days=365), TODAY)
+        assert other.build_analytics()["heatmap"] == heatmap_before
+    finally:
+        server_main.db_manager = original_db
+
+
+def test_archive_publishes_only_after_commit():
+    db = DatabaseManager(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'archive_crash.db')}")
+    db.init_db()
+    user_ids, first = seed(db, years=3)
+    user_id = user_ids[0]
+    archive = cold_archive.ColdArchive()
+    boundary = cold_archive.month_boundary(TODAY, 12)
+    user_dir = os.path.join(cold_archive.archive_root(db), str(user_id))
+
+    def totals():
+        """归档 + 库里的逐日合计 (与统计接口的读法一致)"""
+        merged = archive.daily_totals(db, user_id, first, TODAY)
+        session = db.get_read_session()
+        try:
+            for row in session.query(DailyReport).filter_by(user_id=user_id):
+                key = str(row.report_date)
+                merged[key] = merged.get(key, 0) + row.total_words
+        finally:
+            session.close()
+        return merged
+
+    expected = totals()
+
+    # 批次提交失败：库里的行与登记回滚，临时文件不发布，读取方不会重复计数
+    def failing(session, *args):
+        archive.archive_user(session, *args)
+        raise RuntimeError("commit failed")
+
+    try:
+        db.write(failing, db, user_id, boundary)
+    except RuntimeError:
+        pass
+    assert archive.columns(db, user_id) is None
+    assert totals() == expected
+    # 重跑归档丢弃残留的临时文件，结果不翻倍
+    cold_archive.archive_cold_months(db, archive, months=12, today=TODAY)
+    assert totals() == expected
+    assert sorted(os.listdir(user_dir)) == ["1.npy"]
+
+    # 提交后、发布前退出：启动时按登记的代数补发布
+    moved, target = db.write(archive.archive_user, db, user_id, cold_archive.month_boundary(TODAY, 6))
+    assert moved > 0 and os.path.exists(target + ".tmp") and not os.path.exists(target)
+    archive.recover(db)
+    assert os.path.exists(target) and not os.path.exists(target + ".tmp")
+    assert totals() == expected
+
+
+def test_server_schedules_archiving_and_readers_see_one_generation(monkeypatch):
+    db = DatabaseManager(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'archive_sched.db')}")
+    db.init_db()
+    user_ids, first = seed(db, years=3)
+    user_id = user_ids[0]
+
+    original_db = server_main.db_manager
+    server_main.db_manager = db
+    try:
+        handler = server_main.ClientHandler(None, None, None, None)
+        handler.user_id = user_id
+        expected = handler.build_analytics()["heatmap"]
+
+        # 后台线程启动后立即归档一轮，发布后换版本号
+        archive = server_main.cold_archive
+        archive.last_report = None
+        changed = []
+        archive.start(db, on_change=changed.append)
+        deadline = time.time() + 10
+        while archive.last_report is None and time.time() < deadline:
+            time.sleep(0.01)
+        archive.stop()
+        assert archive.last_report["users"] == 2 and sorted(changed) == sorted(user_ids)
+
+        # 读的过程中发生搬移 (先读库、搬移、再读归档)：重读，不重复计数
+        calls = []
+
+        def read(session, _):
+            rows = session.query(DailyReport.report_date, DailyReport.total_words).filter(
+                DailyReport.user_id == user_id, DailyReport.report_date >= TODAY - timedelta(days=365)).all()
+            if not calls:
+                cold_archive.archive_cold_months(db, archive, months=6, today=TODAY)
+            calls.append(1)
+            merged = archive.daily_totals(db, user_id, TODAY - timedelta(days=365), TODAY)
+            for day, words in rows:
+                merged[str(day)] = merged.get(str(day), 0) + words
+            return merged
+
+        assert handler.read_with_archive(TODAY - timedelta(days=365), TODAY, read) == expected
+        assert len(calls) == 2
+        assert handler.build_analytics()["heatmap"] == expected
+
+        # 当前代数缓存在内存里：读取不再列目录
+        def no_listdir(path):
+            raise AssertionError(f"listdir {path}")
+
+        monkeypatch.setattr(cold_archive.os, "listdir", no_listdir)
+        assert handler.build_analytics()["heatmap"] == expected
+    finally:
+        server_main.db_manager = original_db
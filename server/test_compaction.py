@@ -0,0 +1,118 @@
+# server/test_compaction.py
+# 明细压缩：旧明细按分钟/按小时合并，字数与时长总量 (及 hourly/daily 汇总) 不变；按进度增量执行；报告回收的行数与字节数
+import os
+import random
+import tempfile
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import compaction
+import rollups
+from database import DatabaseManager, User, DetailRecord, HourlyRollup
+
+NOW = datetime(2024, 6, 30, 12, 0)
+
+
+def seed(db, days=120):
+    """两个用户每天写一段，每 10 秒一条；一部分明细来自另一个来源"""
+    rnd = random.Random(46)
+    session = db.get_session()
+    try:
+        users = [User(username=f"compact_{i}", password_hash="x") for i in range(2)]
+        session.add_all(users)
+        session.flush()
+        rows = []
+        for u in users:
+            for day in range(days):
+                moment = (NOW - timedelta(days=day)).replace(hour=rnd.randint(6, 20), minute=rnd.randint(0, 59))
+                for i in range(rnd.randint(60, 240)):
+                    moment += timedelta(seconds=10)
+                    source = "client_sync" if i % 7 else "file_watch"
+                    rows.append(dict(user_id=u.id, word_increment=rnd.randint(0, 30), duration_seconds=10,
+                                     source_type=source, start_time=moment - timedelta(seconds=10), end_time=moment))
+        session.bulk_insert_mappings(DetailRecord, rows)
+        session.commit()
+        return [u.id for u in users]
+    finally:
+        session.close()
+
+
+def totals(db):
+    """每用户每小时每来源的 (字数, 时长)，以及全部明细行"""
+    session = db.get_read_session()
+    try:
+        result = defaultdict(lambda: [0, 0])
+        records = session.query(DetailRecord).all()
+        for r in records:
+            key = (r.user_id, r.end_time.replace(minute=0, second=0, microsecond=0), r.source_type)
+            result[key][0] += r.word_increment
+            result[key][1] += r.duration_seconds
+        return dict(result), records
+    finally:
+        session.close()
+
+
+def rollup_words(db):
+    session = db.get_read_session()
+    try:
+        return {(r.user_id, r.bucket_start): (r.words, r.duration_seconds) for r in session.query(HourlyRollup)}
+    finally:
+        session.close()
+
+
+def test_compaction_preserves_totals_and_runs_incrementally():
+    db = DatabaseManager(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'compaction.db')}")
+    db.init_db()
+    user_ids = seed(db)
+    db.write(rollups.rebuild)
+    expected, records = totals(db)
+    expected_rollups = rollup_words(db)
+    changed = []
+
+    report = compaction.run(db, minute_after_days=7, hour_after_days=90, now=NOW, on_change=changed.append)
+    print(f"\n{compaction.format_report(report)}")
+    after, compacted = totals(db)
+    assert after == expected
+    assert report["rows_reclaimed"] == len(records) - len(compacted)
+    assert report["rows_reclaimed"] > len(records) // 2
+    assert report["bytes_reclaimed"] > 0
+    assert sorted(changed) == user_ids
+
+    # 超过 90 天：每用户每来源每小时 1 条；7-90 天：每分钟 1 条；最近 7 天原样
+    minute_cutoff, hour_cutoff = datetime(2024, 6, 23), datetime(2024, 4, 1)
+    seen = defaultdict(int)
+    for r in compacted:
+        if r.end_time < hour_cutoff:
+            key = (r.user_id, r.source_type, r.end_time.replace(minute=0, second=0, microsecond=0))
+        elif r.end_time < minute_cutoff:
+            key = (r.user_id, r.source_type, r.end_time.replace(second=0, microsecond=0))
+        else:
+            key = r.id
+        seen[key] += 1
+    assert max(seen.values()) == 1
+    assert sum(1 for r in records if r.end_time >= minute_cutoff) == \
+           sum(1 for r in compacted if r.end_time >= minute_cutoff)
+
+    # 合并后的明细仍在原来的小时内，重建出的汇总字数/时长不变
+    db.write(rollups.rebuild)
+    assert rollup_words(db) == expected_rollups
+
+    # 按进度继续：已压缩过的时段不再扫描；一天后只处理新过期的那一天
+    again = compaction.run(db, minute_after_days=7, hour_after_days=90, now=NOW)
+    assert again["transactions"] == 0 and again["rows_reclaimed"] == 0
+    later = compaction.run(db, minute_after_days=7, hour_after_days=90, now=NOW + timedelta(days=1))
+    assert later["transactions"] <= 2 * len(user_ids)
+    assert totals(db)[0] == expected
+
+
+def test_compactor_thread_stops_between_transactions():
+    db = DatabaseManager(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'compactor.db')}")
+    db.init_db()
+    seed(db, days=20)
+    expected = totals(db)[0]
+    compactor = compaction.Compactor(minute_after_days=1, hour_after_days=10)
+    compactor.start(db, interval=3600)
+    compactor.stop()
+    assert compactor.worker is None
+    # 中途停下也不会丢字数
+    assert totals(db)[0] == expected
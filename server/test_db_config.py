@@ -0,0 +1,167 @@
+# server/test_db_config.py
+# 数据库引擎配置：环境变量/配置文件、SQLite PRAGMA、并发写入，以及 PostgreSQL 方言编译
+import json
+import os
+import tempfile
+import threading
+from datetime import date
+
+import pytest
+from sqlalchemy import create_mock_engine, select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateTable, CreateIndex
+
+import queries
+import rollups
+from database import Base, DatabaseManager, DailyReport, DetailRecord, User, load_db_config
+
+
+def test_config_file_and_env_overrides():
+    path = os.path.join(tempfile.mkdtemp(), "db_config.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"pool_size": 4, "sqlite_pragmas": {"cache_size": -1024}}, f)
+
+    config = load_db_config(path=path, environ={
+        "INKSPRINT_DB_URL": "postgresql+psycopg://ink:pwd@db/inksprint",
+        "INKSPRINT_DB_MAX_OVERFLOW": "3",
+        "INKSPRINT_DB_ECHO": "true",
+        "INKSPRINT_SQLITE_SYNCHRONOUS": "FULL",
+    })
+    assert config["url"] == "postgresql+psycopg://ink:pwd@db/inksprint"
+    assert config["pool_size"] == 4
+    assert config["max_overflow"] == 3
+    assert config["echo"] is True
+    assert config["sqlite_pragmas"]["cache_size"] == -1024
+    assert config["sqlite_pragmas"]["synchronous"] == "FULL"
+    # 未覆盖的保持默认
+    assert config["sqlite_pragmas"]["journal_mode"] == "WAL"
+
+
+def test_sqlite_pragmas_applied():
+    db = DatabaseManager(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'pragma.db')}",
+                         config=load_db_config(environ={}))
+    with db.engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+        assert conn.execute(text("PRAGMA cache_size")).scalar() == -65536
+
+
+def test_concurrent_writers_do_not_lock():
+    db = DatabaseManager(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'writers.db')}",
+                         config=load_db_config(environ={}))
+    db.init_db()
+    session = db.get_session()
+    user = User(username="busy_writer", password_hash="x")
+    session.add(user)
+    session.commit()
+    user_id = user.id
+    session.close()
+
+    errors = []
+
+    def writer(worker):
+        for i in range(40):
+            session = db.get_session()
+            try:
+                session.add(DailyReport(user_id=user_id, total_words=worker * 1000 + i))
+                session.commit()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                session.close()
+
+    threads = [threading.Thread(target=writer, args=(w,)) for w in range(8)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+
+    assert not errors, errors[:1]
+    session = db.get_session()
+    assert session.query(DailyReport).count() == 8 * 40
+    session.close()
+
+
+def test_schema_and_queries_compile_for_postgresql():
+    dialect = postgresql.dialect()
+    for table in Base.metadata.sorted_tables:
+        ddl = str(CreateTable(table).compile(dialect=dialect))
+        assert "CREATE TABLE" in ddl
+        for index in table.indexes:
+            str(CreateIndex(index).compile(dialect=dialect))
+
+    # 处理函数实际执行的查询；会话绑定到 PostgreSQL 方言，按方言分支的桶函数走 PostgreSQL 写法
+    session = Session(bind=create_mock_engine("postgresql://", lambda *args, **kwargs: None))
+    start, end = date(2024, 1, 1), date(2024, 12, 31)
+    for query in (queries.friend_requests_query(session, 1),
+                  queries.recent_messages_query(session, 20),
+                  queries.group_messages_query(session, 1, since_id=5),
+                  queries.group_messages_query(session, 1, before_id=5),
+                  rollups.productive_hours_query(session, 1, start, end)):
+        sql = str(query.statement.compile(dialect=dialect))
+        assert "SELECT" in sql and "strftime" not in sql
+    for granularity in ("week", "month", "year"):
+        sql = str(queries.report_totals_query(session, 1, start, end, granularity).statement.compile(dialect=dialect))
+        assert "date_trunc" in sql and "strftime" not in sql, granularity
+    # 汇总重建 (rollups.rebuild) 的小时/天桶
+    assert "date_trunc" in str(select(queries.hour_bucket(session, DetailRecord.end_time)).compile(dialect=dialect))
+    assert "CAST" in str(select(queries.day_of(session, DetailRecord.end_time)).compile(dialect=dialect))
+    session.close()
+
+
+def test_in_memory_database_writes_through_writer_thread():
+    """内存库：单写线程与读会话看到的是同一个库"""
+    db = DatabaseManager("sqlite://")
+    db.init_db()
+
+    def add_user(session, name):
+        session.add(User(username=name, password_hash="x"))
+        session.flush()
+
+    def failing(session):
+        add_user(session, "rolled_back")
+        raise RuntimeError("boom")
+
+    db.write(add_user, "memory_writer")
+    try:
+        db.write(failing)
+    except RuntimeError:
+        pass
+    session = db.get_read_session()
+    try:
+        assert [u.username for u in session.query(User)] == ["memory_writer"]
+    finally:
+        session.close()
+
+
+def test_init_db_adds_indexes_to_existing_tables():
+    """旧库的表已存在：init_db 仍要补建后来新增的索引"""
+    db = DatabaseManager(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'legacy.db')}")
+    db.init_db()
+    with db.engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_daily_user_date"))
+        conn.execute(text("DROP INDEX ix_detail_user_end"))
+    db.init_db()
+    with db.engine.connect() as conn:
+        names = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+    assert {"ix_daily_user_date", "ix_detail_user_end"} <= names
+
+
+def test_postgresql_instance():
+    """设置 INKSPRINT_TEST_PG_URL 时在真实 PostgreSQL 上建表并读写"""
+    url = os.environ.get("INKSPRINT_TEST_PG_URL")
+    if not url:
+        pytest.skip("INKSPRINT_TEST_PG_URL not set")
+    db = DatabaseManager(url, config=load_db_config(environ={}))
+    assert db.dialect == "postgresql"
+    db.init_db()
+    session = db.get_session()
+    try:
+        user = User(username="pg_writer", password_hash="x")
+        session.add(user)
+        session.flush()
+        assert queries.incoming_friend_requests(session, user.id) == []
+        assert queries.report_totals(session, user.id, date(2024, 1, 1), date(2024, 12, 31), "month") == []
+        session.rollback()
+    finally:
+        session.close()
@@ -0,0 +1,101 @@
+# server/test_db_writer.py
+# 单写线程：并发写入不再互相冲突，同批任务合并提交，单个任务失败不影响其它任务；读连接只读
+import os
+import tempfile
+import threading
+import time
+
+from sqlalchemy.exc import OperationalError
+
+from database import DatabaseManager, DailyReport, User, load_db_config
+
+
+def make_db(name):
+    db = DatabaseManager(f"sqlite:///{os.path.join(tempfile.mkdtemp(), name)}", config=load_db_config(environ={}))
+    db.init_db()
+    session = db.get_session()
+    user = User(username=f"{name}_writer", password_hash="x")
+    session.add(user)
+    session.commit()
+    user_id = user.id
+    session.close()
+    return db, user_id
+
+
+def test_concurrent_writes_are_serialised_and_batched():
+    db, user_id = make_db("writer.db")
+    errors = []
+
+    def add_report(session, words):
+        session.add(DailyReport(user_id=user_id, total_words=words))
+        return words
+
+    def worker(w):
+        for i in range(50):
+            try:
+                assert db.write(add_report, w * 100 + i) == w * 100 + i
+            except Exception as e:
+                errors.append(e)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(w,)) for w in range(16)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    elapsed = time.perf_counter() - start
+
+    assert not errors, errors[:1]
+    writer = db.writer
+    print(f"[Writer] {writer.completed} writes in {writer.commits} commits, {writer.completed / elapsed:.0f} writes/s")
+    assert writer.completed == 16 * 50
+    # 排队的写入合并提交
+    assert writer.commits < writer.completed
+
+    session = db.get_read_session()
+    try:
+        assert session.query(DailyReport).count() == 16 * 50
+    finally:
+        session.close()
+
+
+def test_failed_task_only_rolls_back_itself():
+    db, user_id = make_db("savepoint.db")
+
+    def add_report(session, words):
+        session.add(DailyReport(user_id=user_id, total_words=words))
+
+    def broken(session):
+        session.add(DailyReport(user_id=user_id, total_words=-1))
+        session.flush()
+        raise ValueError("boom")
+
+    # 卡住写线程，让后面三个任务进入同一批
+    gate = threading.Event()
+    blocker = db.writer.submit(lambda session: gate.wait(5))
+    futures = [db.writer.submit(add_report, 1), db.writer.submit(broken), db.writer.submit(add_report, 2)]
+    gate.set()
+    blocker.result(5)
+
+    assert futures[0].result(5) is None
+    assert isinstance(futures[1].exception(5), ValueError)
+    assert futures[2].result(5) is None
+
+    session = db.get_read_session()
+    try:
+        assert sorted(r.total_words for r in session.query(DailyReport)) == [1, 2]
+    finally:
+        session.close()
+
+
+def test_read_sessions_are_read_only():
+    db, user_id = make_db("readonly.db")
+    session = db.get_read_session()
+    try:
+        session.add(DailyReport(user_id=user_id, total_words=1))
+        try:
+            session.commit()
+        except OperationalError:
+            session.rollback()
+            return
+        assert False, "read session should reject writes"
+    finally:
+        session.close()
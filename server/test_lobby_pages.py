@@ -0,0 +1,104 @@
+# server/test_lobby_pages.py
+# 大厅分页：游标翻页不重不漏，筛选与房间名搜索正确，几千个房间时单页耗时不随房间总数增长
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import main as server_main
+from database import DatabaseManager, User, Group
+from shared.room_rules import name_matches
+
+
+def seed(db, n_rooms):
+    session = db.get_session()
+    try:
+        owner = User(username="pages_owner", password_hash="x", nickname="Owner")
+        viewer = User(username="pages_viewer", password_hash="x")
+        session.add_all([owner, viewer])
+        session.flush()
+        base = datetime(2024, 1, 1)
+        names = ["Night Owls", "Morning Larks", "小说冲刺", "Poetry"]
+        rooms = [Group(name=f"{names[i % 4]} {i}", owner_id=owner.id, password="pw" if i % 5 == 0 else None,
+                       sprint_active=(i % 7 == 0), updated_at=base + timedelta(seconds=i // 2))
+                 for i in range(n_rooms)]
+        session.add_all(rooms)
+        session.commit()
+        return viewer.id
+    finally:
+        session.close()
+
+
+def fetch_all(handler, **params):
+    pages, cards, cursor = 0, [], None
+    while True:
+        request = dict(params, limit=40)
+        if cursor: request["cursor"] = cursor
+        response = handler.handle_get_lobby_data(request)
+        pages += 1
+        assert response["append"] == bool(cursor)
+        cards.extend(response["data"])
+        cursor = response["next_cursor"]
+        if not cursor: return cards, pages
+
+
+def test_cursor_pages_filters_and_search():
+    db = DatabaseManager(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'pages.db')}")
+    db.init_db()
+    viewer_id = seed(db, 3000)
+
+    original_db = server_main.db_manager
+    server_main.db_manager = db
+    server_main.room_registry.load(db)
+    try:
+        # 每 3 个房间中有 1 个满员：直接在内存里塞满 (一个用户只能在一个房间)
+        for i, room in enumerate(sorted(server_main.room_registry.rooms.values(), key=lambda r: r.group_id)):
+            if i % 3 == 0:
+                room.members.update(range(-10, 0))
+        server_main.change_counters.bump(server_main.LOBBY_KEY)
+
+        handler = server_main.ClientHandler(None, None, None, None)
+        handler.user_id = viewer_id
+
+        cards, pages = fetch_all(handler)
+        rooms = server_main.room_registry.rooms.values()
+        expected = [r.group_id for r in sorted(rooms, key=lambda r: (r.updated_at, r.group_id), reverse=True)]
+        assert [c["id"] for c in cards] == expected
+        assert pages == 3000 // 40  # 最后一页恰好满页时不再给游标
+
+        cards, _ = fetch_all(handler, filters={"has_space": True, "not_sprinting": True, "no_password": True})
+        assert cards and all(c["member_count"] < 10 and not c["sprint_active"] and not c["has_password"]
+                             for c in cards)
+        assert len(cards) == sum(1 for r in rooms if len(r.members) < 10 and not r.sprint_active and not r.password)
+
+        # 子串、中文与单字前缀搜索
+        owls, _ = fetch_all(handler, query="owls 1")
+        assert owls and all("owls 1" in c["name"].lower() for c in owls)
+        assert {c["name"] for c in owls} == {r.name for r in rooms if "owls 1" in r.name.lower()}
+        novels, _ = fetch_all(handler, query="冲刺")
+        assert len(novels) == 750
+        assert {c["name"][0] for c in fetch_all(handler, query="p")[0]} == {"P"}
+        assert handler.handle_get_lobby_data({"query": "nothing like this"})["data"] == []
+        # 客户端过滤增量推送的卡片用同一个规则，结果与服务器一致
+        for query in ("p", "s", "1", "owls 1", "冲刺", "ry 3"):
+            assert {c["id"] for c in fetch_all(handler, query=query)[0]} == \
+                   {r.group_id for r in rooms if name_matches(r.name, query)}, query
+
+        # 翻到靠后的一页与第一页耗时相当 (游标二分定位，不从头扫描)
+        first = handler.handle_get_lobby_data({"limit": 20})
+        cursor = first["next_cursor"]
+        for _ in range(100):
+            cursor = handler.handle_get_lobby_data({"limit": 20, "cursor": cursor})["next_cursor"]
+        server_main.response_cache.clear()
+        start = time.perf_counter()
+        for _ in range(200):
+            handler.build_lobby({"limit": 20})
+        head = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(200):
+            handler.build_lobby({"limit": 20, "cursor": cursor})
+        deep = time.perf_counter() - start
+        print(f"[Lobby Pages] 3000 rooms: first page {head / 200 * 1000:.3f} ms, page 100 {deep / 200 * 1000:.3f} ms")
+        assert deep < head * 3 + 0.01
+    finally:
+        server_main.db_manager = original_db
@@ -0,0 +1,102 @@
+# server/test_lobby_snapshot.py
+# 大厅共享快照：结果与 SQL 版本一致，所有用户共用一次重建，每次请求至多一条语句 (好友集合)
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func, or_, and_, case
+
+import main as server_main
+from database import DatabaseManager, User, Friendship, Group, GroupMember
+
+
+def sql_lobby(session, user_id, limit=50):
+    """对照用的 SQL 版本：公开房间 + 自己或好友的私密房间，[(房间 ID, 成员数)]"""
+    friend_ids = session.query(
+        case((Friendship.user_a_id == user_id, Friendship.user_b_id), else_=Friendship.user_a_id)
+    ).filter(or_(Friendship.user_a_id == user_id, Friendship.user_b_id == user_id))
+    member_counts = session.query(
+        GroupMember.group_id.label("group_id"),
+        func.count(GroupMember.id).label("member_count")
+    ).group_by(GroupMember.group_id).subquery()
+    allowed_owner = or_(Group.owner_id == user_id, Group.owner_id.in_(friend_ids))
+    return session.query(Group.id, func.coalesce(member_counts.c.member_count, 0)) \
+        .outerjoin(member_counts, member_counts.c.group_id == Group.id) \
+        .filter(or_(Group.is_private == False, and_(Group.is_private == True, allowed_owner))) \
+        .order_by(Group.updated_at.desc()).limit(limit).all()
+
+
+def seed(db, n_users, n_rooms):
+    """每 3 个房间里有 1 个私密房间；用户 i 与 i+1 互为好友"""
+    session = db.get_session()
+    try:
+        users = [User(username=f"lobby_{i}", password_hash="x", nickname=f"L{i}") for i in range(n_users)]
+        session.add_all(users)
+        session.flush()
+        for a, b in zip(users, users[1:]):
+            session.add(Friendship(user_a_id=min(a.id, b.id), user_b_id=max(a.id, b.id)))
+        base = datetime(2024, 1, 1)
+        rooms = [Group(name=f"room_{i}", owner_id=users[i % n_users].id, is_private=(i % 3 == 0),
+                       updated_at=base + timedelta(minutes=i)) for i in range(n_rooms)]
+        session.add_all(rooms)
+        session.flush()
+        for i, room in enumerate(rooms):
+            session.add(GroupMember(group_id=room.id, user_id=users[i % n_users].id))
+        session.commit()
+        return [u.id for u in users]
+    finally:
+        session.close()
+
+
+def test_snapshot_matches_sql_and_is_shared():
+    db = DatabaseManager(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'lobby.db')}")
+    db.init_db()
+    ids = seed(db, 200, 120)
+
+    original_db = server_main.db_manager
+    server_main.db_manager = db
+    server_main.room_registry.load(db)
+    try:
+        rebuilds = server_main.lobby.rebuilds
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.read_engine, "before_cursor_execute", listener)
+        start = time.perf_counter()
+        try:
+            views = {}
+            for uid in ids:
+                handler = server_main.ClientHandler(None, None, None, None)
+                handler.user_id = uid
+                views[uid] = handler.handle_get_lobby_data({})["data"]
+        finally:
+            event.remove(db.read_engine, "before_cursor_execute", listener)
+        elapsed = time.perf_counter() - start
+        print(f"[Lobby] {len(ids)} users: {elapsed / len(ids) * 1000:.2f} ms/request, {len(statements)} statements")
+
+        # 公开部分只重建一次，每个用户只查一次好友集合
+        assert server_main.lobby.rebuilds == rebuilds + 1
+        assert len(statements) <= len(ids)
+
+        session = db.get_read_session()
+        try:
+            for uid in (ids[0], ids[3], ids[100]):
+                expected = [tuple(row) for row in sql_lobby(session, uid)]
+                assert [(c["id"], c["member_count"]) for c in views[uid]] == expected
+        finally:
+            session.close()
+
+        # 房间变化后快照重建，房主资料来自内存
+        owner = server_main.ClientHandler(None, None, None, None)
+        owner.user_id, owner.nickname = ids[150], "L150"
+        group_id = owner.handle_create_group({"name": "Newest"})["group_id"]
+        handler = server_main.ClientHandler(None, None, None, None)
+        handler.user_id = ids[7]
+        first = handler.handle_get_lobby_data({})["data"][0]
+        assert (first["id"], first["owner_nickname"], first["member_count"]) == (group_id, "L150", 1)
+        assert server_main.lobby.rebuilds == rebuilds + 2
+
+        owner.handle_update_profile({"nickname": "Renamed"})
+        assert handler.handle_get_lobby_data({})["data"][0]["owner_nickname"] == "Renamed"
+    finally:
+        server_main.db_manager = original_db
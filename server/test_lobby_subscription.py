@@ -0,0 +1,82 @@
+# server/test_lobby_subscription.py
+# 大厅订阅：房间变化只以增量推给订阅者，私密房间只推给房主的好友，退订/断开后不再推送
+import os
+import tempfile
+
+import main as server_main
+from database import DatabaseManager, User, Friendship
+
+
+def connect(user_id):
+    """登记一个已登录的连接，send_packet 改为记录下发的消息"""
+    handler = server_main.ClientHandler(None, None, None, None)
+    handler.user_id = user_id
+    handler.username = handler.nickname = f"sub_{user_id}"
+    handler.inbox = []
+    handler.send_packet = handler.inbox.append
+    server_main.presence.connect(user_id, handler)
+    return handler
+
+
+def deltas(handler):
+    found = [m for m in handler.inbox if m["type"] == "lobby_delta"]
+    handler.inbox.clear()
+    return [(m["op"], {k: v for k, v in m.items() if k not in ("type", "op", "group_id")}) for m in found]
+
+
+def test_room_events_reach_only_subscribers():
+    db = DatabaseManager(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'subs.db')}")
+    db.init_db()
+    session = db.get_session()
+    users = [User(username=f"sub_{i}", password_hash="x") for i in range(4)]
+    session.add_all(users)
+    session.flush()
+    owner_id, friend_id, stranger_id, idle_id = (u.id for u in users)
+    session.add(Friendship(user_a_id=min(owner_id, friend_id), user_b_id=max(owner_id, friend_id)))
+    session.commit()
+    session.close()
+
+    original_db = server_main.db_manager
+    server_main.db_manager = db
+    server_main.room_registry.load(db)
+    owner, friend, stranger, idle = (connect(uid) for uid in (owner_id, friend_id, stranger_id, idle_id))
+    try:
+        # 订阅即返回当前大厅
+        assert friend.handle_lobby_subscribe({})["type"] == "group_list_response"
+        stranger.handle_lobby_subscribe({})
+
+        group_id = owner.handle_create_group({"name": "Public"})["group_id"]
+        assert [op for op, _ in deltas(friend)] == ["added"]
+        added = deltas(stranger)
+        assert added[0][1]["card"]["name"] == "Public" and added[0][1]["card"]["member_count"] == 1
+        assert deltas(idle) == [] and deltas(owner) == []
+
+        stranger.handle_join_group({"group_id": group_id})
+        assert deltas(friend) == [("updated", {"member_count": 2})]
+
+        owner.handle_sprint_control({"group_id": group_id, "action": "start", "target": 10})
+        assert deltas(friend) == [("updated", {"sprint_active": True})]
+
+        # 解散：订阅者收到 removed，房间成员收到 group_disbanded
+        stranger.inbox.clear()
+        owner.handle_leave_group({"group_id": group_id})
+        assert deltas(friend) == [("removed", {})]
+        assert {"type": "group_disbanded", "group_id": group_id} in stranger.inbox
+        assert not any(m["type"] == "refresh_groups" for h in (owner, friend, stranger, idle) for m in h.inbox)
+
+        # 私密房间只推给房主的好友
+        stranger.inbox.clear()
+        owner.handle_create_group({"name": "Secret", "is_private": True})
+        assert [op for op, _ in deltas(friend)] == ["added"]
+        assert deltas(stranger) == []
+
+        # 退订后不再推送
+        friend.handle_lobby_unsubscribe({})
+        owner.handle_sprint_control({"group_id": server_main.room_registry.room_of(owner_id).group_id,
+                                     "action": "start", "target": 5})
+        assert deltas(friend) == []
+    finally:
+        for handler in (owner, friend, stranger, idle):
+            server_main.presence.disconnect(handler.user_id, handler)
+            server_main.lobby.unsubscribe(handler.user_id)
+        server_main.db_manager = original_db
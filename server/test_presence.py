@@ -0,0 +1,98 @@
+# server/test_presence.py
+# 在线状态：多端登录互不顶替，上下线合并后推给在线好友 (重连抖动不推送)，批量查询不需要会话表的锁
+import os
+import tempfile
+import threading
+
+import main as server_main
+from database import DatabaseManager, User, Friendship
+
+
+def login(username):
+    """一个已握手的会话登录，send_packet 改为记录下发的消息"""
+    handler = server_main.ClientHandler(None, None, None, None)
+    handler.inbox = []
+    handler.send_packet = handler.inbox.append
+    assert handler.handle_login({"username": username, "password": "x"})["status"] == "success"
+    return handler
+
+
+def pushes(handler):
+    found = [m for m in handler.inbox if m["type"] == "presence_update"]
+    handler.inbox.clear()
+    return [(sorted(m["online"]), sorted(m["offline"])) for m in found]
+
+
+def flush():
+    changes = server_main.presence.take_changes()
+    if changes: server_main.publish_presence(changes)
+
+
+def test_sessions_coalescing_and_bulk_lookup():
+    db = DatabaseManager(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'presence.db')}")
+    db.init_db()
+    session = db.get_session()
+    users = [User(username=f"presence_{i}", password_hash="x") for i in range(4)]
+    session.add_all(users)
+    session.flush()
+    me, friend, other_friend, stranger = (u.id for u in users)
+    for fid in (friend, other_friend):
+        session.add(Friendship(user_a_id=min(me, fid), user_b_id=max(me, fid)))
+    session.commit()
+    session.close()
+
+    original_db = server_main.db_manager
+    server_main.db_manager = db
+    server_main.room_registry.load(db)
+    server_main.friend_graph.load(db)
+    presence = server_main.presence
+    sessions = []
+    try:
+        watcher = login("presence_1")
+        outsider = login("presence_3")
+        sessions += [watcher, outsider]
+        flush()
+        watcher.inbox.clear()
+
+        # 两端登录：第二个会话不顶替第一个，消息两端都收到
+        desktop, laptop = login("presence_0"), login("presence_0")
+        sessions += [desktop, laptop]
+        server_main.broadcast_to_users([me], {"type": "ping"})
+        assert {"type": "ping"} in desktop.inbox and {"type": "ping"} in laptop.inbox
+        flush()
+        assert pushes(watcher) == [([me], [])]
+        assert outsider.inbox == []  # 只推给好友
+
+        # 关掉一端仍在线，不推送
+        laptop.sign_out()
+        assert presence.is_online(me)
+        flush()
+        assert pushes(watcher) == []
+
+        # 间隔内断线又重连：状态没变，不推送
+        desktop.sign_out()
+        assert not presence.is_online(me)
+        desktop = login("presence_0")
+        sessions.append(desktop)
+        flush()
+        assert pushes(watcher) == []
+
+        # 真正下线才推送；好友列表里的状态同时更新
+        assert [f["status"] for f in watcher.handle_get_friends({})["data"]] == ["Online"]
+        desktop.sign_out()
+        flush()
+        assert pushes(watcher) == [([], [me])]
+        assert [f["status"] for f in watcher.handle_get_friends({})["data"]] == ["Offline"]
+
+        # 批量查询不需要锁：会话表被占用时照样返回
+        result = []
+        with presence.lock:
+            reader = threading.Thread(target=lambda: result.append(presence.online_among([me, friend, stranger])))
+            reader.start()
+            reader.join(2)
+        assert result == [[friend, stranger]]
+    finally:
+        for handler in sessions:
+            handler.sign_out()
+        presence.take_changes()
+        server_main.db_manager = original_db
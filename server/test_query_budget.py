@@ -0,0 +1,147 @@
+# server/test_query_budget.py
+# 每个列表类处理函数的 SQL 条数预算：条数必须是常数，不随好友/房间/成员数量增长 (防止 N+1)
+import os
+import tempfile
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+import main as server_main
+from database import DatabaseManager, User, FriendRequest, Friendship, Group, GroupMember, GroupMessage, \
+    SprintScore
+from friend_graph import FriendGraph
+from lobby import LobbySnapshot
+from room_registry import RoomRegistry
+from user_index import UserIndex
+from shared.heatmap_codec import HeatmapCodec
+
+# 处理函数 -> 允许执行的最大语句数 (大厅、搜索走内存快照/索引，不查库)
+QUERY_BUDGET = {
+    "get_friends": 1,
+    "get_friend_requests": 1,
+    "get_public_groups": 0,
+    "get_group_detail": 1,
+    "get_group_messages": 1,
+    "search_user": 0,
+    "get_analytics": 1,
+    "get_analytics_series": 1,
+    "get_productive_hours": 1,
+}
+# 主房间的历史消息条数，超过房间缓冲区，向上翻页时查库
+MESSAGES = 300
+
+
+def seed(db, n):
+    """1 个主用户 + n 个好友 (同时发来好友请求)，n 个房间，主房间里 n 个好友与主用户及 MESSAGES 条消息"""
+    session = db.get_session()
+    try:
+        me = User(username="budget_me", password_hash="x")
+        session.add(me)
+        others = [User(username=f"budget_{i}", password_hash="x") for i in range(n)]
+        session.add_all(others)
+        session.flush()
+
+        for u in others:
+            a, b = sorted([me.id, u.id])
+            session.add(Friendship(user_a_id=a, user_b_id=b))
+            session.add(FriendRequest(sender_id=u.id, receiver_id=me.id))
+
+        rooms = [Group(name=f"room_{i}", owner_id=others[i].id, is_private=(i % 2 == 1)) for i in range(n)]
+        session.add_all(rooms)
+        session.flush()
+        for u in others:
+            session.add(GroupMember(group_id=rooms[0].id, user_id=u.id))
+            session.add(SprintScore(group_id=rooms[0].id, user_id=u.id, current_score=u.id * 10))
+        session.add(GroupMember(group_id=rooms[0].id, user_id=me.id))
+        session.add_all(GroupMessage(group_id=rooms[0].id, user_id=others[i % n].id, user_nickname="budget",
+                                     content=f"message {i}") for i in range(MESSAGES))
+        session.commit()
+        return me.id, rooms[0].id
+    finally:
+        session.close()
+
+
+@contextmanager
+def count_statements(engine):
+    counter = {"n": 0}
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        counter["n"] += 1
+
+    event.listen(engine, "before_cursor_execute", on_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", on_execute)
+
+
+def measure(n):
+    db = DatabaseManager(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'budget.db')}")
+    db.init_db()
+    user_id, room_id = seed(db, n)
+
+    # 换上只属于本次测量的内存状态，结束后放回，不影响后面的测试
+    originals = (server_main.db_manager, server_main.room_registry, server_main.friend_graph,
+                 server_main.lobby, server_main.user_index)
+    try:
+        server_main.db_manager = db
+        server_main.room_registry = RoomRegistry()
+        server_main.friend_graph = FriendGraph()
+        server_main.lobby = LobbySnapshot(server_main.room_registry, server_main.friend_graph,
+                                          server_main.load_avatar_base64)
+        server_main.user_index = UserIndex()
+        server_main.room_registry.load(db)
+        server_main.friend_graph.load(db)
+        server_main.user_index.load(db)
+        handler = server_main.ClientHandler(None, None, None, None)
+        handler.user_id = user_id
+        calls = {
+            "get_friends": lambda: handler.handle_get_friends({}),
+            "get_friend_requests": lambda: handler.handle_get_friend_requests({}),
+            "get_public_groups": lambda: handler.handle_get_lobby_data({}),
+            "get_group_detail": lambda: handler.handle_get_group_detail({"group_id": room_id}),
+            "get_group_messages": lambda: handler.handle_get_group_messages({"group_id": room_id, "before_id": 60}),
+            "search_user": lambda: handler.handle_search_user({"query": "budget"}),
+            "get_analytics": lambda: handler.handle_get_analytics({"encoding": HeatmapCodec.ENCODING}),
+            "get_analytics_series": lambda: handler.handle_get_analytics_series({"granularity": "month"}),
+            "get_productive_hours": lambda: handler.handle_get_productive_hours({}),
+        }
+        counts, responses = {}, {}
+        for name, call in calls.items():
+            with count_statements(db.read_engine) as counter:
+                responses[name] = call()
+            counts[name] = counter["n"]
+        return counts, responses
+    finally:
+        (server_main.db_manager, server_main.room_registry, server_main.friend_graph,
+         server_main.lobby, server_main.user_index) = originals
+
+
+def test_handlers_stay_within_query_budget():
+    shared = (server_main.db_manager, server_main.room_registry, server_main.friend_graph,
+              server_main.lobby, server_main.user_index)
+    small, _ = measure(3)
+    large, responses = measure(40)
+    assert (server_main.db_manager, server_main.room_registry, server_main.friend_graph,
+            server_main.lobby, server_main.user_index) == shared
+
+    for name, budget in QUERY_BUDGET.items():
+        print(f"[Budget] {name}: {small[name]} / {large[name]} statements (budget {budget})")
+        assert large[name] <= budget, name
+        assert large[name] == small[name], name
+
+    # 结果本身也要正确
+    assert len(responses["get_friends"]["data"]) == 40
+    assert len(responses["get_friend_requests"]["data"]) == 40
+    lobby = responses["get_public_groups"]["data"]
+    assert len(lobby) == 40  # 私密房间的房主都是好友
+    assert {g["name"]: g["member_count"] for g in lobby}["room_0"] == 41
+    assert all(g["owner_nickname"] != "Unknown" for g in lobby)
+    board = responses["get_group_detail"]["leaderboard"]
+    assert len(board) == 41
+    assert board[0]["word_count"] == max(b["word_count"] for b in board)
+    page = responses["get_group_messages"]
+    assert len(page["messages"]) == 50 and page["has_more"]
+    assert len(responses["search_user"]["data"]) > 0
+    for name in ("get_analytics", "get_analytics_series", "get_productive_hours"):
+        assert responses[name]["status"] == "success", name
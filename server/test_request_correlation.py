@@ -0,0 +1,77 @@
+# server/test_request_correlation.py
+# 请求号回显 + Future 接口：流水线发送、同参数只读请求合并、超时、耗时统计
+import os
+import tempfile
+import time
+
+from PyQt6.QtCore import QCoreApplication
+
+import main as server_main
+from database import DatabaseManager, User
+from client.core.network import NetworkManager
+from test_sync_reconnect import start_local_server, wait_until
+
+
+def test_requests_are_correlated_and_collapsed():
+    app = QCoreApplication.instance() or QCoreApplication([])
+    tmp_dir = tempfile.mkdtemp()
+    db = DatabaseManager(f"sqlite:///{os.path.join(tmp_dir, 'rpc.db')}")
+    db.init_db()
+    session = db.get_session()
+    session.add(User(username="rpc_writer", password_hash="pwd_hash"))
+    session.add(User(username="rpc_friend", password_hash="pwd_hash", nickname="Friend"))
+    session.commit()
+    session.close()
+
+    original_db = server_main.db_manager
+    listener = start_local_server(db)
+    net = NetworkManager(host='127.0.0.1', port=listener.getsockname()[1])
+    try:
+        assert net.connect_and_handshake()
+        net.start()
+
+        login = net.request({"type": "login", "username": "rpc_writer", "password": "pwd_hash"})
+        assert login.result(5)["status"] == "success"
+        assert wait_until(lambda: net.logged_in, 5)
+
+        # 同参数的只读请求在途时合并为一个 (先扣住发送，保证第一个请求仍在途)
+        replies = []
+        held = []
+        real_send = net.send_request
+        net.send_request = lambda data: held.append(data) or True
+        f1 = net.request({"type": "get_friends"}, callback=replies.append)
+        f2 = net.request({"type": "get_friends"}, callback=replies.append)
+        net.send_request = real_send
+        assert f1 is f2
+        assert len(held) == 1
+        real_send(held[0])
+
+        # 不等回复连续发送，回复按 req_id 各归其主
+        searches = {q: net.request({"type": "search_user", "query": q})
+                    for q in ("rpc_friend", "nobody", "rpc_writer", "ghost")}
+        for q, future in searches.items():
+            status = future.result(5)["status"]
+            assert status == ("success" if q.startswith("rpc") else "fail"), q
+        assert f1.result(5)["type"] == "get_friends_response"
+
+        # 回调在主线程事件循环中执行
+        assert wait_until(lambda: app.processEvents() or len(replies) == 2, 5)
+
+        # 服务器不回复的请求按超时失败
+        errors = []
+        silent = net.request({"type": "group_chat", "group_id": 0, "content": "hi"}, timeout=0.2,
+                             on_error=errors.append)
+        time.sleep(0.3)
+        net._expire_requests()
+        assert isinstance(silent.exception(1), TimeoutError)
+        assert wait_until(lambda: app.processEvents() or errors == ["timeout"], 5)
+
+        stats = net.latency_summary()
+        assert stats["search_user"]["count"] == 4
+        assert stats["get_friends"]["count"] == 1
+        assert not net.pending_requests and not net.inflight_reads
+    finally:
+        net.close()
+        net.wait(2000)
+        listener.close()
+        server_main.db_manager = original_db
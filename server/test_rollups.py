@@ -0,0 +1,121 @@
+# server/test_rollups.py
+# 明细汇总：同步入库时增量累加的小时/天汇总与从明细表重建的结果一致；重建能修复被改坏的汇总；
+# 最高产时段只读 hourly_rollups
+import os
+import random
+import tempfile
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import event
+
+import main as server_main
+import rollups
+from database import DatabaseManager, User, HourlyRollup, DailyRollup
+
+
+def snapshot(db):
+    session = db.get_read_session()
+    try:
+        return ({(r.user_id, r.bucket_start): (r.words, r.duration_seconds, r.records)
+                 for r in session.query(HourlyRollup)},
+                {(r.user_id, r.bucket_start): (r.words, r.duration_seconds, r.records)
+                 for r in session.query(DailyRollup)})
+    finally:
+        session.close()
+
+
+def test_incremental_rollups_rebuild_and_histogram():
+    db = DatabaseManager(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'rollups.db')}")
+    db.init_db()
+    session = db.get_session()
+    users = [User(username=f"rollup_{i}", password_hash="x") for i in range(2)]
+    session.add_all(users)
+    session.commit()
+    user_ids = [u.id for u in users]
+    session.close()
+
+    original_db = server_main.db_manager
+    server_main.db_manager = db
+    server_main.room_registry.load(db)
+    try:
+        # 两个用户各写三天，每 10 秒一条，分多批同步
+        rnd = random.Random(45)
+        hourly, daily = defaultdict(lambda: [0, 0, 0]), defaultdict(lambda: [0, 0, 0])
+        for uid in user_ids:
+            handler = server_main.ClientHandler(None, None, None, None)
+            handler.user_id = uid
+            seq = 0
+            for day in range(3):
+                moment = datetime(2024, 5, 6 + day, rnd.randint(6, 20), rnd.randint(0, 59))
+                for _ in range(4):
+                    deltas = []
+                    for _ in range(rnd.randint(50, 200)):
+                        seq += 1
+                        moment += timedelta(seconds=10)
+                        words, duration = rnd.randint(0, 40), 10
+                        deltas.append({"seq": seq, "increment": words, "duration": duration,
+                                       "timestamp": moment.timestamp(), "local_date": str(moment.date())})
+                        for totals, key in ((hourly, moment.replace(minute=0, second=0)), (daily, moment.date())):
+                            totals[(uid, key)][0] += words
+                            totals[(uid, key)][1] += duration
+                            totals[(uid, key)][2] += 1
+                    assert handler.handle_sync_data({"device_id": "pc", "deltas": deltas})["applied"] == len(deltas)
+                    moment += timedelta(minutes=rnd.randint(5, 90))
+
+        expected = ({k: tuple(v) for k, v in hourly.items()}, {k: tuple(v) for k, v in daily.items()})
+        assert snapshot(db) == expected
+
+        # 重建 (set-based) 与增量结果相同
+        assert db.write(rollups.rebuild) == (len(hourly), len(daily))
+        assert snapshot(db) == expected
+
+        # 改坏一部分汇总后按用户/日期修复
+        def corrupt(session):
+            session.query(HourlyRollup).filter(HourlyRollup.user_id == user_ids[0]).update({"words": 0})
+            session.query(DailyRollup).filter(DailyRollup.bucket_start >= date(2024, 5, 7)).delete()
+        db.write(corrupt)
+        assert snapshot(db) != expected
+        db.write(rollups.rebuild, user_ids[0])
+        db.write(rollups.rebuild, None, date(2024, 5, 7))
+        assert snapshot(db) == expected
+
+        # 最高产时段：1 条语句，只读 hourly_rollups
+        handler = server_main.ClientHandler(None, None, None, None)
+        handler.user_id = user_ids[1]
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.read_engine, "before_cursor_execute", listener)
+        try:
+            response = handler.handle_get_productive_hours({"from": "2024-05-01", "to": "2024-05-31"})
+        finally:
+            event.remove(db.read_engine, "before_cursor_execute", listener)
+        assert len(statements) == 1
+        assert "hourly_rollups" in statements[0] and "detail_records" not in statements[0]
+        words = [0] * 24
+        for (uid, key), (w, _, _) in hourly.items():
+            if uid == user_ids[1]: words[key.hour] += w
+        assert response["words"] == words
+        assert response["best_hour"] == words.index(max(words))
+
+        # 范围外没有数据；非法范围
+        empty = handler.handle_get_productive_hours({"from": "2023-01-01", "to": "2023-01-31"})
+        assert empty["words"] == [0] * 24 and empty["best_hour"] is None
+        assert handler.handle_get_productive_hours({"from": "2024-05-31", "to": "2024-05-01"})["status"] == "fail"
+
+        # 默认区间 (最近 90 天) 跨过午夜后，带着昨天的版本号也要拿到新区间
+        class Tomorrow(date):
+            @classmethod
+            def today(cls):
+                return date.today() + timedelta(days=1)
+
+        version = handler.handle_get_productive_hours({})["version"]
+        assert handler.handle_get_productive_hours({"version": version})["status"] == "not_modified"
+        server_main.date = Tomorrow
+        try:
+            moved = handler.handle_get_productive_hours({"version": version})
+        finally:
+            server_main.date = date
+        assert moved["status"] == "success" and moved["to"] == str(Tomorrow.today())
+    finally:
+        server_main.db_manager = original_db
@@ -0,0 +1,135 @@
+# server/test_room_registry.py
+# 房间状态常驻内存：启动重建、写穿到库、成员判断零 SQL、并发加入不超员
+import os
+import tempfile
+import threading
+
+from sqlalchemy import event
+
+import main as server_main
+from database import DatabaseManager, User, GroupMember, SprintScore, Group
+from room_registry import RoomRegistry
+
+
+def make_handler(user_id, nickname):
+    handler = server_main.ClientHandler(None, None, None, None)
+    handler.user_id = user_id
+    handler.username = handler.nickname = nickname
+    return handler
+
+
+def setup_db(n_users):
+    db = DatabaseManager(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'rooms.db')}")
+    db.init_db()
+    session = db.get_session()
+    users = [User(username=f"room_user_{i}", password_hash="x", nickname=f"U{i}") for i in range(n_users)]
+    session.add_all(users)
+    session.commit()
+    ids = [u.id for u in users]
+    session.close()
+    return db, ids
+
+
+def test_room_lifecycle_writes_through_and_rebuilds():
+    db, ids = setup_db(3)
+    original_db = server_main.db_manager
+    server_main.db_manager = db
+    server_main.room_registry.load(db)
+    try:
+        owner, alice, bob = (make_handler(uid, f"U{i}") for i, uid in enumerate(ids))
+        group_id = owner.handle_create_group({"name": "Night Owls", "password": "owl"})["group_id"]
+
+        assert alice.handle_join_group({"group_id": group_id})["msg"] == "password_required"
+        assert alice.handle_join_group({"group_id": group_id, "password": "owl"})["status"] == "success"
+        assert bob.handle_join_group({"group_id": group_id, "password": "owl"})["status"] == "success"
+
+        owner.handle_sprint_control({"group_id": group_id, "action": "start", "target": 100})
+        assert bob.handle_join_group({"group_id": group_id})["status"] == "success"  # 已在房间内
+        alice.handle_sync_data({"type": "sync_data", "device_id": "a", "deltas": [
+            {"seq": 1, "increment": 120, "duration": 0, "local_date": "2024-05-01"}]})
+        bob.handle_sync_data({"type": "sync_data", "device_id": "b", "deltas": [
+            {"seq": 1, "increment": 30, "duration": 0, "local_date": "2024-05-01"}]})
+
+        room = server_main.room_registry.get(group_id)
+        assert room.members == set(ids)
+        assert room.scores == {ids[1]: 120, ids[2]: 30}
+
+        # 发消息时的成员判断与广播名单不查库
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.read_engine, "before_cursor_execute", listener)
+        try:
+            bob.handle_send_group_msg({"group_id": group_id, "content": "hi"})
+        finally:
+            event.remove(db.read_engine, "before_cursor_execute", listener)
+        assert statements == []
+
+        detail = owner.handle_get_group_detail({"group_id": group_id})
+        assert [r["word_count"] for r in detail["leaderboard"]] == [120, 30, 0]
+        assert detail["leaderboard"][0]["reached_target"] is True
+        assert detail["chat_history"][-1]["content"] == "hi"
+
+        # 得分先只在内存中，定期写回
+        session = db.get_session()
+        try:
+            assert session.query(SprintScore).count() == 0
+        finally:
+            session.close()
+        assert server_main.room_registry.flush(db) == 2
+
+        bob.handle_leave_group({"group_id": group_id})
+
+        # 重启：从库中重建的状态与内存一致
+        rebuilt = RoomRegistry()
+        rebuilt.load(db)
+        again = rebuilt.get(group_id)
+        assert again.members == {ids[0], ids[1]}
+        assert again.scores == {ids[1]: 120}
+        assert again.sprint_active and again.sprint_target_words == 100
+        assert rebuilt.room_of(ids[2]) is None
+
+        # 房主离开即解散
+        owner.handle_leave_group({"group_id": group_id})
+        assert server_main.room_registry.get(group_id) is None
+        assert server_main.room_registry.room_of(ids[1]) is None
+        session = db.get_session()
+        try:
+            assert session.query(Group).count() == 0
+            assert session.query(GroupMember).count() == 0
+        finally:
+            session.close()
+    finally:
+        server_main.db_manager = original_db
+
+
+def test_concurrent_joins_respect_capacity():
+    db, ids = setup_db(20)
+    original_db = server_main.db_manager
+    server_main.db_manager = db
+    server_main.room_registry.load(db)
+    try:
+        owner = make_handler(ids[0], "owner")
+        group_id = owner.handle_create_group({"name": "Crowded"})["group_id"]
+
+        results = []
+        barrier = threading.Barrier(len(ids) - 1)
+
+        def join(uid):
+            handler = make_handler(uid, str(uid))
+            barrier.wait()
+            results.append(handler.handle_join_group({"group_id": group_id})["status"])
+
+        threads = [threading.Thread(target=join, args=(uid,)) for uid in ids[1:]]
+        for t in threads: t.start()
+        for t in threads: t.join()
+
+        assert results.count("success") == 9
+        assert len(server_main.room_registry.get(group_id).members) == 10
+        session = db.get_session()
+        try:
+            assert session.query(GroupMember).filter_by(group_id=group_id).count() == 10
+            assert session.query(SprintScore).count() == 0
+        finally:
+            session.close()
+    finally:
+        server_main.db_manager = original_db
@@ -0,0 +1,286 @@
+# server/test_sync_reconnect.py
+# 断线重连 + 离线同步队列：本地起服务器，中间加一个随机掐断连接的代理，确认字数不丢也不重复
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+from datetime import date
+
+import main as server_main
+from database import DatabaseManager, User, DailyReport, DetailRecord, SyncDevice
+from shared.security import SecurityManager
+from client.core.network import NetworkManager
+from client.core.sync_queue import SyncQueue
+
+
+def start_local_server(db):
+    """在随机端口上运行真实的 ClientHandler，数据库替换为临时库 (调用方负责还原)"""
+    server_main.db_manager = db
+    private_key, public_key = SecurityManager.generate_rsa_keys()
+    public_key_bytes = SecurityManager.public_key_to_bytes(public_key)
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(16)
+
+    def accept_loop():
+        while True:
+            try:
+                conn, addr = listener.accept()
+            except OSError:
+                return
+            server_main.ClientHandler(conn, addr, private_key, public_key_bytes).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return listener
+
+
+class ChaosProxy:
+    """转发 TCP 流量，并随机掐断当前所有连接"""
+
+    def __init__(self, target_port):
+        self.target_port = target_port
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(16)
+        self.port = self.listener.getsockname()[1]
+        self.pairs = []
+        self.lock = threading.Lock()
+        self.kills = 0
+        self.chaos = True
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        threading.Thread(target=self._killer, daemon=True).start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                client, _ = self.listener.accept()
+            except OSError:
+                return
+            upstream = socket.create_connection(('127.0.0.1', self.target_port))
+            with self.lock:
+                self.pairs.append((client, upstream))
+            threading.Thread(target=self._pipe, args=(client, upstream), daemon=True).start()
+            threading.Thread(target=self._pipe, args=(upstream, client), daemon=True).start()
+
+    @staticmethod
+    def _pipe(src, dst):
+        try:
+            while True:
+                data = src.recv(4096)
+                if not data: break
+                dst.sendall(data)
+        except OSError:
+            pass
+        for s in (src, dst):
+            try:
+                s.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _killer(self):
+        while True:
+            time.sleep(random.uniform(0.05, 0.4))
+            if not self.chaos: continue
+            with self.lock:
+                pairs, self.pairs = self.pairs, []
+            for pair in pairs:
+                for s in pair:
+                    try:
+                        s.shutdown(socket.SHUT_RDWR)
+                        s.close()
+                    except OSError:
+                        pass
+            if pairs: self.kills += 1
+
+    def close(self):
+        self.chaos = False
+        self.listener.close()
+
+
+def wait_until(predicate, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate(): return True
+        time.sleep(0.05)
+    return predicate()
+
+
+def test_no_words_lost_when_connection_is_killed():
+    random.seed(7)
+    tmp_dir = tempfile.mkdtemp()
+    db = DatabaseManager(f"sqlite:///{os.path.join(tmp_dir, 'sync.db')}")
+    db.init_db()
+    session = db.get_session()
+    session.add(User(username="chaos_writer", password_hash="pwd_hash"))
+    session.commit()
+    session.close()
+
+    original_db = server_main.db_manager
+    listener = start_local_server(db)
+    proxy = ChaosProxy(listener.getsockname()[1])
+
+    net = NetworkManager(host='127.0.0.1', port=proxy.port,
+                         queue_path=os.path.join(tmp_dir, "sync_queue.json"),
+                         backoff_base=0.02, backoff_max=0.2)
+    net.login_payload = {"type": "login", "username": "chaos_writer", "password": "pwd_hash"}
+    net.start()  # 未连接时，网络线程直接进入重连流程
+    assert wait_until(lambda: net.logged_in, 10)
+
+    expected = 0
+    today = date.today().isoformat()
+    for _ in range(300):
+        inc = random.randint(1, 50)
+        expected += inc
+        net.queue_sync(increment=inc, duration=0, timestamp=time.time(), local_date=today)
+        time.sleep(random.uniform(0, 0.01))
+
+    # 停止捣乱，等待队列清空
+    proxy.chaos = False
+    assert wait_until(lambda: net.sync_queue.pending_count() == 0, 30), net.sync_queue.pending_count()
+    net.close()
+    net.wait(2000)
+    proxy.close()
+    listener.close()
+    server_main.db_manager = original_db
+
+    session = db.get_session()
+    try:
+        user = session.query(User).filter_by(username="chaos_writer").first()
+        daily = session.query(DailyReport).filter_by(user_id=user.id).first()
+        print(f"[Chaos] kills={proxy.kills} expected={expected} stored={daily.total_words}")
+        assert proxy.kills > 0
+        # 服务器按 (设备, seq) 去重，重发不会重复计数
+        assert daily.total_words == expected
+    finally:
+        session.close()
+
+
+def test_queue_survives_restart():
+    path = os.path.join(tempfile.mkdtemp(), "sync_queue.json")
+    q = SyncQueue(path)
+    for inc in (5, 7, 11):
+        q.push("writer", inc, 0, time.time(), "2024-05-01")
+    q.push("writer", 3, 0, time.time(), "2024-05-02")
+    q.push("other", 100, 0, time.time(), "2024-05-01")
+
+    # 未发出的同日增量合并发送
+    sent = q.take("writer")
+    assert [(r["seq"], r["increment"]) for r in sent] == [(3, 23), (4, 3)]
+    assert q.take("writer") == []
+    q.ack("writer", 3)
+    device_id = q.device_id
+
+    # 重启后设备号不变，未确认的增量仍在，且只能原样重发
+    q = SyncQueue(path)
+    assert q.device_id == device_id
+    assert q.pending_count() == 2
+    assert q.take("writer") == []
+    assert [(r["seq"], r["increment"]) for r in q.take("writer", resend=True)] == [(4, 3)]
+    assert q.take("other", resend=True)[0]["increment"] == 100
+    assert q.push("writer", 1, 0, time.time(), "2024-05-02") == 6
+
+
+class RacingLock:
+    """进入锁之前先在另一个线程里执行 race，模拟界面线程恰好在这一刻入队新增量"""
+
+    def __init__(self, race):
+        self.lock = threading.Lock()
+        self.race = race
+
+    def __enter__(self):
+        race, self.race = self.race, None
+        if race:
+            t = threading.Thread(target=race)
+            t.start()
+            t.join(0.5)
+        self.lock.acquire()
+
+    def __exit__(self, *exc):
+        self.lock.release()
+
+
+def test_relogin_resends_unacked_before_new_deltas():
+    net = NetworkManager(queue_path=os.path.join(tempfile.mkdtemp(), "sync_queue.json"))
+    sent = []
+    net.send_request = lambda request: sent.append([d["seq"] for d in request["deltas"]]) or True
+    today = date.today().isoformat()
+
+    # 断线前发出但未确认的 seq 1、2
+    net.connected, net.logged_in, net.username = True, True, "writer"
+    for inc in (5, 7):
+        net.queue_sync(increment=inc, duration=0, timestamp=time.time(), local_date=today)
+    assert sent == [[1], [2]]
+    net._drop_connection()
+    sent.clear()
+
+    # 重新登录时，界面线程在补发之前入队 seq 3
+    net.connected = True
+    net.flush_lock = RacingLock(
+        lambda: net.queue_sync(increment=11, duration=0, timestamp=time.time(), local_date=today))
+    net.relogin_pending = True
+    net._handle_response({"type": "login_response", "status": "success", "username": "writer"})
+    net.timeout_timer.stop()
+
+    flat = [seq for batch in sent for seq in batch]
+    assert flat == [1, 2, 3], sent
+    assert net.logged_in
+
+
+def test_replayed_deltas_are_dropped():
+    tmp_dir = tempfile.mkdtemp()
+    db = DatabaseManager(f"sqlite:///{os.path.join(tmp_dir, 'dedupe.db')}")
+    db.init_db()
+    session = db.get_session()
+    user = User(username="replay_writer", password_hash="pwd_hash")
+    session.add(user)
+    session.commit()
+    user_id = user.id
+    session.close()
+
+    original_db = server_main.db_manager
+    server_main.db_manager = db
+    try:
+        handler = server_main.ClientHandler(None, None, None, None)
+        handler.user_id = user_id
+
+        def delta(seq, inc, day="2024-05-01"):
+            return {"seq": seq, "increment": inc, "duration": 0, "timestamp": time.time(), "local_date": day}
+
+        # 一帧上传多条，跨日期
+        ack = handler.handle_sync_data({"type": "sync_data", "device_id": "dev-a",
+                                        "deltas": [delta(1, 10), delta(2, 20), delta(3, 30, "2024-05-02")]})
+        assert (ack["seq"], ack["applied"], ack["duplicates"]) == (3, 3, 0)
+
+        # 超时重发 + 新增量，乱序到达
+        ack = handler.handle_sync_data({"type": "sync_data", "device_id": "dev-a",
+                                        "deltas": [delta(5, 50), delta(2, 20), delta(3, 30, "2024-05-02")]})
+        assert (ack["seq"], ack["applied"], ack["duplicates"]) == (5, 1, 2)
+
+        # 另一台设备有独立的序号
+        ack = handler.handle_sync_data({"type": "sync_data", "device_id": "dev-b", "deltas": [delta(1, 7)]})
+        assert (ack["seq"], ack["applied"]) == (1, 1)
+
+        # 旧版客户端：不带设备号的单条增量
+        ack = handler.handle_sync_data({"type": "sync_data", "increment": 4, "duration": 0,
+                                        "local_date": "2024-05-01"})
+        assert ack["applied"] == 1
+
+        # 服务器重启后从表中恢复高水位
+        server_main.device_high_water.clear()
+        ack = handler.handle_sync_data({"type": "sync_data", "device_id": "dev-a", "deltas": [delta(5, 50)]})
+        assert (ack["seq"], ack["applied"], ack["duplicates"]) == (5, 0, 1)
+
+        session = db.get_session()
+        try:
+            totals = {d.report_date.isoformat(): d.total_words
+                      for d in session.query(DailyReport).filter_by(user_id=user_id)}
+            assert totals == {"2024-05-01": 10 + 20 + 50 + 7 + 4, "2024-05-02": 30}
+            assert session.query(DetailRecord).filter_by(user_id=user_id).count() == 6
+            assert session.query(SyncDevice).filter_by(user_id=user_id, device_id="dev-a").one().last_seq == 5
+        finally:
+            session.close()
+    finally:
+        server_main.db_manager = original_db
@@ -0,0 +1,110 @@
+# server/test_user_search.py
+# 用户搜索：前缀/子串/模糊匹配按相关度排序并分页，注册与改昵称后立即可搜；大规模用户下单次查询在毫秒级
+import os
+import random
+import tempfile
+import time
+import types
+
+import main as server_main
+from database import DatabaseManager
+from user_index import UserIndex
+
+
+def make_handler(user_id=None):
+    handler = server_main.ClientHandler(None, None, None, None)
+    handler.user_id = user_id
+    return handler
+
+
+def names(response):
+    return [u["username"] for u in response["data"]]
+
+
+def test_search_ranks_pages_and_stays_in_sync():
+    db = DatabaseManager(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'search.db')}")
+    db.init_db()
+    original_db = server_main.db_manager
+    server_main.db_manager = db
+    try:
+        guest = make_handler()
+        for username in ("john", "johnny", "ajohnson", "jonas", "mary", "maryjohn", "小明同学"):
+            assert guest.handle_register({"username": username, "password": "x"})["status"] == "success"
+        # 索引在第一次搜索时建立，之后的注册直接同步进去
+        assert names(guest.handle_search_user({"query": "mary"})) == ["mary", "maryjohn"]
+        assert guest.handle_register({"username": "johanna", "password": "x"})["status"] == "success"
+
+        # 前缀 (完全相同的最前) > 子串 (位置越靠前越前) > 模糊
+        assert names(guest.handle_search_user({"query": "JOHN"})) == ["john", "johnny", "ajohnson", "maryjohn", "johanna"]
+        assert names(guest.handle_search_user({"query": "jhon"})) == ["john", "johnny"]  # 字母对调
+        assert names(guest.handle_search_user({"query": "j"})) == ["johanna", "john", "johnny", "jonas"]
+        assert names(guest.handle_search_user({"query": "明同"})) == ["小明同学"]
+
+        # 按 offset 分页，各页拼起来与一次取完一致
+        everything = names(guest.handle_search_user({"query": "jo", "limit": 50}))
+        first = guest.handle_search_user({"query": "jo", "limit": 2})
+        second = guest.handle_search_user({"query": "jo", "limit": 2, "offset": 2})
+        assert first["has_more"] and names(first) + names(second) == everything[:4]
+
+        # ID 精确匹配排在最前
+        mary_id = guest.handle_search_user({"query": "mary"})["data"][0]["id"]
+        assert guest.handle_search_user({"query": str(mary_id)})["data"][0]["username"] == "mary"
+
+        # 改昵称后旧昵称搜不到，新昵称能搜到
+        mary = make_handler(mary_id)
+        mary.handle_update_profile({"nickname": "Stargazer"})
+        assert names(guest.handle_search_user({"query": "gazer"})) == ["mary"]
+        mary.handle_update_profile({"nickname": "Moonlight"})
+        assert guest.handle_search_user({"query": "gazer"})["status"] == "fail"
+        assert guest.handle_search_user({"query": "   "})["data"] == []
+    finally:
+        server_main.db_manager = original_db
+
+
+def test_rename_keeps_postings_exact():
+    """改名 A -> B -> A 后，倒排表与按当前名称重建的索引一致 (旧三元组摘掉，不重复追加)"""
+    db = types.SimpleNamespace(key="rename")
+    rows = [(1, "alice", "Wonder"), (2, "bob", None)]
+    index = UserIndex()
+    index.build(db.key, rows)
+    index.put(db, 1, "alice", "Stargazer")
+    index.put(db, 1, "alice", "Wonder")
+    index.put(db, 2, "bob", "Builder")
+
+    fresh = UserIndex()
+    fresh.build(db.key, [(1, "alice", "Wonder"), (2, "bob", "Builder")])
+    assert {g: sorted(p) for g, p in index.grams.items()} == {g: sorted(p) for g, p in fresh.grams.items()}
+    assert index.gram_keys == fresh.gram_keys and index.sorted_keys == fresh.sorted_keys
+    assert [uid for uid, _, _ in index.search("gazer")[0]] == []
+
+
+def synthetic_users(n, seed=7):
+    rnd = random.Random(seed)
+    syllables = [c + v for c in "bcdfghjklmnprstvwyz" for v in "aeiou"] + ["ng", "er", "an", "en", "in", "on"]
+    hanzi = "明红华文书墨云月星雪风山海林若青白子一心安宁远舟言秋春夏冬雨晴天川语清溪梦知乐阳光花叶"
+    word = lambda lo, hi: "".join(rnd.choice(syllables) for _ in range(rnd.randint(lo, hi)))
+    for uid in range(1, n + 1):
+        username = f"{word(2, 4)}{rnd.randint(0, 9999) if uid % 2 else ''}_{uid}"
+        if uid % 3 == 0:
+            nickname = "".join(rnd.choice(hanzi) for _ in range(rnd.randint(2, 4)))
+        else:
+            nickname = word(2, 3).capitalize()
+        yield uid, username, nickname
+
+
+def test_search_benchmark():
+    """默认 10 万用户；设 INK_SEARCH_BENCH_USERS=1000000 可跑百万规模"""
+    n = int(os.environ.get("INK_SEARCH_BENCH_USERS", 100000))
+    index = UserIndex()
+    start = time.perf_counter()
+    index.build("bench", synthetic_users(n))
+    print(f"[User Search] {n} users indexed in {time.perf_counter() - start:.1f}s")
+
+    for kind, query in (("prefix", "ka"), ("prefix", "kamiro"), ("substring", "miro"), ("chinese", "书墨"),
+                        ("fuzzy", "karimo"), ("id", "12345")):
+        start = time.perf_counter()
+        for _ in range(20):
+            results, _ = index.search(query)
+        elapsed = (time.perf_counter() - start) / 20 * 1000
+        print(f"[User Search] {kind:9s} {query!r}: {elapsed:.2f} ms, {len(results)} results")
+        assert results and elapsed < 100
@@ -0,0 +1,122 @@
+# server/test_versioned_reads.py
+# 只读结果带版本号：版本未变只回 not_modified，相关写入后版本变化，同版本结果由缓存直接返回
+import os
+import tempfile
+from datetime import date
+
+from PyQt6.QtCore import QCoreApplication
+from sqlalchemy import event
+
+import main as server_main
+from database import DatabaseManager, User
+from client.core.network import NetworkManager
+from test_sync_reconnect import start_local_server, wait_until
+
+
+def setup_db(name, n_users):
+    db = DatabaseManager(f"sqlite:///{os.path.join(tempfile.mkdtemp(), name)}")
+    db.init_db()
+    session = db.get_session()
+    users = [User(username=f"{name}_{i}", password_hash="pwd_hash", nickname=f"V{i}") for i in range(n_users)]
+    session.add_all(users)
+    session.commit()
+    ids = [u.id for u in users]
+    session.close()
+    return db, ids
+
+
+def make_handler(user_id):
+    handler = server_main.ClientHandler(None, None, None, None)
+    handler.user_id = user_id
+    handler.username = handler.nickname = str(user_id)
+    return handler
+
+
+def count_statements(db, call):
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.read_engine, "before_cursor_execute", listener)
+    try:
+        return call(), len(statements)
+    finally:
+        event.remove(db.read_engine, "before_cursor_execute", listener)
+
+
+def test_versions_change_only_with_related_writes():
+    db, (me, friend, stranger) = setup_db("versions.db", 3)
+    original_db = server_main.db_manager
+    server_main.db_manager = db
+    server_main.room_registry.load(db)
+    try:
+        alice, bob, carol = make_handler(me), make_handler(friend), make_handler(stranger)
+
+        first = alice.handle_get_friends({})
+        assert first["data"] == [] and first["version"]
+        assert alice.handle_get_friends({"version": first["version"]})["status"] == "not_modified"
+
+        # 第二个会话同版本的请求直接走缓存，不查库
+        cached, n = count_statements(db, lambda: alice.handle_get_friends({}))
+        assert n == 0 and cached == first and cached is not first
+
+        # 无关用户的写入不影响版本
+        carol.handle_update_profile({"nickname": "Carol"})
+        assert alice.handle_get_friends({"version": first["version"]})["status"] == "not_modified"
+
+        # 好友请求与接受分别让请求列表、好友列表换版本
+        requests_v = alice.handle_get_friend_requests({})["version"]
+        bob.handle_add_friend({"friend_id": me})
+        pending = alice.handle_get_friend_requests({"version": requests_v})
+        assert len(pending["data"]) == 1
+        alice.handle_respond_friend({"request_id": pending["data"][0]["request_id"], "action": "accept"})
+        friends = alice.handle_get_friends({"version": first["version"]})
+        assert [f["nickname"] for f in friends["data"]] == ["V1"]
+
+        # 好友改昵称也会让好友列表换版本
+        bob.handle_update_profile({"nickname": "Bobby"})
+        renamed = alice.handle_get_friends({"version": friends["version"]})
+        assert [f["nickname"] for f in renamed["data"]] == ["Bobby"]
+
+        # 字数同步后统计结果换版本
+        analytics = alice.handle_get_analytics({})
+        assert alice.handle_get_analytics({"version": analytics["version"]})["status"] == "not_modified"
+        today = str(date.today())
+        alice.handle_sync_data({"type": "sync_data", "device_id": "v", "deltas": [
+            {"seq": 1, "increment": 42, "duration": 0, "local_date": today}]})
+        assert alice.handle_get_analytics({"version": analytics["version"]})["heatmap"] == {today: 42}
+
+        # 房间变化让大厅换版本
+        lobby = carol.handle_get_lobby_data({})
+        assert carol.handle_get_lobby_data({"version": lobby["version"]})["status"] == "not_modified"
+        bob.handle_create_group({"name": "Versioned"})
+        assert [g["name"] for g in carol.handle_get_lobby_data({"version": lobby["version"]})["data"]] == ["Versioned"]
+    finally:
+        server_main.db_manager = original_db
+
+
+def test_client_reuses_result_on_not_modified():
+    app = QCoreApplication.instance() or QCoreApplication([])
+    db, _ = setup_db("etag.db", 1)
+    original_db = server_main.db_manager
+    listener = start_local_server(db)
+    net = NetworkManager(host='127.0.0.1', port=listener.getsockname()[1])
+    try:
+        assert net.connect_and_handshake()
+        net.start()
+        assert net.request({"type": "login", "username": "etag.db_0", "password": "pwd_hash"}).result(5)["status"] == "success"
+        assert wait_until(lambda: net.logged_in, 5)
+
+        sent = []
+        real_send = net.send_request
+        net.send_request = lambda data: sent.append(data) or real_send(data)
+
+        first = net.request({"type": "get_public_groups"}).result(5)
+        second = net.request({"type": "get_public_groups"}).result(5)
+        assert "version" not in sent[0] and sent[1]["version"] == first["version"]
+        # 线上只回了 not_modified，调用方仍拿到完整结果
+        assert second["type"] == "group_list_response"
+        assert second["data"] == first["data"] and second["req_id"] != first["req_id"]
+    finally:
+        net.close()
+        net.wait(2000)
+        listener.close()
+        server_main.db_manager = original_db
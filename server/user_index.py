@@ -0,0 +1,250 @@
+import bisect
+import threading
+from array import array
+from collections import Counter
+from heapq import nlargest, nsmallest
+from itertools import islice
+
+from database import User
+
+# 用户搜索：默认每页条数与上限
+USER_SEARCH_PAGE_SIZE = 20
+USER_SEARCH_PAGE_MAX = 50
+# 模糊匹配时跳过过于常见的三元组 (倒排表长度超过此值)，并限制参与编辑距离计算的候选数，
+# 避免一次查询扫过大半用户
+FUZZY_POSTING_MAX = 20000
+FUZZY_CANDIDATE_MAX = 500
+# 两个字的子串查询要合并多个倒排表，候选数的上限
+SUBSTRING_CANDIDATE_MAX = 50000
+
+_BEGIN, _END = "\x02", "\x03"
+
+
+def _grams(text):
+    """带首尾标记的三元组：'ab' -> {'\\x02ab', 'ab\\x03'}"""
+    text = f"{_BEGIN}{text}{_END}"
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _distance_to(pattern):
+    """
+    返回 f(text) -> pattern 与 text 的编辑距离，相邻字母对调算一次 (Hyyrö 位并行算法，受限 Damerau 距离)
+    每个字符只做常数次整数位运算，比逐格动态规划快一个数量级
+    """
+    m = len(pattern)
+    mask, last = (1 << m) - 1, 1 << (m - 1)
+    peq = {}
+    for i, ch in enumerate(pattern):
+        peq[ch] = peq.get(ch, 0) | (1 << i)
+
+    def distance(text):
+        vp, vn, d0, prev_eq, score = mask, 0, 0, 0, m
+        for ch in text:
+            eq = peq.get(ch, 0)
+            tc = (((~d0) & eq) << 1) & prev_eq & mask
+            x = eq | vn
+            d0 = ((((x & vp) + vp) & mask) ^ vp) | x | tc
+            hn = vp & d0
+            hp = (vn | ~(vp | d0)) & mask
+            if hp & last:
+                score += 1
+            elif hn & last:
+                score -= 1
+            x = ((hp << 1) | 1) & mask
+            vn = x & d0
+            vp = ((hn << 1) | ~(x | d0)) & mask
+            prev_eq = eq
+        return score
+
+    return distance
+
+
+class UserIndex:
+    """
+    用户名/昵称的内存搜索索引 (不区分大小写)
+
+    - 前缀：按名称排序的表上二分，单个字符的查询也能用；
+    - 子串：查询词的三元组中取倒排表最短的两个求交集作候选，再校验子串 (两个字的查询合并以它开头的三元组)；
+    - 模糊：只在少见三元组的倒排表里找候选，再算编辑距离 (整个名称或同长度的前缀)，容忍 1~2 个错字 (含相邻字母对调)。
+    结果按 ID 精确匹配 > 前缀 > 子串 > 模糊 排序，同一档内越靠前、越短越靠前。
+
+    注册与修改昵称时调用 put() 同步：新名称的三元组加入倒排表，旧名称独有的三元组摘掉该用户。
+    索引属于某个数据库 (db_key 即 DatabaseManager.key)，切换数据库后首次搜索时重建。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.db_key = None
+        self.users = {}  # user_id -> (username, nickname)
+        self.sorted_keys = []  # "小写名称\x00user_id"，升序
+        self.grams = {}  # 三元组 -> array('i') of user_id
+        self.gram_keys = []  # 三元组升序 (两个字的子串查询按前缀找三元组)
+
+    @staticmethod
+    def _names(username, nickname):
+        names = {(username or "").lower()}
+        if nickname: names.add(nickname.lower())
+        names.discard("")
+        return names
+
+    def build(self, db_key, rows):
+        """rows: 可迭代的 (user_id, username, nickname)"""
+        users, keys, grams = {}, [], {}
+        for uid, username, nickname in rows:
+            users[uid] = (username, nickname)
+            for name in self._names(username, nickname):
+                keys.append(f"{name}\x00{uid}")
+                for gram in _grams(name):
+                    postings = grams.get(gram)
+                    if postings is None:
+                        postings = grams[gram] = array('i')
+                    postings.append(uid)
+        keys.sort()
+        gram_keys = sorted(grams)
+        with self.lock:
+            self.db_key, self.users, self.sorted_keys, self.grams = db_key, users, keys, grams
+            self.gram_keys = gram_keys
+
+    def load(self, db):
+        session = db.get_read_session()
+        try:
+            rows = session.query(User.id, User.username, User.nickname).order_by(User.id).all()
+        finally:
+            session.close()
+        self.build(db.key, rows)
+
+    def ensure(self, db):
+        if self.db_key != db.key:
+            self.load(db)
+
+    def put(self, db, user_id, username, nickname):
+        """注册或修改昵称后同步；索引尚未为该数据库建立时忽略 (建立时会从库里读到)"""
+        if self.db_key != db.key: return
+        with self.lock:
+            old = self.users.get(user_id)
+            old_names = self._names(*old) if old else set()
+            new_names = self._names(username, nickname)
+            for name in old_names - new_names:
+                key = f"{name}\x00{user_id}"
+                i = bisect.bisect_left(self.sorted_keys, key)
+                if i < len(self.sorted_keys) and self.sorted_keys[i] == key:
+                    del self.sorted_keys[i]
+            for name in new_names - old_names:
+                bisect.insort(self.sorted_keys, f"{name}\x00{user_id}")
+            old_grams = set().union(*map(_grams, old_names))
+            new_grams = set().union(*map(_grams, new_names))
+            # 旧名称独有的三元组摘掉该用户，倒排表空了连同三元组一起删
+            for gram in old_grams - new_grams:
+                postings = self.grams.get(gram)
+                if postings is None or user_id not in postings: continue
+                postings.remove(user_id)
+                if not postings:
+                    del self.grams[gram]
+                    del self.gram_keys[bisect.bisect_left(self.gram_keys, gram)]
+            for gram in new_grams - old_grams:
+                if gram not in self.grams:
+                    self.grams[gram] = array('i')
+                    bisect.insort(self.gram_keys, gram)
+                self.grams[gram].append(user_id)
+            self.users[user_id] = (username, nickname)
+
+    def _prefix(self, query):
+        i = bisect.bisect_left(self.sorted_keys, query)
+        while i < len(self.sorted_keys) and self.sorted_keys[i].startswith(query):
+            yield int(self.sorted_keys[i].rsplit("\x00", 1)[1])
+            i += 1
+
+    def _candidates_of_pair(self, query):
+        """两个字的查询：名称中每处出现都是某个以它开头的三元组 (含结尾标记)，合并这些倒排表"""
+        candidates = set()
+        i = bisect.bisect_left(self.gram_keys, query)
+        while i < len(self.gram_keys) and self.gram_keys[i].startswith(query):
+            candidates.update(self.grams[self.gram_keys[i]])
+            if len(candidates) > SUBSTRING_CANDIDATE_MAX: break
+            i += 1
+        return candidates
+
+    def _substring(self, query, seen, count):
+        if len(query) == 2:
+            candidates = self._candidates_of_pair(query)
+        else:
+            postings = [self.grams.get(g) for g in _grams(query)
+                        if _BEGIN not in g and _END not in g]
+            if not all(postings): return []
+            # 最短的两个倒排表求交集作候选，再校验子串
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            if len(postings) > 1: candidates.intersection_update(postings[1])
+        scored = []
+        for uid in candidates:
+            if uid in seen: continue
+            positions = [(name.find(query), len(name)) for name in self._names(*self.users[uid])]
+            positions = [p for p in positions if p[0] >= 0]
+            if positions:
+                scored.append((min(positions), uid))
+        return [uid for _, uid in nsmallest(count, scored)]
+
+    def _fuzzy(self, query, seen, count):
+        """
+        编辑距离不超过 k 的名称 (整个名称或与查询等长的前缀)
+        距离 k 以内的两个串至少共享 n - 3k 个三元组 (n 为查询的三元组数，比较前缀时再少一个结尾三元组)，
+        先按共享三元组数筛掉大部分候选，剩下的再算编辑距离；过长的倒排表不统计，下限相应放宽。
+        短名称里相邻字母对调可能一个三元组都不剩，所以另把对调后的查询词按前缀查一遍作候选。
+        """
+        k = 1 if len(query) <= 7 else 2
+        query_grams = _grams(query)
+        counts, skipped = Counter(), 0
+        for gram in query_grams:
+            postings = self.grams.get(gram, ())
+            if len(postings) > FUZZY_POSTING_MAX:
+                skipped += 1
+            elif postings:
+                counts.update(postings)
+        need = max(1, len(query_grams) - 3 * k - 1 - skipped)
+        candidates = [uid for uid, shared in counts.items() if shared >= need and uid not in seen]
+        if len(candidates) > FUZZY_CANDIDATE_MAX:
+            candidates = nlargest(FUZZY_CANDIDATE_MAX, candidates, key=lambda uid: (counts[uid], -uid))
+        candidates = set(candidates)
+        for i in range(len(query) - 1):
+            swapped = query[:i] + query[i + 1] + query[i] + query[i + 2:]
+            candidates.update(uid for uid in islice(self._prefix(swapped), FUZZY_CANDIDATE_MAX) if uid not in seen)
+
+        distance = _distance_to(query)
+        scored = []
+        for uid in candidates:
+            best = None
+            for name in self._names(*self.users[uid]):
+                for exact, target in ((0, name), (1, name[:len(query)])):
+                    if abs(len(target) - len(query)) > k: continue
+                    d = distance(target)
+                    if d <= k and (best is None or (d, exact, len(name)) < best):
+                        best = (d, exact, len(name))
+            if best:
+                scored.append((best, uid))
+        return [uid for _, uid in nsmallest(count, scored)]
+
+    def search(self, query, offset=0, limit=USER_SEARCH_PAGE_SIZE):
+        """返回 ([(user_id, username, nickname)], 是否还有更多)"""
+        raw = (query or "").strip()
+        query = raw.lower()
+        if not query: return [], False
+        needed = offset + limit + 1
+        with self.lock:
+            found, seen = [], set()
+
+            def take(uids):
+                for uid in uids:
+                    if uid not in seen and uid in self.users:
+                        seen.add(uid)
+                        found.append(uid)
+                        if len(found) >= needed: return True
+                return False
+
+            done = raw.isdigit() and take([int(raw)])
+            done = done or take(self._prefix(query))
+            if not done and len(query) >= 2:
+                done = take(self._substring(query, seen, needed - len(found)))
+            if not done and len(query) >= 3:
+                take(self._fuzzy(query, seen, needed - len(found)))
+            page = [(uid,) + self.users[uid] for uid in found[offset:offset + limit]]
+            return page, len(found) > offset + limit
@@ -0,0 +1,37 @@
+# shared/heatmap_codec.py
+import base64
+import zlib
+
+
+class HeatmapCodec:
+    """
+    热力图的紧凑编码：从起始日开始每天一个整数
+    zigzag (字数可能为负) -> varint (LEB128) -> zlib -> base85 (JSON 安全的文本)
+    相比 {"YYYY-MM-DD": n} 字典，一年的数据小 5-7 倍 (日期键省掉了，没写字的天压缩后几乎不占空间)
+    """
+
+    ENCODING = "varint-zlib-b85"
+
+    @staticmethod
+    def encode(counts):
+        out = bytearray()
+        for n in counts:
+            n = (n << 1) ^ (n >> 63)  # zigzag：0, -1, 1, -2 ... -> 0, 1, 2, 3 ...
+            while n >= 0x80:
+                out.append((n & 0x7F) | 0x80)
+                n >>= 7
+            out.append(n)
+        return base64.b85encode(zlib.compress(bytes(out), 9)).decode('ascii')
+
+    @staticmethod
+    def decode(text):
+        raw = zlib.decompress(base64.b85decode(text))
+        counts, n, shift = [], 0, 0
+        for byte in raw:
+            n |= (byte & 0x7F) << shift
+            if byte & 0x80:
+                shift += 7
+                continue
+            counts.append((n >> 1) ^ -(n & 1))
+            n, shift = 0, 0
+        return counts
@@ -0,0 +1,16 @@
+# shared/room_rules.py
+# 服务器与客户端共用的房间规则：大厅筛选、增量推送的卡片过滤都以这里为准，两边结果一致
+
+# 房间人数上限
+MAX_MEMBERS = 10
+
+
+def name_matches(name, query):
+    """
+    房间名搜索 (不区分大小写)：单个字符按前缀匹配，两个字符以上按子串匹配
+    空查询匹配所有房间
+    """
+    query = (query or "").strip().lower()
+    if not query: return True
+    name = (name or "").lower()
+    return name.startswith(query) if len(query) == 1 else query in name